@@ -0,0 +1,359 @@
+# client/async_client_sdk.py
+import asyncio
+import logging
+import os
+import sys
+
+import aiohttp
+import grpc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'generated'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import generated.dfs_pb2 as dfs_pb2
+import generated.dfs_pb2_grpc as dfs_pb2_grpc
+from common import config
+from common.container_format import RECORD_HEADER, pack_record, unpack_record
+from common.block_codec import BlockDecoder, FrameTable, decode_block, encode_block, header_length
+from common.grpc_pool import channel_options
+from client_sdk import CHUNK_SIZE_CLIENT_GRPC, _pread, _pwrite, _interleave_by_primary, packed_cache_key
+from disk_block_cache import DiskBlockCache
+from replica_selector import ReplicaLatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDFSClient:
+    """Cliente DFS sobre asyncio: NameNode por una sesión aiohttp y DataNodes por streams grpc.aio.
+
+    Miles de transferencias comparten un solo bucle de eventos. Dos semáforos dan backpressure:
+    `max_transfers` acota los archivos en curso y `max_block_streams` los streams de bloque simultáneos
+    (y con ello la memoria: como mucho un bloque en vuelo por stream de subida).
+
+        async with AsyncDFSClient(url) as client:
+            await asyncio.gather(*(client.put(p, f"/ingest/{os.path.basename(p)}") for p in paths))
+    """
+
+    def __init__(self, namenode_url, max_transfers=None, max_block_streams=None, block_cache_dir=None, block_cache_bytes=None,
+                 codec=None, codec_level=None):
+        self.namenode_url = namenode_url
+        self.current_path = "/"
+        self.replica_latency = ReplicaLatencyTracker()
+        self._transfer_slots = asyncio.Semaphore(max_transfers or config.CLIENT_ASYNC_MAX_TRANSFERS)
+        self._block_slots = asyncio.Semaphore(max_block_streams or config.CLIENT_ASYNC_MAX_BLOCK_STREAMS)
+        self._session = None
+        self._channels = {} # dirección gRPC -> (canal aio, stub)
+        block_cache_dir = block_cache_dir or config.CLIENT_BLOCK_CACHE_DIR
+        self.block_cache = DiskBlockCache(block_cache_dir, block_cache_bytes or config.CLIENT_BLOCK_CACHE_BYTES) if block_cache_dir else None
+        self.codec = codec or config.CLIENT_BLOCK_CODEC
+        self.codec_level = config.CLIENT_BLOCK_CODEC_LEVEL if codec_level is None else codec_level
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        channels, self._channels = self._channels, {}
+        await asyncio.gather(*(channel.close() for channel, _ in channels.values()), return_exceptions=True)
+
+    def _stub(self, address): # Un canal por DataNode, multiplexado por HTTP/2 entre todos los streams
+        entry = self._channels.get(address)
+        if entry is None:
+            channel = grpc.aio.insecure_channel(address, options=channel_options())
+            entry = self._channels[address] = (channel, dfs_pb2_grpc.DataNodeServiceStub(channel))
+        return entry[1]
+
+    async def _make_namenode_request(self, method, endpoint, params=None, json_data=None): # Canal de Control REST [cite: 18]
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        url = f"{self.namenode_url}{endpoint}"
+        try:
+            if method.upper() == 'GET': request = self._session.get(url, params=params)
+            elif method.upper() == 'POST': request = self._session.post(url, json=json_data)
+            else: raise ValueError(f"Método HTTP no soportado: {method}")
+            async with request as response:
+                if response.status >= 400:
+                    text = await response.text()
+                    logger.error(f"Error HTTP para {url}: {response.status} - {text}")
+                    try: return await response.json(content_type=None)
+                    except ValueError: return {"error": text}
+                return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Fallo de petición para {url}: {e}")
+            return {"error": str(e) or type(e).__name__}
+
+    def _resolve_path(self, path):
+        if path.startswith('/'): return path
+        return os.path.normpath(os.path.join(self.current_path, path))
+
+    async def mkdir(self, dir_path): return await self._make_namenode_request('POST', '/mkdir', json_data={'path': self._resolve_path(dir_path)})
+    async def ls(self, path="."): return await self._make_namenode_request('GET', '/ls', params={'path': self._resolve_path(path)})
+    async def rmdir(self, dir_path): return await self._make_namenode_request('POST', '/rmdir', json_data={'path': self._resolve_path(dir_path)})
+    async def rm(self, item_path, recursive=False):
+        return await self._make_namenode_request('POST', '/rm', json_data={'path': self._resolve_path(item_path), 'recursive': recursive})
+
+    async def _write_block_to_datanode(self, block_data, block_id, file_id, primary_dn_addr, secondary_dn_addr, packed_offset=None, codec=None): # Canal de Datos gRPC [cite: 18]
+        async def generate_reqs():
+            yield dfs_pb2.WriteBlockRequest(block_info=dfs_pb2.BlockInfo(block_id=block_id, file_id=str(file_id), secondary_datanode_grpc_address=secondary_dn_addr or "",
+                                                                         packed=packed_offset is not None, packed_offset=packed_offset or 0))
+            stored = block_data
+            if codec: # Con el stream ya abierto y fuera del bucle de eventos: comprimir es CPU
+                stored = await asyncio.get_running_loop().run_in_executor(None, encode_block, block_data, codec)
+            view = memoryview(stored)
+            for offset in range(0, len(view), CHUNK_SIZE_CLIENT_GRPC):
+                yield dfs_pb2.WriteBlockRequest(chunk_data=bytes(view[offset : offset + CHUNK_SIZE_CLIENT_GRPC]))
+        try:
+            response = await self._stub(primary_dn_addr).WriteBlock(generate_reqs(), timeout=30)
+            return response.success, response.message, response.under_replicated
+        except grpc.aio.AioRpcError as e:
+            logger.error(f"Error gRPC escribiendo bloque {block_id} a {primary_dn_addr}: {e.details()}")
+            return False, e.details() or str(e.code()), False
+
+    async def put(self, local_file_path, dfs_file_path): # [cite: 28]
+        abs_dfs_path = self._resolve_path(dfs_file_path)
+        if not os.path.isfile(local_file_path):
+            return {"error": f"Archivo local {local_file_path} no encontrado o no es un archivo."}
+        async with self._transfer_slots:
+            total_size = os.path.getsize(local_file_path)
+            init_resp = await self._make_namenode_request('POST', '/put/initiate', json_data={'path': abs_dfs_path, 'size': total_size,
+                                                                                              'codec': self.codec, 'codec_level': self.codec_level}) # [cite: 26]
+            if 'error' in init_resp or not init_resp.get('data'): return init_resp
+
+            file_id = init_resp['data']['file_id']
+            block_size = init_resp['data'].get('block_size', config.BLOCK_SIZE_BYTES)
+            codec = init_resp['data'].get('codec') # El códec negociado, no necesariamente el pedido
+            loop = asyncio.get_running_loop()
+            unconfirmed = [] # Escritos solo en el primario: el NameNode los re-replica
+            with open(local_file_path, 'rb') as f:
+                async def upload_block(index, assign):
+                    async with self._block_slots: # Leer solo con turno: la memoria queda acotada por los streams
+                        block_data = await loop.run_in_executor(None, _pread, f, block_size, index * block_size)
+                        packed_offset = assign.get('container_offset') # Archivo pequeño: un registro en un contenedor compartido
+                        if packed_offset is not None:
+                            block_data = pack_record(file_id, block_data)
+                        success, msg, under_replicated = await self._write_block_to_datanode(block_data, assign['block_id'], file_id, assign['primary_datanode_grpc'], assign.get('secondary_datanode_grpc'), packed_offset,
+                                                                           None if packed_offset is not None else codec) # [cite: 18, 27]
+                    if not success: raise IOError(f"Fallo al escribir bloque {assign['block_id']}: {msg}")
+                    if under_replicated: unconfirmed.append(assign['block_id'])
+                error = await self._run_all(upload_block(index, assign) for index, assign in _interleave_by_primary(init_resp['data']['block_assignments']))
+            if error: return {"error": str(error)}
+            if unconfirmed: logger.warning(f"'{abs_dfs_path}': bloques sin copia en el secundario: {unconfirmed}")
+            return await self._make_namenode_request('POST', '/put/complete', json_data={'path': abs_dfs_path, 'file_id': file_id,
+                                                                                         'under_replicated': unconfirmed})
+
+    @staticmethod
+    async def _run_all(coroutines):
+        """Ejecuta las corrutinas en paralelo; ante el primer error cancela el resto y lo devuelve."""
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        if not tasks: return None
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending: task.cancel()
+        if pending: await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            if task.exception(): return task.exception()
+        return None
+
+    async def _stream_block(self, block_id, datanode_addrs, request, on_chunk, expected=None, on_end=None):
+        """Lee un bloque de la réplica más rápida (EWMA); ante fallo pasa a la siguiente [cite: 24].
+
+        on_chunk(posición relativa, datos) se invoca en orden; un reintento vuelve a empezar desde 0.
+        expected: bytes que debe traer el stream; una réplica que trae otra cantidad cuenta como fallida.
+        on_end(bytes recibidos): corrutina que valida el intento y da el resultado. Un ValueError o IOError
+        de on_chunk u on_end (p. ej. un frame comprimido dañado) también pasa a la siguiente réplica.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._block_slots:
+            for addr in self.replica_latency.rank(datanode_addrs):
+                started = loop.time()
+                first = True
+                try:
+                    position = 0
+                    async for resp_chunk in self._stub(addr).ReadBlock(request, timeout=20):
+                        if first:
+                            self.replica_latency.record(addr, loop.time() - started)
+                            first = False
+                        await on_chunk(position, resp_chunk.chunk_data)
+                        position += len(resp_chunk.chunk_data)
+                    if expected is not None and position != expected:
+                        raise IOError(f"stream incompleto: {position} de {expected} bytes")
+                    return await on_end(position) if on_end else position
+                except grpc.aio.AioRpcError as e:
+                    self.replica_latency.record_failure(addr)
+                    logger.warning(f"Fallo al leer bloque {block_id} de {addr}: {e.details()}")
+                except (IOError, ValueError) as e:
+                    self.replica_latency.record_failure(addr)
+                    logger.warning(f"Fallo al leer bloque {block_id} de {addr}: {e}")
+        raise IOError(f"Fallo al leer bloque {block_id}.")
+
+    async def _cache_call(self, method_name, *args):
+        """Operación de la caché de disco fuera del bucle de eventos; None si la caché está desactivada."""
+        if self.block_cache is None: return None
+        return await asyncio.get_running_loop().run_in_executor(None, getattr(self.block_cache, method_name), *args)
+
+    async def _read_packed_record(self, meta):
+        """Datos de un archivo pequeño: su registro del contenedor, validado; un registro inválido pasa a otra réplica."""
+        cache_key = packed_cache_key(meta)
+        data = await self._cache_call('get', cache_key, meta['size'])
+        if data is not None:
+            return data
+        data = await self._read_packed_record_remote(meta)
+        await self._cache_call('put', cache_key, data)
+        return data
+
+    async def _read_packed_record_remote(self, meta):
+        request = dfs_pb2.ReadBlockRequest(block_id=meta['block_id'], chunk_size=CHUNK_SIZE_CLIENT_GRPC,
+                                           offset=meta['container_offset'], length=RECORD_HEADER.size + meta['size'])
+        for addr in self.replica_latency.rank(meta['datanode_grpc_addresses']):
+            record = bytearray()
+            async def append_chunk(position, data):
+                del record[position:]
+                record.extend(data)
+            try:
+                await self._stream_block(meta['block_id'], [addr], request, append_chunk)
+                return unpack_record(record, meta['file_id'])
+            except (IOError, ValueError) as e:
+                self.replica_latency.record_failure(addr)
+                logger.warning(f"Registro inválido del archivo {meta['file_id']} en {addr}: {e}")
+        raise IOError(f"Fallo al leer el registro del archivo {meta['file_id']} en {meta['block_id']}.")
+
+    async def _get_file_info(self, abs_dfs_path):
+        info_resp = await self._make_namenode_request('GET', '/get', params={'path': abs_dfs_path}) # [cite: 25]
+        if 'error' in info_resp or not info_resp.get('data'):
+            return None, info_resp
+        return info_resp['data'], info_resp
+
+    async def get(self, dfs_file_path, local_target_path): # [cite: 28]
+        abs_dfs_path = self._resolve_path(dfs_file_path)
+        async with self._transfer_slots:
+            file_data, info_resp = await self._get_file_info(abs_dfs_path)
+            if file_data is None: return info_resp
+
+            block_size = file_data.get('block_size', config.BLOCK_SIZE_BYTES)
+            loop = asyncio.get_running_loop()
+            try:
+                with open(local_target_path, 'w+b') as f_out: # Lectura: los bloques descargados se copian a la caché
+                    f_out.truncate(file_data['total_size']) # Preasignar: cada bloque se escribe en su offset
+                    blocks = file_data['blocks']
+                    if blocks and 'container_offset' in blocks[0]: # Archivo pequeño empaquetado
+                        await loop.run_in_executor(None, _pwrite, f_out, await self._read_packed_record(blocks[0]), 0)
+                        blocks = []
+                    async def read_block(meta):
+                        base = meta['sequence'] * block_size
+                        cached = await self._cache_call('get', meta['block_id'], meta['size'])
+                        if cached is not None: # Sin tocar ningún DataNode
+                            await loop.run_in_executor(None, _pwrite, f_out, cached, base)
+                            return
+                        codec = meta.get('codec')
+                        decoder = None
+                        async def write_chunk(position, data):
+                            nonlocal decoder
+                            if not codec:
+                                await loop.run_in_executor(None, _pwrite, f_out, data, base + position)
+                                return
+                            if position == 0: # Primer chunk o reintento con otra réplica
+                                decoder = BlockDecoder(codec, meta['size'])
+                            for raw_position, raw in decoder.feed(data): # Frame a frame según llega
+                                await loop.run_in_executor(None, _pwrite, f_out, raw, base + raw_position)
+                        async def finish_decoding(stored):
+                            nonlocal decoder
+                            if stored == 0: # Stream vacío: no queda el decodificador de un intento anterior
+                                decoder = BlockDecoder(codec, meta['size'])
+                            decoder.finish() # Un stream truncado o con bytes de más pasa a otra réplica
+                            return decoder.position
+                        request = dfs_pb2.ReadBlockRequest(block_id=meta['block_id'], chunk_size=CHUNK_SIZE_CLIENT_GRPC)
+                        n = await self._stream_block(meta['block_id'], meta['datanode_grpc_addresses'], request, write_chunk,
+                                                     expected=None if codec else meta['size'],
+                                                     on_end=finish_decoding if codec else None)
+                        if self.block_cache:
+                            await loop.run_in_executor(None, lambda: self.block_cache.put(meta['block_id'], _pread(f_out, n, base)))
+                    error = await self._run_all(read_block(meta) for meta in blocks)
+                if error: raise error
+                return {"message": f"Archivo '{dfs_file_path}' descargado a '{local_target_path}'."}
+            except Exception as e:
+                try: os.remove(local_target_path)
+                except OSError: pass
+                if isinstance(e, IOError): return {"error": str(e)}
+                return {"error": f"Error durante descarga: {e}"}
+
+    async def _read_stored(self, meta, offset, length, check=None):
+        """Bytes almacenados [offset, offset+length) del bloque (length=0: hasta el final).
+
+        check(datos) los valida y transforma fuera del bucle de eventos; si lanza, se prueba con la siguiente réplica.
+        """
+        data = bytearray()
+        async def append_chunk(position, chunk):
+            del data[position:]
+            data.extend(chunk)
+        async def validate(_):
+            if check is None: return data
+            return await asyncio.get_running_loop().run_in_executor(None, check, data)
+        request = dfs_pb2.ReadBlockRequest(block_id=meta['block_id'], chunk_size=CHUNK_SIZE_CLIENT_GRPC, offset=offset, length=length)
+        return await self._stream_block(meta['block_id'], meta['datanode_grpc_addresses'], request, append_chunk, on_end=validate)
+
+    async def _read_compressed_range(self, meta, offset, length):
+        """Rango sin comprimir de un bloque comprimido: la cabecera y luego solo los frames que lo cubren."""
+        codec, raw_size = meta['codec'], meta['size']
+        if offset == 0 and length >= raw_size:
+            return await self._read_stored(meta, 0, 0, check=lambda data: decode_block(data, codec, raw_size))
+        table = await self._read_stored(meta, 0, header_length(raw_size, codec['frame_size']),
+                                        check=lambda header: FrameTable.parse(header, codec, raw_size))
+        first, last = table.span(offset, length)
+        start, end = table.stored_range(first, last)
+        return await self._read_stored(meta, start, end - start,
+                                       check=lambda data: table.decode_range(data, first, last, offset, length))
+
+    async def read_range(self, dfs_file_path, offset, length):
+        """Lee `length` bytes desde `offset`; solo se piden a los DataNodes los rangos de los bloques implicados."""
+        abs_dfs_path = self._resolve_path(dfs_file_path)
+        file_data, info_resp = await self._get_file_info(abs_dfs_path)
+        if file_data is None:
+            raise FileNotFoundError(info_resp.get('error', f"No se pudo abrir '{abs_dfs_path}'."))
+        block_size = file_data.get('block_size', config.BLOCK_SIZE_BYTES)
+        end = min(offset + length, file_data['total_size'])
+        if offset >= end: return b""
+        blocks = sorted(file_data['blocks'], key=lambda x: x['sequence'])
+        if 'container_offset' in blocks[0]: # Archivo pequeño: el registro se valida entero y se recorta
+            return (await self._read_packed_record(blocks[0]))[offset:end]
+        result = bytearray(end - offset)
+
+        async def read_part(meta):
+            block_start = meta['sequence'] * block_size
+            part_start, part_end = max(offset, block_start), min(end, block_start + meta['size'])
+            cached = await self._cache_call('get_range', meta['block_id'],
+                                            part_start - block_start, part_end - part_start, meta['size'])
+            if cached is not None:
+                result[part_start - offset : part_end - offset] = cached
+                return
+            if meta.get('codec'):
+                result[part_start - offset : part_end - offset] = await self._read_compressed_range(
+                    meta, part_start - block_start, part_end - part_start)
+                return
+            async def copy_chunk(position, data):
+                dest = part_start - offset + position
+                result[dest : dest + len(data)] = data
+            request = dfs_pb2.ReadBlockRequest(block_id=meta['block_id'], chunk_size=CHUNK_SIZE_CLIENT_GRPC,
+                                               offset=part_start - block_start, length=part_end - part_start)
+            await self._stream_block(meta['block_id'], meta['datanode_grpc_addresses'], request, copy_chunk,
+                                     expected=part_end - part_start)
+
+        first, last = offset // block_size, (end - 1) // block_size
+        error = await self._run_all(read_part(meta) for meta in blocks[first : last + 1])
+        if error: raise error
+        return bytes(result)
+
+    async def cd(self, path): # [cite: 28]
+        prospective_path = self._resolve_path(path)
+        if prospective_path == "/" or prospective_path == ".":
+            self.current_path = "/"
+            return {"message": f"Directorio actual cambiado a {self.current_path}"}
+        ls_result = await self.ls(prospective_path) # Verifica si el directorio existe y es accesible
+        if 'error' in ls_result:
+            return {"error": f"No se puede cambiar a '{prospective_path}': {ls_result['error']}"}
+        self.current_path = prospective_path
+        return {"message": f"Directorio actual cambiado a {self.current_path}"}
@@ -19,11 +19,12 @@ import logging
 # --- PRIMERO: Definición del GRUPO 'cli' ---
 @click.group()
 @click.option('--namenode_url', default=lambda: os.environ.get('NAMENODE_URL', common_config.NAMENODE_URL), help='URL del NameNode.')
+@click.option('--block_cache_dir', default=lambda: common_config.CLIENT_BLOCK_CACHE_DIR or None, help='Directorio de la caché local de bloques (opcional).')
 @click.pass_context
-def cli(ctx, namenode_url):
+def cli(ctx, namenode_url, block_cache_dir):
     """CLI para DFS Minimalista."""
     ctx.ensure_object(dict)
-    client = DFSClient(namenode_url)
+    client = DFSClient(namenode_url, block_cache_dir=block_cache_dir)
     ctx.obj['client'] = client
     # Lógica para cargar/guardar current_path para persistencia básica de `cd`
     ctx.obj['current_path_file'] = os.path.expanduser("~/.dfs_cli_path.txt")
@@ -71,10 +72,16 @@ def mkdir(ctx, dir_path):
 @cli.command("put")
 @click.argument('local_file_path', type=click.Path(exists=True, dir_okay=False, resolve_path=True))
 @click.argument('dfs_file_path')
+@click.option('--workers', type=int, default=None, help='Bloques subidos en paralelo.')
+@click.option('--codec', type=click.Choice(['none', 'zlib', 'lzma']), default=None, help='Compresión de los bloques (la negocia el NameNode).')
+@click.option('--codec_level', type=int, default=None, help='Nivel de compresión del códec.')
 @click.pass_context
-def put(ctx, local_file_path, dfs_file_path):
+def put(ctx, local_file_path, dfs_file_path, workers, codec, codec_level):
     """Upload a file to DFS."""
     client = ctx.obj['client']
+    if workers: client.upload_workers = workers
+    if codec: client.codec = codec
+    if codec_level is not None: client.codec_level = codec_level
     # La función _resolve_path del SDK se encarga de normalizar dfs_file_path
     resolved_dfs_path = client._resolve_path(dfs_file_path)
     click.echo(f"Subiendo '{local_file_path}' a '{resolved_dfs_path}'...")
@@ -84,10 +91,12 @@ def put(ctx, local_file_path, dfs_file_path):
 @cli.command("get")
 @click.argument('dfs_file_path')
 @click.argument('local_target_path', type=click.Path(dir_okay=False, resolve_path=True))
+@click.option('--workers', type=int, default=None, help='Bloques descargados en paralelo.')
 @click.pass_context
-def get(ctx, dfs_file_path, local_target_path):
+def get(ctx, dfs_file_path, local_target_path, workers):
     """Download a file from DFS."""
     client = ctx.obj['client']
+    if workers: client.download_workers = workers
     resolved_dfs_path = client._resolve_path(dfs_file_path)
     click.echo(f"Descargando '{resolved_dfs_path}' a '{local_target_path}'...")
     result = client.get(dfs_file_path, local_target_path) # El SDK maneja la resolución de dfs_file_path
@@ -125,11 +134,12 @@ def rmdir(ctx, dir_path):
 
 @cli.command("rm")
 @click.argument('item_path')
+@click.option('-r', '--recursive', is_flag=True, help='Remove a directory and all of its contents.')
 @click.pass_context
-def rm(ctx, item_path):
-    """Remove a file or an empty directory.""" # El NameNode decidirá si es archivo o dir
+def rm(ctx, item_path, recursive):
+    """Remove a file or an empty directory (any directory with -r).""" # El NameNode decidirá si es archivo o dir
     client = ctx.obj['client']
-    result = client.rm(item_path)
+    result = client.rm(item_path, recursive=recursive)
     click.echo(_format_output(result))
 
 
@@ -1,25 +1,214 @@
 # client/client_sdk.py
 import requests
 import grpc
+import io
 import os
 import math
 import logging
 import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, FIRST_EXCEPTION, wait
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'generated'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 import generated.dfs_pb2 as dfs_pb2
 import generated.dfs_pb2_grpc as dfs_pb2_grpc
 from common import config
+from common.container_format import RECORD_HEADER, pack_record, unpack_record
+from common.block_codec import BlockDecoder, FrameTable, decode_block, encode_block, header_length
+from common.grpc_pool import get_channel_pool
+from replica_selector import ReplicaLatencyTracker
+from disk_block_cache import DiskBlockCache
 
 logger = logging.getLogger(__name__)
 CHUNK_SIZE_CLIENT_GRPC = 1 * 1024 * 1024 # 1MB
 
+def _pread(f, size, offset): # Lectura posicional: los hilos no comparten el cursor del archivo
+    if hasattr(os, 'pread'):
+        return os.pread(f.fileno(), size, offset)
+    with open(f.name, 'rb') as f_local:
+        f_local.seek(offset)
+        return f_local.read(size)
+
+def _pwrite(f, data, offset): # Escritura posicional en el archivo destino preasignado
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(f.fileno(), view, offset)
+            view, offset = view[written:], offset + written
+        return
+    with open(f.name, 'r+b') as f_local:
+        f_local.seek(offset)
+        f_local.write(data)
+
+def packed_cache_key(meta):
+    """Clave de caché de un archivo pequeño empaquetado: su file_id (el contenedor se reescribe al compactar)."""
+    return f"packed_{meta['file_id']}"
+
+def _interleave_by_primary(assignments):
+    """Ordena las asignaciones alternando primarios para repartir las escrituras concurrentes."""
+    by_primary = defaultdict(list)
+    for index, assign in enumerate(assignments):
+        by_primary[assign['primary_datanode_grpc']].append((index, assign))
+    queues = list(by_primary.values())
+    ordered = []
+    while queues:
+        ordered.extend(q.pop(0) for q in queues)
+        queues = [q for q in queues if q]
+    return ordered
+
+class DFSFileReader(io.RawIOBase):
+    """Lector posicionable de un archivo DFS: cada lectura pide solo el rango necesario del bloque que lo contiene."""
+
+    def __init__(self, client, file_info):
+        self._client = client
+        self.name = file_info['file_name']
+        self.size = file_info['total_size']
+        self.block_size = file_info.get('block_size', config.BLOCK_SIZE_BYTES)
+        self._blocks = sorted(file_info['blocks'], key=lambda x: x['sequence'])
+        self._packed_data = None
+        self._frame_tables = {} # block_id -> FrameTable de los bloques comprimidos ya consultados
+        self._pos = 0
+
+    def readable(self): return True
+    def seekable(self): return True
+    def tell(self): return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET: new_pos = offset
+        elif whence == io.SEEK_CUR: new_pos = self._pos + offset
+        elif whence == io.SEEK_END: new_pos = self.size + offset
+        else: raise ValueError(f"whence inválido: {whence}")
+        if new_pos < 0: raise ValueError("Posición negativa")
+        self._pos = new_pos
+        return self._pos
+
+    def readinto(self, buffer):
+        if self._pos >= self.size: return 0
+        if 'container_offset' in self._blocks[0]: # Archivo pequeño empaquetado: se lee (y valida) entero una vez
+            if self._packed_data is None:
+                self._packed_data = self._client._read_packed_record(self._blocks[0])
+            n = min(len(buffer), self.size - self._pos)
+            buffer[:n] = self._packed_data[self._pos : self._pos + n]
+            self._pos += n
+            return n
+        index, block_offset = divmod(self._pos, self.block_size)
+        meta = self._blocks[index]
+        # Una lectura no cruza bordes de bloque; BufferedReader repite la llamada si hace falta
+        length = min(len(buffer), self.size - self._pos, meta['size'] - block_offset)
+        data = self._client._read_block_range_cached(meta, block_offset, length, self._frame_tables)
+        n = len(data)
+        buffer[:n] = data
+        self._pos += n
+        return n
+
+class _ReadAttempt:
+    """Una petición ReadBlock a una réplica; se abre en segundo plano hasta recibir el primer chunk."""
+
+    def __init__(self, client, address, request, is_hedge):
+        self.client = client
+        self.address = address
+        self.is_hedge = is_hedge
+        self.started = None # Al salir de la cola del executor: la espera local no es latencia de la réplica
+        self._call = None
+        self._cancelled = False
+        self.future = client._get_read_executor().submit(self._open, request)
+
+    def elapsed(self):
+        return 0.0 if self.started is None else time.monotonic() - self.started
+
+    def _open(self, request):
+        client = self.client
+        self.started = time.monotonic()
+        stub = client.channel_pool.acquire(self.address, dfs_pb2_grpc.DataNodeServiceStub)
+        try:
+            self._call = stub.ReadBlock(request, timeout=20)
+            if self._cancelled: self._call.cancel()
+            first_chunk = next(self._call, None) # None: bloque o rango vacío
+        except Exception as e:
+            client.channel_pool.release(self.address, e)
+            if not self._cancelled: client.replica_latency.record_failure(self.address)
+            raise
+        if not self._cancelled: client.replica_latency.record(self.address, self.elapsed())
+        return first_chunk
+
+    def cancel(self): # Perdedor de la carrera: cortar el stream y devolver el canal cuando termine de abrirse
+        self._cancelled = True
+        # Lo esperado hasta ahora es una cota inferior de su latencia: evita volver a elegirla primero
+        if self.started is not None: self.client.replica_latency.record(self.address, self.elapsed())
+        if self._call is not None: self._call.cancel()
+        def release(future):
+            if future.exception() is None:
+                self._call.cancel()
+                self.client.channel_pool.release(self.address)
+        self.future.add_done_callback(release)
+
+    def chunks(self):
+        """Datos del bloque (solo para el ganador). Devuelve el canal al pool al terminar."""
+        error = None
+        try:
+            first_chunk = self.future.result()
+            if first_chunk is None: return
+            yield first_chunk.chunk_data
+            for resp_chunk in self._call:
+                yield resp_chunk.chunk_data
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self.future.exception() is None:
+                self.client.channel_pool.release(self.address, error)
+
 class DFSClient:
-    def __init__(self, namenode_url):
+    def __init__(self, namenode_url, upload_workers=None, download_workers=None, hedged_reads=None,
+                 block_cache_dir=None, block_cache_bytes=None, codec=None, codec_level=None):
         self.namenode_url = namenode_url
         self.current_path = "/"
+        self.upload_workers = upload_workers or config.CLIENT_UPLOAD_WORKERS
+        self.download_workers = download_workers or config.CLIENT_DOWNLOAD_WORKERS
+        self.channel_pool = get_channel_pool()
+        # Lecturas: réplica más rápida primero (EWMA) y petición de cobertura si tarda más que el percentil configurado
+        self.hedged_reads = config.CLIENT_HEDGED_READS if hedged_reads is None else hedged_reads
+        self.replica_latency = ReplicaLatencyTracker()
+        self._read_executor = None # Se dimensiona con download_workers efectivo (el CLI lo cambia tras crear el cliente)
+        self._read_executor_workers = 0
+        self._read_executor_lock = threading.Lock()
+        self._read_stats = {"reads": 0, "hedges_issued": 0, "hedges_won": 0, "replica_failovers": 0}
+        self._read_stats_lock = threading.Lock()
+        # Caché de bloques en disco, opcional y compartida con otros procesos que usen el mismo directorio
+        block_cache_dir = block_cache_dir or config.CLIENT_BLOCK_CACHE_DIR
+        self.block_cache = DiskBlockCache(block_cache_dir, block_cache_bytes or config.CLIENT_BLOCK_CACHE_BYTES) if block_cache_dir else None
+        # Compresión pedida en `put`; el NameNode la acepta o impone la del clúster
+        self.codec = codec or config.CLIENT_BLOCK_CODEC
+        self.codec_level = config.CLIENT_BLOCK_CODEC_LEVEL if codec_level is None else codec_level
+
+    def _get_read_executor(self):
+        """Executor de aperturas ReadBlock: dos por descarga en paralelo (primaria y cobertura) más margen."""
+        workers = 2 * self.download_workers + 2
+        with self._read_executor_lock:
+            if self._read_executor_workers != workers:
+                previous = self._read_executor
+                self._read_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dfs-read")
+                self._read_executor_workers = workers
+                if previous is not None:
+                    previous.shutdown(wait=False) # Las aperturas ya encoladas terminan en el anterior
+            return self._read_executor
+
+    def _count(self, counter):
+        with self._read_stats_lock:
+            self._read_stats[counter] += 1
+
+    def read_stats(self):
+        """Contadores de lectura (cobertura emitida/ganada, cambios de réplica) y latencia EWMA por DataNode en ms."""
+        with self._read_stats_lock:
+            stats = dict(self._read_stats)
+        stats["replica_latency_ms"] = self.replica_latency.snapshot()
+        if self.block_cache: stats["block_cache"] = self.block_cache.get_stats()
+        return stats
 
     def _make_namenode_request(self, method, endpoint, params=None, json_data=None): # Canal de Control REST [cite: 18]
         url = f"{self.namenode_url}{endpoint}"
@@ -43,25 +232,46 @@ class DFSClient:
     def mkdir(self, dir_path): return self._make_namenode_request('POST', '/mkdir', json_data={'path': self._resolve_path(dir_path)})
     def ls(self, path="."): return self._make_namenode_request('GET', '/ls', params={'path': self._resolve_path(path)})
     def rmdir(self, dir_path): return self._make_namenode_request('POST', '/rmdir', json_data={'path': self._resolve_path(dir_path)})
-    def rm(self, item_path): return self._make_namenode_request('POST', '/rm', json_data={'path': self._resolve_path(item_path)})
+    def rm(self, item_path, recursive=False): # recursive: borra un directorio y todo su contenido en el NameNode
+        return self._make_namenode_request('POST', '/rm', json_data={'path': self._resolve_path(item_path), 'recursive': recursive})
+
+    def batch(self, operations, atomic=False):
+        """Ejecuta varias operaciones de metadatos (mkdir, ls, get, rm, rmdir) en una sola petición.
 
-    def _write_block_to_datanode(self, block_data, block_id, file_id, primary_dn_addr, secondary_dn_addr): # Canal de Datos gRPC [cite: 18]
+        operations: lista de dicts {'op': ..., 'path': ...} o tuplas (op, path).
+        Un 'rm' puede llevar 'recursive': True.
+        Devuelve la respuesta del NameNode con 'results' en el mismo orden.
+        """
+        ops = []
+        for op in operations:
+            if isinstance(op, dict):
+                ops.append(dict(op, path=self._resolve_path(op['path'])))
+            else:
+                op_name, path = op
+                ops.append({'op': op_name, 'path': self._resolve_path(path)})
+        return self._make_namenode_request('POST', '/batch', json_data={'operations': ops, 'atomic': atomic})
+
+    def _write_block_to_datanode(self, block_data, block_id, file_id, primary_dn_addr, secondary_dn_addr, packed_offset=None, codec=None): # Canal de Datos gRPC [cite: 18]
+        """packed_offset: el bloque es el registro de un archivo pequeño dentro del contenedor block_id.
+        codec: códec negociado; el bloque se comprime en el stream y el DataNode guarda los bytes comprimidos."""
         try:
-            with grpc.insecure_channel(primary_dn_addr) as channel:
-                stub = dfs_pb2_grpc.DataNodeServiceStub(channel)
+            with self.channel_pool.lease(primary_dn_addr, dfs_pb2_grpc.DataNodeServiceStub) as stub:
                 def generate_reqs():
-                    yield dfs_pb2.WriteBlockRequest(block_info=dfs_pb2.BlockInfo(block_id=block_id, file_id=str(file_id), secondary_datanode_grpc_address=secondary_dn_addr or ""))
+                    yield dfs_pb2.WriteBlockRequest(block_info=dfs_pb2.BlockInfo(block_id=block_id, file_id=str(file_id), secondary_datanode_grpc_address=secondary_dn_addr or "",
+                                                                                 packed=packed_offset is not None, packed_offset=packed_offset or 0))
+                    # Se comprime ya con el stream abierto: el DataNode prepara la escritura (y su réplica) mientras tanto
+                    stored = encode_block(block_data, codec) if codec else block_data
                     offset = 0
-                    while offset < len(block_data):
-                        chunk = block_data[offset : offset + CHUNK_SIZE_CLIENT_GRPC]
+                    while offset < len(stored):
+                        chunk = stored[offset : offset + CHUNK_SIZE_CLIENT_GRPC]
                         yield dfs_pb2.WriteBlockRequest(chunk_data=chunk)
                         offset += len(chunk)
                 
                 response = stub.WriteBlock(generate_reqs(), timeout=30)
-                return response.success, response.message
+                return response.success, response.message, response.under_replicated
         except Exception as e:
             logger.error(f"Error gRPC escribiendo bloque {block_id} a {primary_dn_addr}: {e}")
-            return False, str(e)
+            return False, str(e), False
 
     def put(self, local_file_path, dfs_file_path): # [cite: 28]
         abs_dfs_path = self._resolve_path(dfs_file_path)
@@ -69,53 +279,213 @@ class DFSClient:
             return {"error": f"Archivo local {local_file_path} no encontrado o no es un archivo."}
         
         total_size = os.path.getsize(local_file_path)
-        init_resp = self._make_namenode_request('POST', '/put/initiate', json_data={'path': abs_dfs_path, 'size': total_size}) # [cite: 26]
+        init_resp = self._make_namenode_request('POST', '/put/initiate', json_data={'path': abs_dfs_path, 'size': total_size,
+                                                                                    'codec': self.codec, 'codec_level': self.codec_level}) # [cite: 26]
         if 'error' in init_resp or not init_resp.get('data'): return init_resp
 
         file_id = init_resp['data']['file_id']
         assignments = init_resp['data']['block_assignments'] # [cite: 25]
+        block_size = init_resp['data'].get('block_size', config.BLOCK_SIZE_BYTES) # El tamaño real del bloque lo determina el NameNode
+        codec = init_resp['data'].get('codec') # El códec negociado, no necesariamente el pedido
         
+        unconfirmed = [] # Escritos solo en el primario: el NameNode los re-replica
         with open(local_file_path, 'rb') as f:
-            for assign in assignments: # Cada archivo es particionado en n bloques [cite: 20]
-                block_data = f.read(config.BLOCK_SIZE_BYTES) # El tamaño real del bloque lo determina el NameNode
-                if not block_data: break
-                success, msg = self._write_block_to_datanode(block_data, assign['block_id'], file_id, assign['primary_datanode_grpc'], assign.get('secondary_datanode_grpc')) # [cite: 18, 27]
-                if not success: return {"error": f"Fallo al escribir bloque {assign['block_id']}: {msg}"}
+            def upload_block(index, assign): # Cada archivo es particionado en n bloques [cite: 20]
+                # Leer dentro de la tarea: como máximo `upload_workers` bloques en memoria a la vez
+                block_data = _pread(f, block_size, index * block_size)
+                packed_offset = assign.get('container_offset') # Archivo pequeño: un registro en un contenedor compartido
+                if packed_offset is not None:
+                    block_data = pack_record(file_id, block_data)
+                success, msg, under_replicated = self._write_block_to_datanode(block_data, assign['block_id'], file_id, assign['primary_datanode_grpc'], assign.get('secondary_datanode_grpc'), packed_offset,
+                                                             None if packed_offset is not None else codec) # [cite: 18, 27]
+                if not success: raise IOError(f"Fallo al escribir bloque {assign['block_id']}: {msg}")
+                if under_replicated: unconfirmed.append(assign['block_id'])
+
+            with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+                pending = [executor.submit(upload_block, index, assign) for index, assign in _interleave_by_primary(assignments)]
+                done, not_done = wait(pending, return_when=FIRST_EXCEPTION)
+                for fut in not_done: fut.cancel()
+                for fut in done:
+                    if fut.exception(): return {"error": str(fut.exception())}
         
-        return self._make_namenode_request('POST', '/put/complete', json_data={'path': abs_dfs_path, 'file_id': file_id})
+        if unconfirmed: logger.warning(f"'{abs_dfs_path}': bloques sin copia en el secundario: {unconfirmed}")
+        return self._make_namenode_request('POST', '/put/complete', json_data={'path': abs_dfs_path, 'file_id': file_id,
+                                                                               'under_replicated': unconfirmed})
+
+    def _open_block_stream(self, block_id, datanode_addrs, request):
+        """Abre ReadBlock contra la réplica más rápida; si no responde en el retardo de cobertura, lanza
+        otra petición a la siguiente réplica y se queda con la primera que entregue datos."""
+        remaining = self.channel_pool.order_by_health(self.replica_latency.rank(datanode_addrs))
+        in_flight = {}
+        def launch(is_hedge):
+            attempt = _ReadAttempt(self, remaining.pop(0), request, is_hedge)
+            in_flight[attempt.future] = attempt
+            return attempt
+        self._count("reads")
+        launch(False)
+        while in_flight:
+            timeout = None
+            if self.hedged_reads and remaining and len(in_flight) == 1:
+                oldest = next(iter(in_flight.values()))
+                timeout = max(0.0, self.replica_latency.hedge_delay() - oldest.elapsed())
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done: # La réplica tarda más que el percentil: cubrir con otra
+                self._count("hedges_issued")
+                launch(True)
+                continue
+            for future in done:
+                attempt = in_flight.pop(future)
+                if future.exception() is None:
+                    for loser in in_flight.values(): loser.cancel()
+                    if attempt.is_hedge: self._count("hedges_won")
+                    return attempt
+                logger.warning(f"Fallo al leer bloque {block_id} de {attempt.address}: {future.exception()}")
+            if not in_flight and remaining: # Intenta con réplicas si la primera falla [cite: 24]
+                self._count("replica_failovers")
+                launch(False)
+        raise IOError(f"Fallo al leer bloque {block_id}.")
+
+    def _read_block_into_file(self, f_out, offset, block_id, datanode_addrs, codec=None, raw_size=None): # Canal de Datos gRPC [cite: 18]
+        """Escribe cada chunk recibido directamente en su posición; sin buffer del bloque completo.
+        Un bloque comprimido se descomprime frame a frame según llega. Devuelve los bytes sin comprimir escritos."""
+        request = dfs_pb2.ReadBlockRequest(block_id=block_id, chunk_size=CHUNK_SIZE_CLIENT_GRPC)
+        addrs = list(datanode_addrs)
+        while addrs:
+            attempt = self._open_block_stream(block_id, addrs, request)
+            position = offset # Un reintento con otra réplica sobrescribe desde el inicio del bloque
+            decoder = BlockDecoder(codec, raw_size) if codec else None
+            try:
+                for chunk in attempt.chunks():
+                    if decoder is None:
+                        _pwrite(f_out, chunk, position)
+                        position += len(chunk)
+                        continue
+                    for raw_position, raw in decoder.feed(chunk):
+                        _pwrite(f_out, raw, offset + raw_position)
+                if decoder is not None:
+                    decoder.finish()
+                    position += decoder.position
+                if raw_size is not None and position - offset != raw_size: # El archivo está preasignado: un corte dejaría huecos
+                    raise IOError(f"Bloque {block_id} incompleto: {position - offset} de {raw_size} bytes.")
+                return position - offset
+            except Exception as e: # Falló a mitad del stream: seguir con las demás réplicas
+                logger.warning(f"Fallo al leer bloque {block_id} de {attempt.address}: {e}")
+                self.replica_latency.record_failure(attempt.address)
+                addrs.remove(attempt.address)
+        raise IOError(f"Fallo al leer bloque {block_id}. Descarga abortada.")
 
-    def _read_block_from_datanode(self, block_id, datanode_addrs): # Canal de Datos gRPC [cite: 18]
-        for addr in datanode_addrs: # Intenta con réplicas si la primera falla [cite: 24]
+    def _read_block_range(self, block_id, datanode_addrs, offset, length, check=None): # Canal de Datos gRPC [cite: 18]
+        """check(datos) valida lo leído; si lanza, se prueba con la siguiente réplica."""
+        request = dfs_pb2.ReadBlockRequest(block_id=block_id, chunk_size=CHUNK_SIZE_CLIENT_GRPC, offset=offset, length=length)
+        addrs = list(datanode_addrs)
+        while addrs:
+            attempt = self._open_block_stream(block_id, addrs, request)
             try:
-                with grpc.insecure_channel(addr) as channel:
-                    stub = dfs_pb2_grpc.DataNodeServiceStub(channel)
-                    block_content = bytearray()
-                    for resp_chunk in stub.ReadBlock(dfs_pb2.ReadBlockRequest(block_id=block_id), timeout=20):
-                        block_content.extend(resp_chunk.chunk_data)
-                    return bytes(block_content)
+                chunks = list(attempt.chunks())
+                data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+                return check(data) if check else data
             except Exception as e:
-                logger.warning(f"Fallo al leer bloque {block_id} de {addr}: {e}")
-        return None
+                logger.warning(f"Fallo al leer rango [{offset}, +{length}) del bloque {block_id} de {attempt.address}: {e}")
+                self.replica_latency.record_failure(attempt.address)
+                addrs.remove(attempt.address)
+        raise IOError(f"Fallo al leer bloque {block_id}.")
+
+    def _download_block(self, f_out, offset, meta, datanode_addrs):
+        """Un bloque de `get`: de la caché local si está; si no, de los DataNodes, y se guarda en la caché."""
+        if self.block_cache:
+            data = self.block_cache.get(meta['block_id'], meta['size'])
+            if data is not None:
+                _pwrite(f_out, data, offset)
+                return len(data)
+        n = self._read_block_into_file(f_out, offset, meta['block_id'], datanode_addrs, meta.get('codec'), meta['size'])
+        if self.block_cache:
+            self.block_cache.put(meta['block_id'], _pread(f_out, n, offset)) # Recién escrito: sale de la caché de páginas
+        return n
+
+    def _read_block_range_cached(self, meta, offset, length, frame_tables=None):
+        """frame_tables: dict donde conservar las tablas de frames de bloques comprimidos entre lecturas."""
+        if self.block_cache: # La caché guarda los bloques ya descomprimidos
+            data = self.block_cache.get_range(meta['block_id'], offset, length, meta['size'])
+            if data is not None:
+                return data
+        if meta.get('codec'):
+            data = self._read_compressed_range(meta, offset, length, frame_tables)
+        else:
+            data = self._read_block_range(meta['block_id'], meta['datanode_grpc_addresses'], offset, length)
+        if self.block_cache and offset == 0 and len(data) == meta['size']: # Solo lecturas del bloque completo
+            self.block_cache.put(meta['block_id'], data)
+        return data
+
+    def _read_compressed_range(self, meta, offset, length, frame_tables=None):
+        """Rango sin comprimir de un bloque comprimido: se piden la cabecera y solo los frames que lo cubren."""
+        block_id, addrs, codec, raw_size = meta['block_id'], meta['datanode_grpc_addresses'], meta['codec'], meta['size']
+        if offset == 0 and length >= raw_size: # Bloque completo: una sola petición
+            return self._read_block_range(block_id, addrs, 0, 0, check=lambda data: decode_block(data, codec, raw_size))
+        table = frame_tables.get(block_id) if frame_tables is not None else None
+        if table is None:
+            table = self._read_block_range(block_id, addrs, 0, header_length(raw_size, codec['frame_size']),
+                                           check=lambda header: FrameTable.parse(header, codec, raw_size))
+            if frame_tables is not None: frame_tables[block_id] = table
+        first, last = table.span(offset, length)
+        start, end = table.stored_range(first, last)
+        return self._read_block_range(block_id, addrs, start, end - start,
+                                      check=lambda data: table.decode_range(data, first, last, offset, length))
+
+    def _read_packed_record(self, meta):
+        """Datos de un archivo pequeño: su registro completo del contenedor, validado contra file_id y CRC."""
+        cache_key = packed_cache_key(meta) # El contenedor cambia; el registro de un archivo no
+        if self.block_cache:
+            data = self.block_cache.get(cache_key, meta['size'])
+            if data is not None:
+                return data
+        data = self._read_block_range(meta['block_id'], meta['datanode_grpc_addresses'], meta['container_offset'],
+                                      RECORD_HEADER.size + meta['size'], check=lambda record: unpack_record(record, meta['file_id']))
+        if self.block_cache: self.block_cache.put(cache_key, data)
+        return data
+
+    def open(self, dfs_file_path, read_ahead=None):
+        """Abre un archivo DFS para lectura como objeto de archivo binario posicionable y con buffer.
+
+        read_ahead: bytes que se piden por adelantado en cada lectura al DataNode.
+        Leer 1 KB del final (seek(-1024, 2); read()) cuesta una sola RPC pequeña.
+        """
+        abs_dfs_path = self._resolve_path(dfs_file_path)
+        info_resp = self._make_namenode_request('GET', '/get', params={'path': abs_dfs_path}) # [cite: 25]
+        if 'error' in info_resp or not info_resp.get('data'):
+            raise FileNotFoundError(info_resp.get('error', f"No se pudo abrir '{abs_dfs_path}'."))
+        raw = DFSFileReader(self, info_resp['data'])
+        return io.BufferedReader(raw, buffer_size=read_ahead or config.CLIENT_READ_AHEAD_BYTES)
 
     def get(self, dfs_file_path, local_target_path): # [cite: 28]
         abs_dfs_path = self._resolve_path(dfs_file_path)
         info_resp = self._make_namenode_request('GET', '/get', params={'path': abs_dfs_path}) # [cite: 25]
         if 'error' in info_resp or not info_resp.get('data'): return info_resp
         
-        blocks_meta = sorted(info_resp['data']['blocks'], key=lambda x: x['sequence'])
+        file_data = info_resp['data']
+        block_size = file_data.get('block_size', config.BLOCK_SIZE_BYTES)
+        blocks_meta = sorted(file_data['blocks'], key=lambda x: x['sequence'])
         try:
-            with open(local_target_path, 'wb') as f_out:
-                for meta in blocks_meta:
-                    block_content = self._read_block_from_datanode(meta['block_id'], meta['datanode_grpc_addresses']) # [cite: 24]
-                    if block_content is None:
-                        try: os.remove(local_target_path) # Limpieza
-                        except OSError: pass
-                        return {"error": f"Fallo al leer bloque {meta['block_id']}. Descarga abortada."}
-                    f_out.write(block_content)
+            with open(local_target_path, 'w+b') as f_out: # Lectura: los bloques descargados se copian a la caché
+                f_out.truncate(file_data['total_size']) # Preasignar: cada bloque se escribe en su offset
+                if blocks_meta and 'container_offset' in blocks_meta[0]: # Archivo pequeño empaquetado
+                    _pwrite(f_out, self._read_packed_record(blocks_meta[0]), 0)
+                    blocks_meta = []
+                with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+                    pending = []
+                    for meta in blocks_meta:
+                        addrs = meta['datanode_grpc_addresses']
+                        shift = meta['sequence'] % len(addrs) # Repartir bloques consecutivos entre réplicas [cite: 24]
+                        pending.append(executor.submit(self._download_block, f_out, meta['sequence'] * block_size,
+                                                       meta, addrs[shift:] + addrs[:shift]))
+                    done, not_done = wait(pending, return_when=FIRST_EXCEPTION)
+                    for fut in not_done: fut.cancel()
+                    for fut in done:
+                        if fut.exception(): raise fut.exception()
             return {"message": f"Archivo '{dfs_file_path}' descargado a '{local_target_path}'."}
         except Exception as e:
             try: os.remove(local_target_path)
             except OSError: pass
+            if isinstance(e, IOError): return {"error": str(e)}
             return {"error": f"Error durante descarga: {e}"}
 
 
@@ -0,0 +1,197 @@
+# client/disk_block_cache.py
+"""Caché persistente de bloques en el disco local del cliente, compartible entre procesos del mismo host.
+
+Los bloques no cambian nunca (los ids derivan de file_id, que no se reutiliza, y no hay sobrescritura),
+así que no hace falta invalidar: solo expulsar por tamaño. Cada entrada se escribe a un temporal y se
+enlaza con su nombre final, de modo que nadie ve una entrada a medias y dos procesos que descargan el
+mismo bloque no la cuentan dos veces. La recencia LRU es el mtime (se renueva en cada acierto) y el uso
+total vive en un contador compartido protegido con flock; quien lo supera expulsa las entradas más viejas.
+La caché es opcional: un error de E/S (disco lleno, directorio de solo lectura, permisos) se registra y se
+trata como un fallo de caché o una entrada no guardada; nunca hace fallar una lectura.
+"""
+import contextlib
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Sin flock (Windows): la caché sigue funcionando, sin coordinar la expulsión entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TMP_SUFFIX = '.tmp'
+LOCK_FILE = '.lock'
+USAGE_FILE = '.usage'
+EVICT_TO_RATIO = 0.9 # Tras superar el límite se expulsa hasta este porcentaje, para no expulsar en cada escritura
+STALE_TMP_SEC = 3600 # Temporales de procesos que murieron a mitad de una escritura
+_USAGE = struct.Struct('<Q')
+
+
+class DiskBlockCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError as e:
+            self._error(f"No se pudo crear el directorio de la caché de bloques {cache_dir}", e)
+
+    def _count(self, counter, n=1):
+        with self._stats_lock:
+            self.stats[counter] += n
+
+    def _error(self, message, e):
+        logger.warning(f"{message}: {e}")
+        self._count("errors")
+
+    def _path(self, key):
+        shard = hashlib.sha1(key.encode()).hexdigest()[:2] # 256 subdirectorios: ninguno crece demasiado
+        return os.path.join(self.cache_dir, shard, key)
+
+    def get(self, key, expected_size=None):
+        """Datos completos de la entrada, o None. Una entrada de tamaño inesperado se descarta."""
+        return self.get_range(key, 0, None, expected_size)
+
+    def get_range(self, key, offset, length, expected_size=None):
+        """Bytes [offset, offset+length) de la entrada (length=None hasta el final), o None si no está."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if expected_size is not None and size != expected_size:
+                    logger.warning(f"Entrada de caché {key} con tamaño {size}, se esperaba {expected_size}; se descarta.")
+                    self._discard(path)
+                    self._count("misses")
+                    return None
+                data = os.pread(f.fileno(), size - offset if length is None else length, offset)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        except OSError as e:
+            self._error(f"No se pudo leer la entrada {key} de la caché de bloques", e)
+            self._count("misses")
+            return None
+        try:
+            os.utime(path) # Renovar la recencia LRU
+        except OSError:
+            pass # Expulsada mientras tanto: los datos ya se leyeron
+        self._count("hits")
+        return data
+
+    def put(self, key, data):
+        """Añade una entrada si no existe. Devuelve True si este proceso la creó."""
+        if len(data) > self.max_bytes:
+            return False
+        try:
+            return self._put(key, self._path(key), data)
+        except OSError as e:
+            self._error(f"No se pudo guardar la entrada {key} en la caché de bloques", e)
+            return False
+
+    def _put(self, key, path, data):
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{key}.", suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            with self._locked(): # Enlazar y contar juntos: una expulsión concurrente no la cuenta dos veces
+                os.link(tmp, path) # Atómico y falla si otro proceso ya la creó
+                try:
+                    self._add_usage_locked(len(data))
+                except OSError:
+                    os.remove(path) # Una entrada sin contar escaparía al límite
+                    raise
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp)
+        return True
+
+    def _discard(self, path):
+        with self._locked():
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            self._add_usage_locked(-size)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # Cada adquisición abre su propio descriptor: flock también excluye a los hilos del mismo proceso
+        with open(os.path.join(self.cache_dir, LOCK_FILE), 'a+b') as f:
+            if fcntl: fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _add_usage_locked(self, delta):
+        """Suma `delta` al contador compartido; quien lo cambia ya enlazó o borró la entrada en disco."""
+        usage_path = os.path.join(self.cache_dir, USAGE_FILE)
+        try:
+            with open(usage_path, 'rb') as f:
+                (usage,) = _USAGE.unpack(f.read(_USAGE.size))
+            usage = max(0, usage + delta)
+        except (FileNotFoundError, struct.error):
+            usage = self._scan_usage() # El recorrido ya refleja la entrada de `delta`
+        if usage > self.max_bytes:
+            usage = self._evict_locked()
+        with open(usage_path + TMP_SUFFIX, 'wb') as f:
+            f.write(_USAGE.pack(usage))
+        os.replace(usage_path + TMP_SUFFIX, usage_path)
+
+    def _entries(self):
+        """(mtime, tamaño, ruta) de cada entrada; de paso borra temporales abandonados."""
+        entries = []
+        stale_before = time.time() - STALE_TMP_SEC
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for e in os.scandir(shard.path):
+                try:
+                    st = e.stat()
+                    if e.name.endswith(TMP_SUFFIX):
+                        if st.st_mtime < stale_before: os.remove(e.path)
+                        continue
+                except OSError:
+                    continue # Expulsada o renombrada por otro proceso
+                entries.append((st.st_mtime, st.st_size, e.path))
+        return entries
+
+    def _scan_usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_locked(self):
+        """Expulsa las entradas menos recientes hasta EVICT_TO_RATIO del límite. Devuelve el uso real resultante.
+
+        El recuento se rehace desde el disco, lo que corrige la deriva del contador (p. ej. procesos caídos).
+        """
+        entries = sorted(self._entries())
+        usage = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO_RATIO
+        evicted = 0
+        for _, size, path in entries:
+            if usage <= target:
+                break
+            try:
+                os.remove(path) # Un lector que ya la abrió sigue leyendo del inodo
+            except FileNotFoundError:
+                pass
+            usage -= size
+            evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+            logger.info(f"Caché de bloques: {evicted} entradas expulsadas, uso {usage} bytes.")
+        return usage
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats, max_bytes=self.max_bytes)
@@ -0,0 +1,54 @@
+# client/replica_selector.py
+import collections
+import threading
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common import config
+
+LATENCY_WINDOW = 256 # Muestras recientes (todas las réplicas) para el percentil de cobertura
+MIN_SAMPLES_FOR_PERCENTILE = 20
+FAILURE_PENALTY_SEC = 5.0 # Latencia que se anota a una réplica que falla
+
+
+class ReplicaLatencyTracker:
+    """Latencia hasta el primer chunk por DataNode (EWMA) y retardo de las lecturas cubiertas (hedged)."""
+
+    def __init__(self, alpha=None):
+        self.alpha = alpha if alpha is not None else config.CLIENT_LATENCY_EWMA_ALPHA
+        self._lock = threading.Lock()
+        self._ewma = {} # dirección gRPC -> segundos
+        self._recent = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, address, seconds):
+        with self._lock:
+            previous = self._ewma.get(address)
+            self._ewma[address] = seconds if previous is None else self.alpha * seconds + (1 - self.alpha) * previous
+            self._recent.append(seconds)
+
+    def record_failure(self, address):
+        with self._lock:
+            previous = self._ewma.get(address, 0.0)
+            self._ewma[address] = max(previous, FAILURE_PENALTY_SEC)
+
+    def rank(self, addresses):
+        """Réplicas de más rápida a más lenta; las nunca medidas van primero para obtener una muestra.
+
+        El orden es estable: a igual latencia se respeta el orden recibido (salud, rotación por bloque).
+        """
+        with self._lock:
+            return sorted(addresses, key=lambda addr: self._ewma.get(addr, 0.0))
+
+    def hedge_delay(self):
+        """Segundos a esperar antes de lanzar la petición de cobertura: percentil configurado de las muestras."""
+        with self._lock:
+            samples = sorted(self._recent)
+        if len(samples) < MIN_SAMPLES_FOR_PERCENTILE:
+            return config.CLIENT_HEDGE_INITIAL_DELAY_MS / 1000
+        index = min(len(samples) - 1, int(len(samples) * config.CLIENT_HEDGE_PERCENTILE / 100))
+        return max(samples[index], config.CLIENT_HEDGE_MIN_DELAY_MS / 1000)
+
+    def snapshot(self):
+        with self._lock:
+            return {addr: round(seconds * 1000, 2) for addr, seconds in self._ewma.items()}
@@ -0,0 +1,68 @@
+# client/test_client_sdk.py
+"""DFSClient.get: caché de bloques inutilizable y réplicas que devuelven bloques incompletos."""
+import os
+
+import pytest
+
+pytest.importorskip('grpc')
+pytest.importorskip('requests')
+pytest.importorskip('generated.dfs_pb2')
+
+import client_sdk
+from client_sdk import DFSClient
+
+
+BLOCK = b'0123456789' * 10
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_bytes(b'')
+    dfs = DFSClient('http://namenode', block_cache_dir=str(blocker / 'cache'))
+    file_data = {"total_size": 2 * len(BLOCK), "block_size": len(BLOCK), "blocks": [
+        {"block_id": f"7_{i}", "sequence": i, "size": len(BLOCK), "datanode_grpc_addresses": ['dn:50051']} for i in range(2)]}
+    monkeypatch.setattr(dfs, '_make_namenode_request', lambda *args, **kwargs: {"data": file_data})
+    def read_block_into_file(f_out, offset, block_id, addrs, codec=None, raw_size=None):
+        client_sdk._pwrite(f_out, BLOCK, offset)
+        return len(BLOCK)
+    monkeypatch.setattr(dfs, '_read_block_into_file', read_block_into_file)
+    return dfs
+
+
+def test_get_succeeds_with_an_unusable_cache(client, tmp_path):
+    target = tmp_path / 'out'
+    result = client.get('/f', str(target))
+    assert 'error' not in result, result
+    assert target.read_bytes() == BLOCK * 2
+    assert client.block_cache.get_stats()['errors'] >= 2
+
+
+class _Attempt:
+    def __init__(self, address, chunks):
+        self.address = address
+        self._chunks = chunks
+
+    def chunks(self):
+        yield from self._chunks
+
+
+def test_short_stream_fails_over_to_the_next_replica(tmp_path, monkeypatch):
+    dfs = DFSClient('http://namenode')
+    streams = {'dn1:50051': [BLOCK[:40]], 'dn2:50051': [BLOCK[:60], BLOCK[60:]]} # dn1 corta el stream
+    monkeypatch.setattr(dfs, '_open_block_stream', lambda block_id, addrs, request: _Attempt(addrs[0], streams[addrs[0]]))
+    with open(tmp_path / 'out', 'w+b') as f_out:
+        f_out.truncate(len(BLOCK))
+        assert dfs._read_block_into_file(f_out, 0, '7_0', ['dn1:50051', 'dn2:50051'], raw_size=len(BLOCK)) == len(BLOCK)
+    assert (tmp_path / 'out').read_bytes() == BLOCK
+
+
+def test_short_stream_on_every_replica_fails_the_get(tmp_path, monkeypatch):
+    dfs = DFSClient('http://namenode')
+    file_data = {"total_size": len(BLOCK), "block_size": len(BLOCK), "blocks": [
+        {"block_id": "7_0", "sequence": 0, "size": len(BLOCK), "datanode_grpc_addresses": ['dn1:50051']}]}
+    monkeypatch.setattr(dfs, '_make_namenode_request', lambda *args, **kwargs: {"data": file_data})
+    monkeypatch.setattr(dfs, '_open_block_stream', lambda block_id, addrs, request: _Attempt(addrs[0], [BLOCK[:40]]))
+    target = tmp_path / 'out'
+    assert 'error' in dfs.get('/f', str(target))
+    assert not target.exists() # Nada de un archivo del tamaño correcto con huecos
@@ -0,0 +1,163 @@
+# client/test_disk_block_cache.py
+"""Caché de bloques en disco: expulsión LRU por mtime, publicación atómica con os.link y llenado concurrente."""
+import errno
+import multiprocessing
+import os
+
+import pytest
+
+import disk_block_cache
+from disk_block_cache import DiskBlockCache, EVICT_TO_RATIO, TMP_SUFFIX, USAGE_FILE, _USAGE
+
+
+def _usage(cache):
+    with open(os.path.join(cache.cache_dir, USAGE_FILE), 'rb') as f:
+        return _USAGE.unpack(f.read())[0]
+
+
+def _files(cache):
+    """Nombres de las entradas y temporales que hay en disco."""
+    return sorted(name for shard in os.scandir(cache.cache_dir) if shard.is_dir() for name in os.listdir(shard.path))
+
+
+def _disk_bytes(cache):
+    return sum(os.path.getsize(cache._path(name)) for name in _files(cache) if not name.endswith(TMP_SUFFIX))
+
+
+def _age(cache, key, mtime):
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DiskBlockCache(str(tmp_path / 'cache'), 1000)
+
+
+def test_put_get_and_ranges(cache):
+    assert cache.put('1_0', b'0123456789')
+    assert cache.get('1_0') == b'0123456789'
+    assert cache.get_range('1_0', 3, 4) == b'3456'
+    assert cache.get_range('1_0', 7, None) == b'789'
+    assert cache.get('2_0') is None
+    assert cache.get_stats()['hits'] == 3 and cache.get_stats()['misses'] == 1
+    assert _usage(cache) == 10
+    assert not cache.put('big', b'x' * 1001) # Mayor que toda la caché
+
+
+def test_unexpected_size_discards_the_entry(cache):
+    cache.put('1_0', b'x' * 100)
+    assert cache.get('1_0', expected_size=99) is None
+    assert _files(cache) == [] and _usage(cache) == 0
+
+
+def test_lru_eviction_by_mtime(cache):
+    for key, mtime in (('a', 100), ('b', 200), ('c', 300)):
+        cache.put(key, b'x' * 300)
+        _age(cache, key, mtime)
+    assert cache.get('a') is not None # Acierto: 'a' pasa a ser la más reciente
+    assert cache.put('d', b'x' * 300) # 1200 > 1000: se expulsa hasta el 90 %
+    assert _files(cache) == ['a', 'c', 'd']
+    assert _usage(cache) == _disk_bytes(cache) == 900 <= cache.max_bytes * EVICT_TO_RATIO
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_eviction_rebuilds_a_drifted_counter(cache):
+    cache.put('a', b'x' * 300)
+    with open(os.path.join(cache.cache_dir, USAGE_FILE), 'wb') as f:
+        f.write(_USAGE.pack(950)) # Un proceso murió sin descontar sus entradas
+    cache.put('b', b'x' * 100)
+    assert _files(cache) == ['a', 'b'] and _usage(cache) == 400
+
+
+def test_existing_entry_is_not_published_twice(cache):
+    assert cache.put('1_0', b'x' * 10)
+    assert not cache.put('1_0', b'y' * 10)
+    assert cache.get('1_0') == b'x' * 10 and _usage(cache) == 10
+
+
+def test_link_race_keeps_the_first_entry(cache, monkeypatch):
+    cache.put('1_0', b'x' * 10)
+    monkeypatch.setattr(disk_block_cache.os.path, 'exists', lambda path: False) # El otro proceso enlazó después de la comprobación
+    assert not cache.put('1_0', b'y' * 10)
+    assert _files(cache) == ['1_0'] # Sin temporales abandonados
+    assert cache.get('1_0') == b'x' * 10 and _usage(cache) == 10
+
+
+def test_stale_temporaries_are_removed_on_eviction(cache):
+    cache.put('a', b'x' * 600)
+    path = cache._path('a') + '.abc' + TMP_SUFFIX
+    with open(path, 'wb') as f:
+        f.write(b'partial')
+    os.utime(path, (0, 0)) # De un proceso que murió hace mucho
+    cache.put('b', b'x' * 600)
+    assert _files(cache) == ['b']
+
+
+def test_unusable_cache_dir_behaves_as_an_empty_cache(tmp_path):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_bytes(b'')
+    cache = DiskBlockCache(str(blocker / 'cache'), 1000) # makedirs falla: no debe impedir crear el cliente
+    assert not cache.put('1_0', b'x' * 10)
+    assert cache.get('1_0') is None and cache.get_range('1_0', 0, 5) is None
+    assert cache.get_stats()['errors'] == 4 # Creación, put y las dos lecturas
+
+
+def test_full_disk_skips_the_insert(cache, monkeypatch):
+    def no_space(*args):
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(disk_block_cache.os, 'link', no_space)
+    assert not cache.put('1_0', b'x' * 10)
+    assert _files(cache) == [] # El temporal también se borra
+    assert cache.get('1_0') is None and cache.get_stats()['errors'] == 1
+
+
+def test_failed_usage_update_unpublishes_the_entry(cache, monkeypatch):
+    def no_space(*args):
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(disk_block_cache.os, 'replace', no_space)
+    assert not cache.put('1_0', b'x' * 10)
+    assert _files(cache) == []
+
+
+def test_read_errors_are_misses(cache, monkeypatch):
+    cache.put('1_0', b'x' * 10)
+    def io_error(*args):
+        raise OSError(errno.EIO, "Input/output error")
+    monkeypatch.setattr(disk_block_cache.os, 'pread', io_error)
+    assert cache.get('1_0') is None
+    assert cache.get_stats()['misses'] == 1 and cache.get_stats()['errors'] == 1
+    monkeypatch.undo()
+    assert cache.get('1_0') == b'x' * 10 # La entrada sigue ahí
+
+
+def _fill(cache_dir, max_bytes, worker, keys, size):
+    cache = DiskBlockCache(cache_dir, max_bytes)
+    for key in keys:
+        cache.put(key, bytes([worker]) * size)
+        cache.get(key)
+
+
+def _run_workers(cache, keys_per_worker, size, workers=4):
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_fill, args=(cache.cache_dir, cache.max_bytes, w, keys_per_worker(w), size)) for w in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+
+
+@pytest.mark.skipif(disk_block_cache.fcntl is None, reason="Sin flock no se coordinan procesos")
+def test_concurrent_fill_of_the_same_blocks(tmp_path):
+    cache = DiskBlockCache(str(tmp_path / 'cache'), 1 << 20)
+    _run_workers(cache, lambda w: [f"{i}_0" for i in range(50)], 100) # Todos descargan los mismos bloques
+    assert len(_files(cache)) == 50
+    assert _usage(cache) == _disk_bytes(cache) == 50 * 100 # Cada entrada se cuenta una sola vez
+
+
+@pytest.mark.skipif(disk_block_cache.fcntl is None, reason="Sin flock no se coordinan procesos")
+def test_concurrent_fill_past_the_limit(tmp_path):
+    cache = DiskBlockCache(str(tmp_path / 'cache'), 5000)
+    _run_workers(cache, lambda w: [f"{w}_{i}" for i in range(40)], 100)
+    assert not any(name.endswith(TMP_SUFFIX) for name in _files(cache))
+    assert _disk_bytes(cache) == _usage(cache) <= cache.max_bytes
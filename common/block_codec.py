@@ -0,0 +1,175 @@
+# common/block_codec.py
+"""Compresión transparente por bloque en frames decodificables de forma independiente.
+
+El códec de cada bloque se negocia en /put/initiate y el NameNode lo registra junto al bloque. El cliente
+comprime al escribir y descomprime al leer; los DataNodes guardan y replican los bytes comprimidos tal cual.
+Formato de un bloque comprimido: cabecera (magia, códec, nivel, tamaño de frame, tamaño sin comprimir),
+tabla con la longitud almacenada de cada frame y los frames. Cada frame comprime `frame_size` bytes por
+separado; uno que no se reduce se guarda sin comprimir (bit alto de su longitud). El tamaño de la cabecera
+se deduce del tamaño sin comprimir, así que una lectura por rango pide la cabecera y luego solo sus frames.
+"""
+import lzma
+import struct
+import zlib
+
+NONE = 'none'
+CODEC_IDS = {'zlib': 1, 'lzma': 2}
+LEVELS = {'zlib': (1, 9, 6), 'lzma': (0, 9, 6)} # (mínimo, máximo, por defecto)
+HEADER = struct.Struct('<4sBBIQ') # magia, id del códec, nivel, bytes sin comprimir por frame, tamaño sin comprimir
+HEADER_MAGIC = b'DFSZ'
+FRAME_LENGTH = struct.Struct('<I')
+STORED_RAW = 1 << 31 # En la tabla: el frame se guardó sin comprimir
+
+def negotiate(requested, level, allowed, default, frame_size):
+    """Códec de un archivo nuevo: el pedido si el clúster lo permite, si no el por defecto.
+
+    Devuelve la descripción {'name', 'level', 'frame_size'} o None (sin compresión).
+    ValueError si el códec pedido no existe.
+    """
+    if requested is not None and requested != NONE and requested not in CODEC_IDS:
+        raise ValueError(f"Códec de bloque desconocido: '{requested}'.")
+    name = requested if requested is not None and (requested == NONE or requested in allowed) else default
+    if name == NONE or name not in CODEC_IDS:
+        return None
+    low, high, default_level = LEVELS[name]
+    level = default_level if level is None or name != requested else max(low, min(high, int(level)))
+    if not 0 < frame_size < STORED_RAW:
+        raise ValueError(f"Tamaño de frame inválido: {frame_size}.")
+    return {"name": name, "level": level, "frame_size": frame_size}
+
+def frame_count(raw_size, frame_size):
+    return (raw_size + frame_size - 1) // frame_size
+
+def header_length(raw_size, frame_size):
+    return HEADER.size + FRAME_LENGTH.size * frame_count(raw_size, frame_size)
+
+def _compress(name, data, level):
+    if name == 'zlib':
+        return zlib.compress(data, level)
+    return lzma.compress(data, preset=level)
+
+def _decompress(name, data):
+    try:
+        if name == 'zlib':
+            return zlib.decompress(data)
+        return lzma.decompress(data)
+    except (zlib.error, lzma.LZMAError) as e:
+        raise ValueError(f"Frame comprimido dañado: {e}")
+
+def encode_block(data, codec):
+    """Bytes almacenados del bloque `data` con el códec negociado."""
+    name, level, frame_size = codec['name'], codec['level'], codec['frame_size']
+    view = memoryview(data)
+    lengths = []
+    frames = []
+    for start in range(0, len(view), frame_size):
+        raw = view[start : start + frame_size]
+        frame = _compress(name, raw, level)
+        if len(frame) >= len(raw): # Incompresible: no crecer
+            frame = bytes(raw)
+            lengths.append(len(frame) | STORED_RAW)
+        else:
+            lengths.append(len(frame))
+        frames.append(frame)
+    header = HEADER.pack(HEADER_MAGIC, CODEC_IDS[name], level, frame_size, len(view))
+    return b"".join([header, b"".join(FRAME_LENGTH.pack(n) for n in lengths)] + frames)
+
+
+class FrameTable:
+    """Tabla de frames de un bloque comprimido: dónde está cada frame y cómo se decodifica."""
+
+    def __init__(self, codec, raw_size, lengths):
+        self.name = codec['name']
+        self.frame_size = codec['frame_size']
+        self.raw_size = raw_size
+        self.lengths = [n & ~STORED_RAW for n in lengths]
+        self.stored_raw = [bool(n & STORED_RAW) for n in lengths]
+        self.offsets = [header_length(raw_size, self.frame_size)] # Offset almacenado de cada frame, y el final
+        for n in self.lengths:
+            self.offsets.append(self.offsets[-1] + n)
+
+    @classmethod
+    def parse(cls, header, codec, raw_size):
+        """Valida la cabecera contra los metadatos del bloque. ValueError si no corresponde o está truncada."""
+        frame_size = codec['frame_size']
+        if len(header) < header_length(raw_size, frame_size):
+            raise ValueError("Cabecera de bloque comprimido truncada.")
+        magic, codec_id, _, header_frame_size, header_raw_size = HEADER.unpack_from(header)
+        if (magic != HEADER_MAGIC or codec_id != CODEC_IDS.get(codec['name'])
+                or header_frame_size != frame_size or header_raw_size != raw_size):
+            raise ValueError("La cabecera del bloque comprimido no coincide con sus metadatos.")
+        lengths = [FRAME_LENGTH.unpack_from(header, HEADER.size + i * FRAME_LENGTH.size)[0]
+                   for i in range(frame_count(raw_size, frame_size))]
+        return cls(codec, raw_size, lengths)
+
+    @property
+    def count(self):
+        return len(self.lengths)
+
+    def span(self, offset, length):
+        """Primer y último frame (inclusive) que contienen [offset, offset+length)."""
+        end = min(self.raw_size, offset + length)
+        return offset // self.frame_size, max(offset, end - 1) // self.frame_size
+
+    def stored_range(self, first, last):
+        return self.offsets[first], self.offsets[last + 1]
+
+    def decode_frame(self, index, data):
+        expected = min(self.frame_size, self.raw_size - index * self.frame_size)
+        raw = bytes(data) if self.stored_raw[index] else _decompress(self.name, data)
+        if len(raw) != expected:
+            raise ValueError(f"Frame {index} con {len(raw)} bytes, se esperaban {expected}.")
+        return raw
+
+    def decode_range(self, data, first, last, offset, length):
+        """Bytes [offset, offset+length) sin comprimir a partir de los frames almacenados first..last."""
+        view = memoryview(data)
+        base = self.offsets[first]
+        if len(view) < self.offsets[last + 1] - base:
+            raise ValueError("Frames comprimidos truncados.")
+        raw = b"".join(self.decode_frame(i, view[self.offsets[i] - base : self.offsets[i + 1] - base])
+                       for i in range(first, last + 1))
+        start = offset - first * self.frame_size
+        return raw[start : start + length]
+
+
+class BlockDecoder:
+    """Decodifica un bloque comprimido a medida que llega por el stream, frame a frame."""
+
+    def __init__(self, codec, raw_size):
+        self.codec = codec
+        self.raw_size = raw_size
+        self.position = 0 # Bytes sin comprimir ya entregados
+        self._header_length = header_length(raw_size, codec['frame_size'])
+        self._buffer = bytearray()
+        self._table = None
+        self._next_frame = 0
+
+    def feed(self, chunk):
+        """Añade bytes almacenados y cede (posición sin comprimir, datos) de cada frame que se completa."""
+        self._buffer += chunk
+        if self._table is None:
+            if len(self._buffer) < self._header_length:
+                return
+            self._table = FrameTable.parse(self._buffer, self.codec, self.raw_size)
+            del self._buffer[:self._header_length]
+        while self._next_frame < self._table.count:
+            stored = self._table.lengths[self._next_frame]
+            if len(self._buffer) < stored:
+                return
+            raw = self._table.decode_frame(self._next_frame, self._buffer[:stored])
+            del self._buffer[:stored]
+            yield self.position, raw
+            self.position += len(raw)
+            self._next_frame += 1
+
+    def finish(self):
+        """ValueError si el stream terminó antes de completar el bloque (o trajo bytes de más)."""
+        if self._table is None or self._next_frame < self._table.count or self._buffer:
+            raise ValueError("Bloque comprimido incompleto.")
+
+def decode_block(data, codec, raw_size):
+    decoder = BlockDecoder(codec, raw_size)
+    raw = b"".join(part for _, part in decoder.feed(data))
+    decoder.finish()
+    return raw
@@ -5,6 +5,9 @@ import os
 NAMENODE_HOST = os.environ.get('NAMENODE_HOST', '0.0.0.0') # Escucha en todas las interfaces
 NAMENODE_PORT = 5000
 NAMENODE_URL = os.environ.get('NAMENODE_PUBLIC_URL', f"http://localhost:{NAMENODE_PORT}") # URL accesible públicamente
+NAMENODE_SERVER_THREADS = int(os.environ.get('NAMENODE_SERVER_THREADS', 16)) # Hilos del servidor WSGI
+NAMENODE_GROUP_COMMIT_MAX_OPS = int(os.environ.get('NAMENODE_GROUP_COMMIT_MAX_OPS', 256)) # Mutaciones por transacción del escritor
+NAMENODE_GROUP_COMMIT_LINGER_MS = float(os.environ.get('NAMENODE_GROUP_COMMIT_LINGER_MS', 0)) # Espera extra para agrupar; 0 = lo ya encolado
 
 # Configuración del DataNode
 DATANODE_HOST = '0.0.0.0' # Escucha en todas las interfaces para gRPC y Flask interno
@@ -15,11 +18,89 @@ DATANODE_FLASK_PORT_START = 5001 # Para administración interna/comandos desde N
 BLOCK_SIZE_BYTES = int(os.environ.get('BLOCK_SIZE_BYTES', 1 * 1024 * 1024))  # Tamaño de bloque por defecto 1MB [cite: 21]
 REPLICATION_FACTOR = int(os.environ.get('REPLICATION_FACTOR', 2)) # [cite: 23]
 
+# Empaquetado de archivos pequeños en bloques contenedor compartidos (modo opcional, desactivado por defecto).
+# Con un umbral > 0, los archivos de hasta ese tamaño se guardan como registros de un contenedor en lugar de en
+# bloques propios (p. ej. 131072 para 128 KB). Los registros empaquetados no se comprimen con BLOCK_CODEC_*.
+SMALL_FILE_THRESHOLD_BYTES = int(os.environ.get('SMALL_FILE_THRESHOLD_BYTES', 0)) # Hasta este tamaño se empaqueta; 0 = desactivado
+CONTAINER_SIZE_BYTES = int(os.environ.get('CONTAINER_SIZE_BYTES', 16 * 1024 * 1024)) # Tamaño máximo de un contenedor
+CONTAINER_MAX_OPEN = int(os.environ.get('CONTAINER_MAX_OPEN', 4)) # Contenedores abiertos a la vez (reparten la carga de escritura)
+CONTAINER_COMPACTION_MIN_DEAD_RATIO = float(os.environ.get('CONTAINER_COMPACTION_MIN_DEAD_RATIO', 0.5)) # Fracción borrada que dispara la compactación
+CONTAINER_COMPACTION_INTERVAL_SEC = int(os.environ.get('CONTAINER_COMPACTION_INTERVAL_SEC', 300))
+CONTAINER_COMPACTION_MAX_PER_PASS = int(os.environ.get('CONTAINER_COMPACTION_MAX_PER_PASS', 8)) # Contenedores planificados por pasada
+
+# Compresión por bloque: se negocia en /put/initiate y el NameNode la registra para cada bloque
+BLOCK_CODECS_ALLOWED = os.environ.get('BLOCK_CODECS_ALLOWED', 'zlib,lzma').split(',') # Códecs que el clúster acepta ('none' siempre)
+BLOCK_CODEC_DEFAULT = os.environ.get('BLOCK_CODEC_DEFAULT', 'none') # Si el cliente no pide ninguno o pide uno no permitido
+BLOCK_CODEC_FRAME_BYTES = int(os.environ.get('BLOCK_CODEC_FRAME_BYTES', 128 * 1024)) # Bytes sin comprimir por frame independiente
+
+# Configuración del Cliente
+CLIENT_UPLOAD_WORKERS = int(os.environ.get('CLIENT_UPLOAD_WORKERS', 4)) # Bloques subidos en paralelo por `put`
+CLIENT_DOWNLOAD_WORKERS = int(os.environ.get('CLIENT_DOWNLOAD_WORKERS', 4)) # Bloques descargados en paralelo por `get`
+CLIENT_READ_AHEAD_BYTES = int(os.environ.get('CLIENT_READ_AHEAD_BYTES', 256 * 1024)) # Buffer de `open()` para lecturas por rango
+CLIENT_HEDGED_READS = os.environ.get('CLIENT_HEDGED_READS', '0') == '1' # '1': segunda petición a otra réplica si la primera tarda
+CLIENT_HEDGE_PERCENTILE = float(os.environ.get('CLIENT_HEDGE_PERCENTILE', 95)) # Percentil de latencia tras el que se lanza
+CLIENT_HEDGE_MIN_DELAY_MS = int(os.environ.get('CLIENT_HEDGE_MIN_DELAY_MS', 20))
+CLIENT_HEDGE_INITIAL_DELAY_MS = int(os.environ.get('CLIENT_HEDGE_INITIAL_DELAY_MS', 500)) # Hasta tener muestras suficientes
+CLIENT_LATENCY_EWMA_ALPHA = float(os.environ.get('CLIENT_LATENCY_EWMA_ALPHA', 0.3)) # Peso de la última medición por réplica
+CLIENT_BLOCK_CACHE_DIR = os.environ.get('CLIENT_BLOCK_CACHE_DIR', '') # Caché local de bloques en disco (vacío la desactiva)
+CLIENT_BLOCK_CACHE_BYTES = int(os.environ.get('CLIENT_BLOCK_CACHE_BYTES', 1024 * 1024 * 1024)) # Límite de la caché; se expulsa por LRU
+CLIENT_BLOCK_CODEC = os.environ.get('CLIENT_BLOCK_CODEC') or None # Códec pedido en `put` (None: el por defecto del NameNode)
+CLIENT_BLOCK_CODEC_LEVEL = int(os.environ['CLIENT_BLOCK_CODEC_LEVEL']) if os.environ.get('CLIENT_BLOCK_CODEC_LEVEL') else None
+CLIENT_ASYNC_MAX_TRANSFERS = int(os.environ.get('CLIENT_ASYNC_MAX_TRANSFERS', 256)) # Archivos en curso a la vez en AsyncDFSClient
+CLIENT_ASYNC_MAX_BLOCK_STREAMS = int(os.environ.get('CLIENT_ASYNC_MAX_BLOCK_STREAMS', 64)) # Streams de bloque simultáneos (acota la memoria)
+
 # BD de Metadatos del NameNode
 METADATA_DB_PATH = 'namenode_metadata.db' # Relativo a donde se ejecuta la app del namenode
+METADATA_DB_SYNCHRONOUS = os.environ.get('METADATA_DB_SYNCHRONOUS', 'NORMAL') # NORMAL es seguro con WAL
+METADATA_DB_CACHE_SIZE_KB = int(os.environ.get('METADATA_DB_CACHE_SIZE_KB', 64 * 1024))
+METADATA_DB_MMAP_SIZE_BYTES = int(os.environ.get('METADATA_DB_MMAP_SIZE_BYTES', 256 * 1024 * 1024))
+METADATA_DB_BUSY_TIMEOUT_MS = int(os.environ.get('METADATA_DB_BUSY_TIMEOUT_MS', 5000))
+METADATA_DB_STATEMENT_CACHE = 256 # Sentencias preparadas reutilizadas por conexión
+METADATA_DB_POOL_MAX_IDLE = int(os.environ.get('METADATA_DB_POOL_MAX_IDLE', 16))
+BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 1000)) # Operaciones por llamada a /batch
 
 # Almacenamiento de Bloques del DataNode
 BLOCKS_DIR_DEFAULT = 'datanode_blocks' # Relativo a donde se ejecuta la app del datanode
+DATANODE_READ_CHUNK_BYTES = int(os.environ.get('DATANODE_READ_CHUNK_BYTES', 512 * 1024)) # Chunk por defecto de ReadBlock
+DATANODE_READ_CHUNK_MIN_BYTES = 64 * 1024
+DATANODE_READ_CHUNK_MAX_BYTES = 4 * 1024 * 1024 # Debe quedar por debajo de GRPC_MAX_MESSAGE_BYTES
+DATANODE_BYTES_PER_CHECKSUM = 64 * 1024 # Granularidad del sidecar de CRC32 de cada bloque
+DATANODE_SCRUB_BYTES_PER_SEC = int(os.environ.get('DATANODE_SCRUB_BYTES_PER_SEC', 8 * 1024 * 1024)) # Límite de E/S del scrubber
+DATANODE_SCRUB_INTERVAL_SEC = int(os.environ.get('DATANODE_SCRUB_INTERVAL_SEC', 6 * 3600)) # Pausa entre pasadas completas
+DATANODE_BLOCK_CACHE_BYTES = int(os.environ.get('DATANODE_BLOCK_CACHE_BYTES', 0)) # Caché de bloques calientes en memoria (0 la desactiva)
+DATANODE_FSYNC_POLICY = os.environ.get('DATANODE_FSYNC_POLICY', 'none') # 'none', 'close' (por bloque) o 'group' (agrupado por tiempo)
+DATANODE_GROUP_FSYNC_INTERVAL_MS = int(os.environ.get('DATANODE_GROUP_FSYNC_INTERVAL_MS', 10)) # Espera máxima añadida por la política 'group'
+DATANODE_BLOCK_STORE = os.environ.get('DATANODE_BLOCK_STORE', 'files') # 'files' (un archivo por bloque) o 'segments' (log-structured)
+DATANODE_SEGMENT_BYTES = int(os.environ.get('DATANODE_SEGMENT_BYTES', 256 * 1024 * 1024)) # Tamaño al que se cierra un segmento
+DATANODE_SEGMENT_COMPACTION_MIN_DEAD_RATIO = float(os.environ.get('DATANODE_SEGMENT_COMPACTION_MIN_DEAD_RATIO', 0.5)) # Espacio muerto que dispara la compactación
+DATANODE_SEGMENT_COMPACTION_INTERVAL_SEC = int(os.environ.get('DATANODE_SEGMENT_COMPACTION_INTERVAL_SEC', 60))
+DATANODE_SEGMENT_SPOOL_BYTES = 8 * 1024 * 1024 # Bloque en escritura que supera esto se acumula en disco hasta confirmarlo
 
 HEARTBEAT_INTERVAL_SEC = 10
-HEARTBEAT_TIMEOUT_FACTOR = 3 # Si se pierden 3 heartbeats, el DN se considera caído
\ No newline at end of file
+HEARTBEAT_TIMEOUT_FACTOR = 3 # Si se pierden 3 heartbeats, el DN se considera caído
+WRITE_IN_FLIGHT_GRACE_SEC = int(os.environ.get('WRITE_IN_FLIGHT_GRACE_SEC', 120)) # Escrituras más recientes pueden seguir en vuelo: ni reportes ni compactación las tocan
+
+# Re-replicación de bloques sub-replicados (tareas repartidas en los heartbeats)
+REPLICATION_SCAN_INTERVAL_SEC = int(os.environ.get('REPLICATION_SCAN_INTERVAL_SEC', 300)) # Reescaneo periódico de seguridad
+REPLICATION_MAX_STREAMS_PER_NODE = int(os.environ.get('REPLICATION_MAX_STREAMS_PER_NODE', 2)) # Copias concurrentes por DataNode
+REPLICATION_MAX_BYTES_PER_HEARTBEAT = int(os.environ.get('REPLICATION_MAX_BYTES_PER_HEARTBEAT', 64 * 1024 * 1024)) # Ancho de banda por nodo e intervalo
+REPLICATION_TASK_TIMEOUT_SEC = int(os.environ.get('REPLICATION_TASK_TIMEOUT_SEC', 120)) # Tareas sin resultado se reencolan
+REPLICATION_SCAN_LIMIT = 1000 # Entradas de la cola examinadas por heartbeat
+
+# Colocación de réplicas de bloques nuevos
+PLACEMENT_POLICY = os.environ.get('PLACEMENT_POLICY', 'random') # 'random' (aleatoria entre los vivos) o 'load_aware' (espacio libre y carga)
+PLACEMENT_LOAD_WEIGHT = float(os.environ.get('PLACEMENT_LOAD_WEIGHT', 0.05)) # Coste por transferencia en curso
+PLACEMENT_SPREAD_WEIGHT = float(os.environ.get('PLACEMENT_SPREAD_WEIGHT', 0.1)) # Coste por bloque del mismo archivo en el nodo
+PLACEMENT_MIN_FREE_BYTES = int(os.environ.get('PLACEMENT_MIN_FREE_BYTES', 64 * 1024 * 1024)) # Reserva de disco por DataNode
+
+# Eliminación física asíncrona de bloques (cola persistente por DataNode, drenada en los heartbeats)
+DELETION_MAX_BLOCKS_PER_HEARTBEAT = int(os.environ.get('DELETION_MAX_BLOCKS_PER_HEARTBEAT', 1000)) # Eliminaciones entregadas por heartbeat
+DELETION_REDISPATCH_SEC = int(os.environ.get('DELETION_REDISPATCH_SEC', 60)) # Eliminaciones no confirmadas se reenvían
+
+# Canales gRPC compartidos (cliente, DataNodes y NameNode)
+GRPC_MAX_MESSAGE_BYTES = int(os.environ.get('GRPC_MAX_MESSAGE_BYTES', 64 * 1024 * 1024))
+GRPC_KEEPALIVE_TIME_MS = int(os.environ.get('GRPC_KEEPALIVE_TIME_MS', 30000))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.environ.get('GRPC_KEEPALIVE_TIMEOUT_MS', 10000))
+GRPC_CHANNEL_IDLE_SEC = int(os.environ.get('GRPC_CHANNEL_IDLE_SEC', 300)) # Canales sin uso se cierran tras este tiempo
+GRPC_UNHEALTHY_AFTER_FAILURES = 3 # Fallos de transporte seguidos para marcar un nodo como no saludable
+GRPC_UNHEALTHY_COOLDOWN_SEC = 30
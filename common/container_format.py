@@ -0,0 +1,34 @@
+# common/container_format.py
+"""Formato de los registros de archivos pequeños empaquetados en bloques contenedor.
+
+Cada registro se describe a sí mismo: cabecera (magia, file_id, longitud, CRC32) seguida de los datos.
+El NameNode reserva el offset de cada registro; cliente y DataNodes solo mueven bytes, y quien lee
+verifica la cabecera, así que un hueco (escritura fallida o réplica incompleta) se detecta como error.
+"""
+import struct
+import zlib
+
+CONTAINER_PREFIX = 'ctr_' # Los block_id de contenedores empiezan así; los de archivos son "<file_id>_<n>"
+RECORD_HEADER = struct.Struct('<4sQII') # magia, file_id, longitud de los datos, CRC32 de los datos
+RECORD_MAGIC = b'DFSR'
+
+def is_container(block_id):
+    return block_id.startswith(CONTAINER_PREFIX)
+
+def record_length(data_length):
+    return RECORD_HEADER.size + data_length
+
+def pack_record(file_id, data):
+    return RECORD_HEADER.pack(RECORD_MAGIC, int(file_id), len(data), zlib.crc32(data)) + bytes(data)
+
+def unpack_record(record, file_id):
+    """Valida el registro leído del contenedor y devuelve sus datos. ValueError si no corresponde o está dañado."""
+    if len(record) < RECORD_HEADER.size:
+        raise ValueError("Registro de contenedor truncado.")
+    magic, record_file_id, length, crc = RECORD_HEADER.unpack_from(record)
+    if magic != RECORD_MAGIC or record_file_id != int(file_id):
+        raise ValueError(f"El registro no pertenece al archivo {file_id}.")
+    data = bytes(record[RECORD_HEADER.size : RECORD_HEADER.size + length])
+    if len(data) != length or zlib.crc32(data) != crc:
+        raise ValueError(f"Checksum inválido en el registro del archivo {file_id}.")
+    return data
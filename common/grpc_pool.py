@@ -0,0 +1,135 @@
+# common/grpc_pool.py
+import contextlib
+import logging
+import threading
+import time
+
+import grpc
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common import config
+
+logger = logging.getLogger(__name__)
+
+# Errores que indican un problema del nodo/conexión y no de la petición
+_TRANSPORT_ERRORS = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+
+
+def channel_options():
+    """Opciones comunes para canales y servidores gRPC (tamaño de mensaje y keepalive)."""
+    return [
+        ('grpc.max_send_message_length', config.GRPC_MAX_MESSAGE_BYTES),
+        ('grpc.max_receive_message_length', config.GRPC_MAX_MESSAGE_BYTES),
+        ('grpc.keepalive_time_ms', config.GRPC_KEEPALIVE_TIME_MS),
+        ('grpc.keepalive_timeout_ms', config.GRPC_KEEPALIVE_TIMEOUT_MS),
+        ('grpc.keepalive_permit_without_calls', 1),
+        ('grpc.http2.max_pings_without_data', 0),
+    ]
+
+
+class _ChannelEntry:
+    __slots__ = ('address', 'channel', 'stubs', 'in_use', 'last_used', 'consecutive_failures', 'last_failure')
+
+    def __init__(self, address):
+        self.address = address
+        self.channel = grpc.insecure_channel(address, options=channel_options())
+        self.stubs = {} # clase de stub -> instancia
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+
+
+class ChannelPool:
+    """Canales gRPC compartidos por dirección, con desalojo por inactividad y seguimiento de salud."""
+
+    def __init__(self, idle_timeout_sec=None):
+        self.idle_timeout_sec = idle_timeout_sec if idle_timeout_sec is not None else config.GRPC_CHANNEL_IDLE_SEC
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def acquire(self, address, stub_cls):
+        """Presta un stub para `address`; debe devolverse con release()."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None:
+                entry = self._entries[address] = _ChannelEntry(address)
+            entry.in_use += 1
+            entry.last_used = now
+            stub = entry.stubs.get(stub_cls)
+            if stub is None:
+                stub = entry.stubs[stub_cls] = stub_cls(entry.channel)
+            to_close = self._sweep_locked(now)
+        for channel in to_close:
+            channel.close()
+        return stub
+
+    def release(self, address, error=None):
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None: return
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            if error is None:
+                entry.consecutive_failures = 0
+            elif isinstance(error, grpc.RpcError) and error.code() in _TRANSPORT_ERRORS:
+                entry.consecutive_failures += 1
+                entry.last_failure = entry.last_used
+
+    @contextlib.contextmanager
+    def lease(self, address, stub_cls):
+        stub = self.acquire(address, stub_cls)
+        error = None
+        try:
+            yield stub
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(address, error)
+
+    def is_healthy(self, address):
+        """Un nodo es no saludable tras varios fallos de transporte seguidos, durante un periodo de espera."""
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None or entry.consecutive_failures < config.GRPC_UNHEALTHY_AFTER_FAILURES:
+                return True
+            return time.monotonic() - entry.last_failure > config.GRPC_UNHEALTHY_COOLDOWN_SEC
+
+    def order_by_health(self, addresses):
+        """Reordena direcciones dejando al final las no saludables (orden estable)."""
+        return sorted(addresses, key=lambda addr: not self.is_healthy(addr))
+
+    def _sweep_locked(self, now):
+        if now - self._last_sweep < self.idle_timeout_sec / 2:
+            return []
+        self._last_sweep = now
+        idle = [addr for addr, e in self._entries.items()
+                if e.in_use == 0 and now - e.last_used > self.idle_timeout_sec]
+        closed = [self._entries.pop(addr).channel for addr in idle]
+        if closed:
+            logger.info(f"Cerrando {len(closed)} canales gRPC inactivos.")
+        return closed
+
+    def close_all(self):
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        for entry in entries.values():
+            entry.channel.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_channel_pool():
+    """Pool de canales único por proceso."""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = ChannelPool()
+    return _default_pool
@@ -0,0 +1,135 @@
+# common/test_block_codec.py
+"""Compresión por bloque: ida y vuelta, negociación del nivel, frames y lecturas por rango."""
+import os
+
+import pytest
+
+from common import block_codec
+from common.block_codec import FrameTable, BlockDecoder, decode_block, encode_block, header_length, negotiate
+
+FRAME_SIZE = 4096
+
+
+def _codec(name, level=None, frame_size=FRAME_SIZE):
+    return negotiate(name, level, allowed=('zlib', 'lzma'), default='none', frame_size=frame_size)
+
+
+def _text(size):
+    line = b"linea de registro repetitiva del DataNode 0123456789\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def _read_range(stored, codec, raw_size, offset, length):
+    """Mismos pasos que DFSClient._read_compressed_range contra los bytes que serviría un DataNode."""
+    table = FrameTable.parse(stored[:header_length(raw_size, codec['frame_size'])], codec, raw_size)
+    first, last = table.span(offset, length)
+    start, end = table.stored_range(first, last)
+    return table.decode_range(stored[start:end], first, last, offset, length), end - start
+
+
+@pytest.mark.parametrize('name', ['zlib', 'lzma'])
+@pytest.mark.parametrize('size', [1, FRAME_SIZE - 1, FRAME_SIZE, 3 * FRAME_SIZE + 17])
+def test_round_trip(name, size):
+    data = _text(size)
+    codec = _codec(name)
+    stored = encode_block(data, codec)
+    assert decode_block(stored, codec, size) == data
+    if size > FRAME_SIZE:
+        assert len(stored) < size # Texto repetitivo: debe comprimir
+
+
+@pytest.mark.parametrize('name', ['zlib', 'lzma'])
+def test_empty_block(name):
+    codec = _codec(name)
+    stored = encode_block(b'', codec)
+    assert len(stored) == header_length(0, FRAME_SIZE) == block_codec.HEADER.size
+    assert decode_block(stored, codec, 0) == b''
+
+
+def test_negotiate_levels():
+    allowed = ('zlib', 'lzma')
+    assert negotiate('zlib', None, allowed, 'none', FRAME_SIZE)['level'] == 6
+    assert negotiate('zlib', 0, allowed, 'none', FRAME_SIZE)['level'] == 1 # Recortado al mínimo de zlib
+    assert negotiate('lzma', 0, allowed, 'none', FRAME_SIZE)['level'] == 0
+    assert negotiate('lzma', 42, allowed, 'none', FRAME_SIZE)['level'] == 9
+    # Códec no permitido: se usa el por defecto con su nivel por defecto, no el nivel pedido
+    assert negotiate('lzma', 1, ('zlib',), 'zlib', FRAME_SIZE) == {"name": 'zlib', "level": 6, "frame_size": FRAME_SIZE}
+    assert negotiate(None, 3, allowed, 'zlib', FRAME_SIZE)['level'] == 6
+    assert negotiate('none', None, allowed, 'zlib', FRAME_SIZE) is None
+    assert negotiate(None, None, allowed, 'none', FRAME_SIZE) is None
+    with pytest.raises(ValueError):
+        negotiate('brotli', None, allowed, 'none', FRAME_SIZE)
+    with pytest.raises(ValueError):
+        negotiate('zlib', None, allowed, 'none', 0)
+
+
+def test_level_is_recorded_and_changes_output():
+    data = _text(3 * FRAME_SIZE)
+    fast, best = encode_block(data, _codec('zlib', 1)), encode_block(data, _codec('zlib', 9))
+    assert block_codec.HEADER.unpack_from(fast)[2] == 1 and block_codec.HEADER.unpack_from(best)[2] == 9
+    assert decode_block(fast, _codec('zlib', 1), len(data)) == decode_block(best, _codec('zlib', 9), len(data)) == data
+
+
+def test_incompressible_frames_are_stored_raw():
+    data = os.urandom(FRAME_SIZE) + _text(FRAME_SIZE)
+    codec = _codec('zlib')
+    stored = encode_block(data, codec)
+    table = FrameTable.parse(stored, codec, len(data))
+    assert table.stored_raw == [True, False]
+    assert table.lengths[0] == FRAME_SIZE # No crece
+    assert decode_block(stored, codec, len(data)) == data
+
+
+@pytest.mark.parametrize('name', ['zlib', 'lzma'])
+@pytest.mark.parametrize('offset, length', [
+    (0, 10), # Dentro del primer frame
+    (FRAME_SIZE - 5, 10), # Cruza el límite entre frames
+    (FRAME_SIZE, FRAME_SIZE), # Exactamente un frame
+    (FRAME_SIZE - 1, 2 * FRAME_SIZE + 2), # Tres frames
+    (3 * FRAME_SIZE, 1000), # Último frame, más corto; el rango pasa del final
+])
+def test_range_reads_fetch_only_covering_frames(name, offset, length):
+    data = _text(3 * FRAME_SIZE + 100)
+    codec = _codec(name)
+    stored = encode_block(data, codec)
+    result, fetched = _read_range(stored, codec, len(data), offset, length)
+    assert result == data[offset:offset + length]
+    table = FrameTable.parse(stored, codec, len(data))
+    first, last = table.span(offset, length)
+    assert (first, last) == (offset // FRAME_SIZE, (min(len(data), offset + length) - 1) // FRAME_SIZE)
+    assert fetched == sum(table.lengths[first:last + 1])
+
+
+def test_streaming_decoder_yields_each_frame_in_order():
+    data = _text(2 * FRAME_SIZE + 1)
+    codec = _codec('lzma')
+    stored = encode_block(data, codec)
+    decoder = BlockDecoder(codec, len(data))
+    parts = []
+    for i in range(0, len(stored), 97): # Chunks del stream que no respetan los límites de frame
+        parts.extend(decoder.feed(stored[i:i + 97]))
+    decoder.finish()
+    assert [position for position, _ in parts] == [0, FRAME_SIZE, 2 * FRAME_SIZE]
+    assert b''.join(raw for _, raw in parts) == data
+
+
+def test_damaged_blocks_raise_value_error():
+    data = _text(2 * FRAME_SIZE)
+    codec = _codec('zlib')
+    stored = encode_block(data, codec)
+    with pytest.raises(ValueError): # Truncado
+        decode_block(stored[:-1], codec, len(data))
+    with pytest.raises(ValueError): # Bytes de más
+        decode_block(stored + b'x', codec, len(data))
+    with pytest.raises(ValueError): # Cabecera que no coincide con los metadatos
+        decode_block(stored, _codec('lzma'), len(data))
+    with pytest.raises(ValueError):
+        decode_block(stored, codec, len(data) + 1)
+    damaged = bytearray(stored)
+    damaged[header_length(len(data), FRAME_SIZE) + 3] ^= 0xFF
+    with pytest.raises(ValueError): # Frame dañado
+        decode_block(bytes(damaged), codec, len(data))
+    table = FrameTable.parse(stored, codec, len(data))
+    start, end = table.stored_range(0, 1)
+    with pytest.raises(ValueError): # Frames del rango truncados
+        table.decode_range(stored[start:end - 1], 0, 1, 0, 10)
@@ -14,46 +14,99 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'generated'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 import generated.dfs_pb2_grpc as dfs_pb2_grpc
-from services_datanode import DataNodeServiceImpl
+from services_datanode import DataNodeServiceImpl, active_transfers
 from common import config
+from common.grpc_pool import channel_options
 import block_manager
+import block_scrubber
+import segment_store
+from replication_worker import ReplicationWorker
+from block_report import BlockReportTracker
+from block_cache import BlockCache
 
 admin_app_dn = Flask(__name__) # Diferente de la app del NameNode
+hot_block_cache = None # BlockCache si se activó con --block_cache_mb
+
+@admin_app_dn.route('/block_cache/stats', methods=['GET'])
+def block_cache_stats_route():
+    if hot_block_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(hot_block_cache.get_stats(), enabled=True)), 200
 
 # --- Heartbeat ---
-def send_heartbeat(datanode_id, datanode_grpc_addr, datanode_flask_addr, namenode_url):
-    while True:
-        try:
-            payload = {"datanode_id": datanode_id} # Simplificado, podría incluir reporte de bloques, espacio, etc.
-            # El endpoint de heartbeat en NameNode también puede manejar re-registro/actualización de IP
-            reg_payload = {
-                "datanode_id": datanode_id,
-                "grpc_address": datanode_grpc_addr,
-                "flask_address": datanode_flask_addr
-            }
-            # Primero intentar registrar (es idempotente en el NameNode)
-            try:
-                response = requests.post(f"{namenode_url}/datanode/register", json=reg_payload, timeout=5)
-                response.raise_for_status()
-                # logging.info(f"Heartbeat/Register to NameNode successful: {response.json().get('message')}")
-            except requests.exceptions.RequestException as e_reg:
-                 logging.warning(f"Failed to send register/heartbeat (via register endpoint) to NameNode: {e_reg}")
+def _delete_blocks(datanode_id, block_ids, block_dir_instance):
+    """Elimina los bloques indicados por el NameNode. Devuelve los ya eliminados (o inexistentes) para confirmar."""
+    done = []
+    for block_id in block_ids or []:
+        success, message = block_manager.delete_block_data(block_id, block_dir_instance)
+        if success or "no encontrado" in message.lower(): # Igual que DeleteBlock: inexistente cuenta como eliminado
+            done.append(block_id)
+        else:
+            logging.warning(f"[{datanode_id}] No se pudo eliminar el bloque {block_id}: {message}")
+    if done: logging.info(f"[{datanode_id}] {len(done)} bloques eliminados por indicación del NameNode")
+    return done
+
+def _compact_containers(datanode_id, compaction_tasks, block_dir_instance):
+    """Reescribe contenedores sin sus registros borrados; el NameNode se entera por el reporte incremental."""
+    for task in compaction_tasks or []:
+        success, message = block_manager.compact_container(task['container_id'], task['new_container_id'],
+                                                           task['records'], block_dir_instance)
+        if not success:
+            logging.warning(f"[{datanode_id}] No se pudo compactar el contenedor {task['container_id']}: {message}")
 
+def send_full_block_report(datanode_id, namenode_url, report_tracker):
+    block_ids = report_tracker.full_report()
+    response = requests.post(f"{namenode_url}/datanode/block_report", json={"datanode_id": datanode_id, "block_ids": block_ids}, timeout=30)
+    response.raise_for_status()
+    report_tracker.full_report_needed = False
+    logging.info(f"Reporte completo de bloques enviado: {response.json().get('message')}")
+    _delete_blocks(datanode_id, response.json().get('deletion_tasks'), report_tracker.block_dir)
 
-            # Enviar heartbeat regular
-            hb_response = requests.post(f"{namenode_url}/datanode/heartbeat", json={"datanode_id": datanode_id})
+def send_heartbeat(datanode_id, datanode_grpc_addr, datanode_flask_addr, namenode_url, replication_worker, report_tracker):
+    deletion_results = [] # Eliminaciones hechas, a confirmar en el próximo heartbeat exitoso
+    while True:
+        replication_results = replication_worker.drain_results()
+        block_report = None
+        delivered = False
+        try:
+            block_report = report_tracker.drain()
+            storage = dict(block_manager.storage_stats(report_tracker.block_dir), active_transfers=active_transfers.value)
+            # Registro y heartbeat en un solo mensaje: el NameNode registra (o actualiza direcciones) si hace falta
+            payload = {"datanode_id": datanode_id, "grpc_address": datanode_grpc_addr, "flask_address": datanode_flask_addr,
+                       "replication_results": replication_results, "block_report": block_report,
+                       "deletion_results": deletion_results, "storage": storage}
+            hb_response = requests.post(f"{namenode_url}/datanode/heartbeat", json=payload, timeout=10)
             hb_response.raise_for_status()
-            logging.info(f"Heartbeat to NameNode successful: {hb_response.json().get('message')}")
-            # Aquí se podrían procesar tareas devueltas por el NameNode
+            delivered = True # El NameNode ya aplicó resultados y reporte: un error posterior no debe reenviarlos
+            hb_data = hb_response.json()
+            deletion_results = []
+            logging.info(f"Heartbeat to NameNode successful: {hb_data.get('message')}")
+            tasks = hb_data.get('tasks') or {}
+            replication_tasks = tasks.get('replication_tasks')
+            if replication_tasks:
+                logging.info(f"Received {len(replication_tasks)} re-replication tasks")
+                replication_worker.submit(replication_tasks)
+            deletion_results = _delete_blocks(datanode_id, tasks.get('deletion_tasks'), report_tracker.block_dir)
+            _compact_containers(datanode_id, tasks.get('compaction_tasks'), report_tracker.block_dir)
+            if tasks.get('full_block_report_required'):
+                report_tracker.full_report_needed = True # P. ej. el NameNode se reinició
         except requests.exceptions.RequestException as e:
             logging.error(f"Failed to send heartbeat to NameNode: {e}")
         except Exception as e_gen:
             logging.error(f"Unexpected error in heartbeat thread: {e_gen}")
+        if not delivered: # Fallo de red o inesperado: lo ya drenado se reintenta en el próximo heartbeat
+            replication_worker.restore_results(replication_results)
+            report_tracker.restore(block_report)
+        if report_tracker.full_report_needed: # Tras el heartbeat, que es el que registra al nodo
+            try:
+                send_full_block_report(datanode_id, namenode_url, report_tracker)
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Failed to send full block report to NameNode: {e}")
         time.sleep(config.HEARTBEAT_INTERVAL_SEC)
 
-def serve_grpc_dn(datanode_id, grpc_port, block_dir_instance):
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    service_impl = DataNodeServiceImpl(datanode_id, block_dir_instance)
+def serve_grpc_dn(datanode_id, grpc_port, block_dir_instance, block_cache=None):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=channel_options())
+    service_impl = DataNodeServiceImpl(datanode_id, block_dir_instance, block_cache)
     dfs_pb2_grpc.add_DataNodeServiceServicer_to_server(service_impl, server)
     listen_addr = f"{config.DATANODE_HOST}:{grpc_port}"
     server.add_insecure_port(listen_addr)
@@ -74,12 +127,20 @@ if __name__ == '__main__':
     parser.add_argument("--flask_port", type=int, required=True, help="Puerto Flask para admin.")
     parser.add_argument("--namenode_url", default=config.NAMENODE_URL, help="URL del NameNode.")
     parser.add_argument("--blocks_dir", default=None, help="Directorio para bloques.")
+    parser.add_argument("--block_store", choices=block_manager.BLOCK_STORE_BACKENDS, default=config.DATANODE_BLOCK_STORE,
+                        help="Backend de bloques: 'files' (un archivo por bloque) o 'segments' (log-structured).")
+    parser.add_argument("--fsync_policy", choices=block_manager.FSYNC_POLICIES, default=config.DATANODE_FSYNC_POLICY,
+                        help="Durabilidad de los bloques escritos: 'none', 'close' (fsync por bloque) o 'group' (fsync agrupado).")
+    parser.add_argument("--block_cache_mb", type=int, default=config.DATANODE_BLOCK_CACHE_BYTES // (1024 * 1024),
+                        help="Memoria para la caché de bloques calientes, en MB (0 la desactiva).")
+    parser.add_argument("--cache_on_write", action="store_true", help="Cachear también los bloques recién escritos.")
+    parser.add_argument("--scrub_bytes_per_sec", type=int, default=config.DATANODE_SCRUB_BYTES_PER_SEC, help="Límite de E/S del scrubber de bloques (0 lo desactiva).")
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - {args.id} - %(levelname)s - %(message)s')
     
     instance_block_dir = args.blocks_dir or os.path.join(os.getcwd(), f"{config.BLOCKS_DIR_DEFAULT}_{args.id}")
-    block_manager.setup_block_storage(instance_block_dir)
+    block_store = block_manager.setup_block_storage(instance_block_dir, args.block_store, args.fsync_policy)
 
     # Para EC2, obtener la IP pública o privada según sea necesario para la comunicación.
     # DATANODE_PUBLIC_IP se usará para registrarse con el NameNode.
@@ -90,12 +151,26 @@ if __name__ == '__main__':
 
     # 1. Registrar con NameNode (mejorado en la función de heartbeat)
     # 2. Iniciar Hilo de Heartbeat
-    hb_thread = threading.Thread(target=send_heartbeat, args=(args.id, datanode_grpc_public_address, datanode_flask_public_address, args.namenode_url), daemon=True)
+    replication_worker = ReplicationWorker(args.id, instance_block_dir)
+    # Altas/bajas de bloques se acumulan y viajan en el heartbeat; el reporte completo solo al arrancar o si lo pide el NameNode
+    report_tracker = BlockReportTracker(instance_block_dir)
+    block_manager.add_block_listener(report_tracker)
+    hb_thread = threading.Thread(target=send_heartbeat, args=(args.id, datanode_grpc_public_address, datanode_flask_public_address, args.namenode_url, replication_worker, report_tracker), daemon=True)
     hb_thread.start()
+
+    # Verificación periódica de checksums de los bloques almacenados, con E/S limitada
+    if args.scrub_bytes_per_sec > 0:
+        block_scrubber.start_scrubber(args.id, instance_block_dir, args.scrub_bytes_per_sec)
+    if args.block_store == 'segments': # Recupera el espacio de los bloques borrados
+        segment_store.start_compactor(args.id, block_store)
     
-    # 3. Iniciar Servidor Flask Admin (opcional, si se necesitan comandos REST del NameNode al DataNode)
-    # flask_thread_dn = threading.Thread(target=serve_flask_dn, args=(args.id, args.flask_port), daemon=True)
-    # flask_thread_dn.start() # Por ahora, la app de flask no tiene rutas, así que no es crítico
+    if args.block_cache_mb > 0:
+        hot_block_cache = BlockCache(args.block_cache_mb * 1024 * 1024, args.cache_on_write)
+        block_manager.add_block_listener(hot_block_cache) # Altas y bajas invalidan la copia en memoria
+
+    # 3. Iniciar Servidor Flask Admin: por ahora solo expone las estadísticas de la caché de bloques
+    flask_thread_dn = threading.Thread(target=serve_flask_dn, args=(args.id, args.flask_port), daemon=True)
+    flask_thread_dn.start()
 
     # 4. Iniciar Servidor gRPC (bloquea el hilo principal aquí)
-    serve_grpc_dn(args.id, args.grpc_port, instance_block_dir)
\ No newline at end of file
+    serve_grpc_dn(args.id, args.grpc_port, instance_block_dir, hot_block_cache)
\ No newline at end of file
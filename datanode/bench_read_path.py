@@ -0,0 +1,43 @@
+# datanode/bench_read_path.py
+"""Micro-benchmark del camino de lectura de ReadBlock: generador de 8 KB vs. mmap con chunks grandes.
+
+Mide CPU por byte servido (incluida la copia al payload del mensaje). Uso: python bench_read_path.py [--block_mb N]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import block_manager
+
+
+def _measure(label, chunk_iter_factory, block_size, rounds):
+    messages = 0
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for _ in range(rounds):
+        for chunk in chunk_iter_factory():
+            payload = chunk.tobytes() if isinstance(chunk, memoryview) else chunk # Lo que recibe el protobuf
+            messages += 1
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    total_bytes = block_size * rounds
+    print(f"{label:<28}{messages // rounds:>10}{cpu * 1e9 / total_bytes:>14.3f}{total_bytes / wall / 2**20:>12.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del camino de lectura de bloques.")
+    parser.add_argument("--block_mb", type=int, default=64, help="Tamaño del bloque de prueba en MB.")
+    parser.add_argument("--rounds", type=int, default=10, help="Lecturas completas por variante.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as block_dir:
+        block_size = args.block_mb * 1024 * 1024
+        with open(block_manager.get_block_path("bench", block_dir), 'wb') as f:
+            f.write(os.urandom(block_size))
+
+        print(f"{'variante':<28}{'msgs/bloque':>10}{'ns CPU/byte':>14}{'MB/s':>12}")
+        _measure("read_block_chunks 8 KB", lambda: block_manager.read_block_chunks("bench", block_dir), block_size, args.rounds)
+        for chunk_kb in (256, 1024, 4096):
+            _measure(f"read_block_views {chunk_kb} KB",
+                     lambda: block_manager.read_block_views("bench", block_dir, chunk_kb * 1024), block_size, args.rounds)
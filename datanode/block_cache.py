@@ -0,0 +1,153 @@
+# datanode/block_cache.py
+"""Caché LRU en memoria de bloques calientes del DataNode, acotada por un presupuesto en bytes.
+
+Se llena con las lecturas completas de ReadBlock (copiando cada chunk mientras se sirve, sin releer el
+disco) y, opcionalmente, con los bloques recién escritos. Los aciertos se sirven como slices memoryview
+de los bytes en caché, igual que el camino mmap. Las altas y bajas de block_manager la invalidan.
+Los contenedores de archivos pequeños no se cachean: sus registros se escriben sin notificar cada cambio.
+"""
+import threading
+from collections import OrderedDict
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common.container_format import is_container
+import block_manager
+from block_manager import BlockWriter
+
+
+class _CachingWriter(BlockWriter):
+    """Envuelve un BlockWriter y, si el bloque se confirma y cabe en la caché, lo inserta."""
+
+    def __init__(self, cache, block_id, writer):
+        self._cache = cache
+        self._block_id = block_id
+        self._writer = writer
+        self._buffer = bytearray()
+
+    @property
+    def size(self):
+        return self._writer.size
+
+    def write(self, data):
+        success, err = self._writer.write(data)
+        if success and self._buffer is not None:
+            if len(self._buffer) + len(data) > self._cache.max_bytes:
+                self._buffer = None # No cabría: dejar de acumular
+            else:
+                self._buffer += data
+        return success, err
+
+    def commit(self):
+        success, err = self._writer.commit() # Notifica el alta, que invalida la versión anterior
+        self.committed = self._writer.committed
+        if success and self._buffer is not None:
+            self._cache.put(self._block_id, bytes(self._buffer))
+        self._buffer = None
+        return success, err
+
+    def abort(self):
+        self._buffer = None
+        self._writer.abort()
+
+
+class BlockCache:
+    """LRU de bloques completos; `max_bytes` acota la suma de sus tamaños. Segura entre hilos."""
+
+    def __init__(self, max_bytes, cache_on_write=False):
+        self.max_bytes = max_bytes
+        self.cache_on_write = cache_on_write
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # block_id -> bytes; el final es el más reciente
+        self._loading = {} # block_id -> token de la lectura que llenará la entrada
+        self.used_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, block_id):
+        with self._lock:
+            data = self._entries.get(block_id)
+            if data is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(block_id)
+            self.stats["hits"] += 1
+            return data
+
+    def put(self, block_id, data, token=None):
+        """Inserta un bloque. Con `token`, solo si no hubo invalidación desde que empezó su lectura."""
+        if len(data) > self.max_bytes or is_container(block_id):
+            return False
+        with self._lock:
+            if token is not None and self._loading.get(block_id) is not token:
+                return False
+            self._loading.pop(block_id, None)
+            self._remove_locked(block_id)
+            while self.used_bytes + len(data) > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.used_bytes -= len(evicted)
+                self.stats["evictions"] += 1
+            self._entries[block_id] = data
+            self.used_bytes += len(data)
+            return True
+
+    def _remove_locked(self, block_id):
+        data = self._entries.pop(block_id, None)
+        if data is not None:
+            self.used_bytes -= len(data)
+        return data is not None
+
+    def invalidate(self, block_id):
+        with self._lock:
+            self._loading.pop(block_id, None) # Una lectura en curso ya no debe insertar su copia
+            if self._remove_locked(block_id):
+                self.stats["invalidations"] += 1
+
+    # Observador de block_manager: un alta puede reemplazar el contenido y una baja lo elimina
+    block_added = invalidate
+    block_removed = invalidate
+
+    def read_views(self, block_id, block_dir_instance, chunk_size, offset=0, length=0):
+        """Como block_manager.read_block_views, sirviendo desde la caché si el bloque está en ella."""
+        data = None if is_container(block_id) else self.get(block_id)
+        if data is not None:
+            end = block_manager._read_range(block_id, len(data), offset, length)
+            with memoryview(data) as view:
+                for chunk_start in range(offset, end, chunk_size):
+                    with view[chunk_start:min(chunk_start + chunk_size, end)] as chunk:
+                        yield chunk
+            return
+        views = block_manager.read_block_views(block_id, block_dir_instance, chunk_size, offset, length)
+        if offset or length or is_container(block_id): # Solo las lecturas completas llenan la caché
+            yield from views
+            return
+        token = object()
+        with self._lock:
+            self._loading[block_id] = token
+        buffer = bytearray()
+        completed = False
+        try:
+            for chunk in views:
+                if buffer is not None:
+                    if len(buffer) + len(chunk) > self.max_bytes:
+                        buffer = None
+                    else:
+                        buffer += chunk # Copia antes de ceder la vista: deja de ser válida en el siguiente chunk
+                yield chunk
+            completed = True
+        finally:
+            if not completed or buffer is None: # Abandonada, fallida o demasiado grande
+                with self._lock:
+                    if self._loading.get(block_id) is token:
+                        del self._loading[block_id]
+        if buffer is not None:
+            self.put(block_id, bytes(buffer), token)
+
+    def wrap_writer(self, block_id, writer):
+        if not self.cache_on_write or is_container(block_id):
+            return writer
+        return _CachingWriter(self, block_id, writer)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), used_bytes=self.used_bytes, max_bytes=self.max_bytes)
@@ -1,62 +1,552 @@
 # datanode/block_manager.py
+"""Almacenamiento de bloques del DataNode.
+
+Las funciones de este módulo son la interfaz que usan el servicio gRPC, la replicación, el scrubber y
+el reporte de bloques; cada una delega en el almacén (BlockStore) registrado para el directorio:
+FileBlockStore (un archivo por bloque) o SegmentBlockStore (log-structured, ver segment_store.py).
+"""
+import abc
 import os
 import logging
+import mmap
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from common import config
+from common.container_format import is_container
 
 logger = logging.getLogger(__name__)
 
-def setup_block_storage(datanode_specific_block_dir):
-    if not os.path.exists(datanode_specific_block_dir):
-        os.makedirs(datanode_specific_block_dir)
-        logger.info(f"Directorio de almacenamiento de bloques creado en {datanode_specific_block_dir}")
+# Sidecar de checksums: cabecera (magia, bytes por checksum) + un CRC32 little-endian por unidad
+CHECKSUM_SUFFIX = '.crc'
+TMP_SUFFIX = '.tmp' # Bloques en construcción; no se reportan
+CORRUPT_SUBDIR = 'corrupt'
+_CRC_HEADER = struct.Struct('<4sI')
+_CRC_MAGIC = b'DFSC'
+_CRC_ENTRY = struct.Struct('<I')
+
+BLOCK_STORE_BACKENDS = ('files', 'segments')
+FSYNC_POLICIES = ('none', 'close', 'group')
+
+class ChecksumError(IOError):
+    pass
+
+# Observadores de altas/bajas de bloques (p. ej. el reporte incremental al NameNode)
+_block_listeners = []
+
+def add_block_listener(listener):
+    """listener.block_added(block_id) / listener.block_removed(block_id)."""
+    _block_listeners.append(listener)
+
+def _notify(event, block_id):
+    for listener in _block_listeners:
+        getattr(listener, event)(block_id)
 
 def get_block_path(block_id, block_dir_instance):
     return os.path.join(block_dir_instance, str(block_id))
 
-def write_block_chunk(block_id, chunk_data, is_first_chunk, block_dir_instance):
-    path = get_block_path(block_id, block_dir_instance)
-    mode = 'wb' if is_first_chunk else 'ab'
+def get_checksum_path(block_id, block_dir_instance):
+    return get_block_path(block_id, block_dir_instance) + CHECKSUM_SUFFIX
+
+class _ChecksumBuilder:
+    """CRC32 por unidad de `bytes_per_checksum`, calculados en línea a medida que llegan los chunks.
+
+    La última unidad puede quedar parcial; se continúa de forma incremental con zlib.crc32.
+    """
+
+    def __init__(self, bytes_per_checksum=None):
+        self.bytes_per_checksum = bytes_per_checksum or config.DATANODE_BYTES_PER_CHECKSUM
+        self.crcs = []
+        self._partial = 0 # Bytes ya cubiertos por la última unidad, si quedó incompleta
+
+    def update(self, data):
+        data = memoryview(data)
+        pos = 0
+        if self._partial: # Completar la unidad parcial que quedó al final del chunk anterior
+            pos = min(self.bytes_per_checksum - self._partial, len(data))
+            self.crcs[-1] = zlib.crc32(data[:pos], self.crcs[-1])
+            self._partial = (self._partial + pos) % self.bytes_per_checksum
+        for i in range(pos, len(data), self.bytes_per_checksum):
+            unit = data[i:i + self.bytes_per_checksum]
+            self.crcs.append(zlib.crc32(unit))
+            self._partial = len(unit) % self.bytes_per_checksum
+
+    def sidecar(self):
+        return _CRC_HEADER.pack(_CRC_MAGIC, self.bytes_per_checksum) + struct.pack(f'<{len(self.crcs)}I', *self.crcs)
+
+def load_checksums(block_id, block_dir_instance):
+    """Devuelve (bytes_por_checksum, crcs) o None si el bloque no tiene sidecar."""
     try:
-        with open(path, mode) as f:
-            f.write(chunk_data)
+        with open(get_checksum_path(block_id, block_dir_instance), 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    magic, bytes_per_checksum = _CRC_HEADER.unpack_from(raw)
+    if magic != _CRC_MAGIC:
+        raise ChecksumError(f"Sidecar de checksums inválido para el bloque {block_id}")
+    count = (len(raw) - _CRC_HEADER.size) // _CRC_ENTRY.size
+    return bytes_per_checksum, struct.unpack_from(f'<{count}I', raw, _CRC_HEADER.size)
+
+def _verify_units(view, block_id, checksums, start, end, size):
+    """Verifica las unidades de checksum que cubren [start, end). Devuelve hasta dónde quedó verificado."""
+    bytes_per_checksum, crcs = checksums
+    unit = start // bytes_per_checksum
+    unit_start = unit * bytes_per_checksum
+    while unit_start < end:
+        unit_end = min(unit_start + bytes_per_checksum, size)
+        with view[unit_start:unit_end] as unit_view:
+            if unit >= len(crcs) or zlib.crc32(unit_view) != crcs[unit]:
+                raise ChecksumError(f"Checksum inválido en bloque {block_id}, bytes [{unit_start}, {unit_end})")
+        unit += 1
+        unit_start = unit_end
+    return unit_start
+
+def _serve_views(view, block_id, checksums, chunk_size, offset, end):
+    """Entrega slices de `view` (el bloque completo) entre offset y end, verificando los CRC por delante."""
+    size = len(view)
+    verified_end = offset
+    for chunk_start in range(offset, end, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, end)
+        if checksums and verified_end < chunk_end: # Verificación incremental antes de servir el chunk
+            verified_end = _verify_units(view, block_id, checksums, verified_end, chunk_end, size)
+        chunk = view[chunk_start:chunk_end]
+        try:
+            yield chunk
+        finally:
+            chunk.release() # Liberar la vista antes de cerrar el mmap
+
+def _read_range(block_id, size, offset, length):
+    """Valida offset/length contra el tamaño del bloque y devuelve el fin del rango."""
+    if offset > size:
+        raise ValueError(f"Offset {offset} fuera del bloque {block_id} (tamaño {size})")
+    return min(size, offset + length) if length else size
+
+def clamp_read_chunk_size(requested):
+    """Ajusta el tamaño de chunk negociado al rango permitido por el DataNode."""
+    if not requested:
+        return config.DATANODE_READ_CHUNK_BYTES
+    return max(config.DATANODE_READ_CHUNK_MIN_BYTES, min(requested, config.DATANODE_READ_CHUNK_MAX_BYTES))
+
+def storage_stats(block_dir_instance):
+    """Capacidad y espacio usado del disco que aloja los bloques, para la colocación en el NameNode."""
+    usage = shutil.disk_usage(block_dir_instance)
+    return {"capacity": usage.total, "used": usage.total - usage.free}
+
+
+class GroupSync:
+    """fsync agrupado: los escritores concurrentes esperan al siguiente tic y un hilo sincroniza
+    una sola vez cada archivo pendiente (varios bloques en el mismo segmento cuestan un fsync)."""
+
+    def __init__(self, interval_sec):
+        self.interval_sec = interval_sec
+        self._cond = threading.Condition()
+        self._waiting = [] # [fd, evento, error]
+        threading.Thread(target=self._run, daemon=True, name="group-fsync").start()
+
+    def sync(self, fd):
+        """Bloquea hasta que los datos escritos en fd son durables. Propaga el error del fsync."""
+        item = [fd, threading.Event(), None]
+        with self._cond:
+            self._waiting.append(item)
+            self._cond.notify()
+        item[1].wait()
+        if item[2] is not None:
+            raise item[2]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._waiting:
+                    self._cond.wait()
+            time.sleep(self.interval_sec) # Acumular los escritores que confirman en este intervalo
+            with self._cond:
+                batch, self._waiting = self._waiting, []
+            results = {} # (dispositivo, inodo) -> error; fsync sincroniza el archivo sea cual sea el descriptor
+            for item in batch:
+                try:
+                    st = os.fstat(item[0])
+                    key = (st.st_dev, st.st_ino)
+                    if key not in results:
+                        try:
+                            os.fsync(item[0])
+                            results[key] = None
+                        except OSError as e:
+                            results[key] = e
+                    item[2] = results[key]
+                except OSError as e:
+                    item[2] = e
+                item[1].set()
+
+_group_sync = None
+_group_sync_lock = threading.Lock()
+
+def _get_group_sync():
+    global _group_sync
+    with _group_sync_lock:
+        if _group_sync is None:
+            _group_sync = GroupSync(config.DATANODE_GROUP_FSYNC_INTERVAL_MS / 1000)
+        return _group_sync
+
+
+class BlockWriter(abc.ABC):
+    """Escritura de un bloque por streaming, abierta durante todo el stream.
+
+    write(datos) y commit() devuelven (ok, error); el bloque solo se ve (y se reporta) tras commit().
+    Usado como context manager, aborta si se sale sin confirmar (p. ej. el stream se cortó).
+    """
+    committed = False
+
+    @abc.abstractmethod
+    def write(self, data): ...
+    @abc.abstractmethod
+    def commit(self): ...
+    @abc.abstractmethod
+    def abort(self): ...
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.committed:
+            self.abort()
+
+
+class _FileBlockWriter(BlockWriter):
+    """Escribe en un temporal con un solo open y lo renombra al nombre final al confirmar."""
+
+    def __init__(self, store, block_id):
+        self.store = store
+        self.block_id = block_id
+        self.path = get_block_path(block_id, store.block_dir)
+        fd, self.tmp_path = tempfile.mkstemp(dir=store.block_dir, prefix=f"{block_id}.", suffix=TMP_SUFFIX)
+        self._f = os.fdopen(fd, 'wb')
+        self._checksums = None if is_container(block_id) else _ChecksumBuilder() # Los contenedores se verifican por registro
+        self.size = 0
+
+    def write(self, data):
+        try:
+            self._f.write(data)
+            if self._checksums: self._checksums.update(data) # En línea, sin segunda pasada
+            self.size += len(data)
+            return True, None
+        except Exception as e:
+            logger.error(f"Error escribiendo chunk al bloque {self.block_id}: {e}")
+            return False, str(e)
+
+    def commit(self):
+        try:
+            self._f.flush()
+            self.store._sync(self._f.fileno())
+            self._f.close()
+            if self._checksums: # El sidecar queda en su sitio antes que el bloque: un bloque visible siempre lo tiene
+                crc_tmp = self.tmp_path[:-len(TMP_SUFFIX)] + CHECKSUM_SUFFIX + TMP_SUFFIX
+                with open(crc_tmp, 'wb') as f:
+                    f.write(self._checksums.sidecar())
+                    f.flush()
+                    self.store._sync(f.fileno())
+                os.replace(crc_tmp, get_checksum_path(self.block_id, self.store.block_dir))
+            os.replace(self.tmp_path, self.path)
+            self.store._sync_dir()
+        except Exception as e:
+            logger.error(f"Error confirmando el bloque {self.block_id}: {e}")
+            self.abort()
+            return False, str(e)
+        self.committed = True
+        _notify('block_added', self.block_id)
         return True, None
-    except Exception as e:
-        logger.error(f"Error escribiendo chunk al bloque {block_id}: {e}")
-        return False, str(e)
+
+    def abort(self):
+        self._f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class BlockStore(abc.ABC):
+    """Interfaz de un almacén de bloques. Las escrituras devuelven (ok, mensaje) como el resto del DataNode.
+
+    open_writer: escritura por streaming (ver BlockWriter). store: bloque completo en memoria.
+    read_views: slices memoryview de un rango, verificando CRC. Los contenedores de archivos pequeños
+    (escritos por registros en su offset) usan write_container_record/compact_container.
+    fsync_policy: 'none' (el sistema decide), 'close' (fsync al confirmar cada bloque) o 'group'
+    (fsync compartido por los escritores concurrentes cada DATANODE_GROUP_FSYNC_INTERVAL_MS).
+    """
+    name = None
+
+    def __init__(self, block_dir, fsync_policy=None):
+        self.block_dir = block_dir
+        self.fsync_policy = fsync_policy or config.DATANODE_FSYNC_POLICY
+        if self.fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync desconocida: {self.fsync_policy}")
+
+    def _sync(self, fd):
+        if self.fsync_policy == 'close':
+            os.fsync(fd)
+        elif self.fsync_policy == 'group':
+            _get_group_sync().sync(fd)
+
+    def _sync_dir(self):
+        """Hace durables los renombrados en el directorio de bloques (según la política)."""
+        if self.fsync_policy == 'none':
+            return
+        fd = os.open(self.block_dir, os.O_RDONLY)
+        try:
+            self._sync(fd)
+        finally:
+            os.close(fd)
+
+    @abc.abstractmethod
+    def open_writer(self, block_id): ...
+    @abc.abstractmethod
+    def read_views(self, block_id, chunk_size, offset=0, length=0): ...
+    @abc.abstractmethod
+    def delete(self, block_id): ...
+    @abc.abstractmethod
+    def verify(self, block_id, throttle=None): ...
+    @abc.abstractmethod
+    def quarantine(self, block_id): ...
+    @abc.abstractmethod
+    def list_block_ids(self): ...
+    @abc.abstractmethod
+    def write_container_record(self, block_id, offset, data): ...
+    @abc.abstractmethod
+    def compact_container(self, block_id, new_block_id, records): ...
+
+    def store(self, block_id, data):
+        with self.open_writer(block_id) as writer:
+            success, err = writer.write(data)
+            if success:
+                success, err = writer.commit()
+        if not success:
+            logger.error(f"Error almacenando bloque {block_id}: {err}")
+            return False, err
+        logger.info(f"Bloque {block_id} almacenado (replicado) en {self.block_dir}, tamaño: {len(data)}")
+        return True, "Bloque almacenado."
+
+    def read_chunks(self, block_id, chunk_size=8192):
+        for view in self.read_views(block_id, chunk_size):
+            yield bytes(view)
+
+
+class FileBlockStore(BlockStore):
+    """Un archivo por bloque (más su sidecar de CRC) en un único directorio."""
+    name = 'files'
+
+    def __init__(self, block_dir, fsync_policy=None):
+        super().__init__(block_dir, fsync_policy)
+        with os.scandir(block_dir) as entries: # Temporales de escrituras que no llegaron a confirmarse
+            stale = [e.path for e in entries if e.is_file() and e.name.endswith(TMP_SUFFIX)]
+        for path in stale:
+            os.remove(path)
+        if stale:
+            logger.info(f"Eliminados {len(stale)} temporales de escrituras incompletas en {block_dir}")
+
+    def open_writer(self, block_id):
+        return _FileBlockWriter(self, block_id)
+
+    def read_chunks(self, block_id, chunk_size=8192):
+        path = get_block_path(block_id, self.block_dir)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Bloque {block_id} no encontrado en {path}")
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk: break
+                yield chunk
+
+    def read_views(self, block_id, chunk_size, offset=0, length=0):
+        path = get_block_path(block_id, self.block_dir)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Bloque {block_id} no encontrado en {path}")
+        checksums = load_checksums(block_id, self.block_dir)
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            end = _read_range(block_id, size, offset, length)
+            if end == offset: # Rango vacío; además mmap no admite archivos vacíos
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mm) as view:
+                    yield from _serve_views(view, block_id, checksums, chunk_size, offset, end)
+
+    def verify(self, block_id, throttle=None):
+        checksums = load_checksums(block_id, self.block_dir)
+        if checksums is None:
+            return True, "Bloque sin checksums."
+        bytes_per_checksum, crcs = checksums
+        with open(get_block_path(block_id, self.block_dir), 'rb') as f:
+            unit = 0
+            while True:
+                data = f.read(bytes_per_checksum)
+                if not data: break
+                if unit >= len(crcs) or zlib.crc32(data) != crcs[unit]:
+                    return False, f"Checksum inválido en la unidad {unit}."
+                unit += 1
+                if throttle: throttle(len(data))
+        if unit != len(crcs):
+            return False, f"Bloque truncado: {unit} de {len(crcs)} unidades."
+        return True, "Bloque íntegro."
+
+    def quarantine(self, block_id):
+        corrupt_dir = os.path.join(self.block_dir, CORRUPT_SUBDIR)
+        os.makedirs(corrupt_dir, exist_ok=True)
+        for src in (get_block_path(block_id, self.block_dir), get_checksum_path(block_id, self.block_dir)):
+            if os.path.exists(src):
+                os.replace(src, os.path.join(corrupt_dir, os.path.basename(src)))
+        _notify('block_removed', block_id)
+        logger.warning(f"Bloque {block_id} en cuarentena por corrupción.")
+
+    def list_block_ids(self):
+        with os.scandir(self.block_dir) as entries:
+            return [e.name for e in entries if e.is_file() and not e.name.endswith((CHECKSUM_SUFFIX, TMP_SUFFIX))]
+
+    def write_container_record(self, block_id, offset, data):
+        path = get_block_path(block_id, self.block_dir)
+        try:
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+                created = True
+            except FileExistsError:
+                fd = os.open(path, os.O_WRONLY)
+                created = False
+            try:
+                view = memoryview(data)
+                while view:
+                    written = os.pwrite(fd, view, offset)
+                    view, offset = view[written:], offset + written
+            finally:
+                os.close(fd)
+            if created: # Solo el alta del contenedor cambia lo que el NameNode sabe de este nodo
+                _notify('block_added', block_id)
+            return True, None
+        except Exception as e:
+            logger.error(f"Error escribiendo registro en el contenedor {block_id}: {e}")
+            return False, str(e)
+
+    def compact_container(self, block_id, new_block_id, records):
+        src = get_block_path(block_id, self.block_dir)
+        dst = get_block_path(new_block_id, self.block_dir)
+        tmp = dst + TMP_SUFFIX
+        try:
+            with open(src, 'rb') as f_in, open(tmp, 'wb') as f_out:
+                for offset, length in records:
+                    data = os.pread(f_in.fileno(), length, offset)
+                    f_out.write(data)
+                    if len(data) < length:
+                        f_out.write(bytes(length - len(data)))
+                f_out.flush()
+                os.fsync(f_out.fileno())
+            os.replace(tmp, dst) # El contenedor nuevo solo aparece (y se reporta) completo
+            _notify('block_added', new_block_id)
+            logger.info(f"Contenedor {block_id} compactado en {new_block_id}: {len(records)} registros.")
+            return True, "Contenedor compactado."
+        except FileNotFoundError:
+            return False, f"Contenedor {block_id} no encontrado."
+        except Exception as e:
+            logger.error(f"Error compactando el contenedor {block_id}: {e}")
+            if os.path.exists(tmp): os.remove(tmp)
+            return False, str(e)
+
+    def delete(self, block_id):
+        path = get_block_path(block_id, self.block_dir)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                crc_path = get_checksum_path(block_id, self.block_dir)
+                if os.path.exists(crc_path): os.remove(crc_path)
+                _notify('block_removed', block_id)
+                logger.info(f"Bloque {block_id} eliminado de {path}.")
+                return True, "Bloque eliminado."
+            else:
+                logger.warning(f"Bloque {block_id} no encontrado para eliminar en {path}.")
+                return False, "Bloque no encontrado para eliminar." # NameNode puede tratar esto como éxito
+        except Exception as e:
+            logger.error(f"Error eliminando bloque {block_id}: {e}")
+            return False, str(e)
+
+
+# Un almacén por directorio de bloques; el primero que lo configura elige el backend
+_stores = {}
+_stores_lock = threading.Lock()
+
+def _create_store(backend, block_dir, fsync_policy):
+    if backend == 'files':
+        return FileBlockStore(block_dir, fsync_policy)
+    if backend == 'segments':
+        from segment_store import SegmentBlockStore # Importación diferida: segment_store depende de este módulo
+        return SegmentBlockStore(block_dir, fsync_policy)
+    raise ValueError(f"Backend de almacenamiento de bloques desconocido: {backend}")
+
+def setup_block_storage(datanode_specific_block_dir, backend=None, fsync_policy=None):
+    """Crea el directorio y el almacén de bloques (backend 'files' o 'segments'). Devuelve el almacén."""
+    key = os.path.abspath(datanode_specific_block_dir)
+    with _stores_lock:
+        if key in _stores:
+            return _stores[key]
+        if not os.path.exists(datanode_specific_block_dir):
+            os.makedirs(datanode_specific_block_dir)
+            logger.info(f"Directorio de almacenamiento de bloques creado en {datanode_specific_block_dir}")
+        store = _stores[key] = _create_store(backend or config.DATANODE_BLOCK_STORE, datanode_specific_block_dir, fsync_policy)
+        logger.info(f"Almacén de bloques '{store.name}' (fsync: {store.fsync_policy}) en {datanode_specific_block_dir}")
+        return store
+
+def get_block_store(block_dir_instance):
+    store = _stores.get(os.path.abspath(block_dir_instance))
+    return store if store is not None else setup_block_storage(block_dir_instance)
+
+def open_block_writer(block_id, block_dir_instance):
+    """Abre la escritura por streaming de un bloque (ver BlockWriter)."""
+    return get_block_store(block_dir_instance).open_writer(block_id)
 
 def read_block_chunks(block_id, block_dir_instance, chunk_size=8192):
-    path = get_block_path(block_id, block_dir_instance)
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Bloque {block_id} no encontrado en {path}")
-    with open(path, 'rb') as f:
-        while True:
-            chunk = f.read(chunk_size)
-            if not chunk: break
-            yield chunk
+    return get_block_store(block_dir_instance).read_chunks(block_id, chunk_size)
+
+def read_block_views(block_id, block_dir_instance, chunk_size=None, offset=0, length=0):
+    """Lee un bloque mapeado en memoria, entregando slices `memoryview` sin buffers intermedios.
+
+    offset/length limitan la lectura a un rango del bloque (length=0 lee hasta el final).
+    Cada vista solo es válida hasta que se pide la siguiente; el consumidor debe usarla (o copiarla) antes.
+    """
+    chunk_size = chunk_size or config.DATANODE_READ_CHUNK_BYTES
+    return get_block_store(block_dir_instance).read_views(block_id, chunk_size, offset, length)
+
+def verify_block(block_id, block_dir_instance, throttle=None):
+    """Relee el bloque completo y lo compara con sus checksums. Devuelve (ok, mensaje).
+
+    throttle(n) se invoca tras cada unidad leída para limitar la E/S (usado por el scrubber).
+    """
+    return get_block_store(block_dir_instance).verify(block_id, throttle)
+
+def quarantine_block(block_id, block_dir_instance):
+    """Aparta un bloque corrupto para que no vuelva a servirse."""
+    get_block_store(block_dir_instance).quarantine(block_id)
+
+def list_block_ids(block_dir_instance):
+    return get_block_store(block_dir_instance).list_block_ids()
+
+def write_container_record(block_id, offset, data, block_dir_instance):
+    """Escribe el registro de un archivo pequeño en su offset del contenedor, creándolo si no existe.
+
+    El NameNode reserva rangos disjuntos, así que las escrituras concurrentes no necesitan bloqueo.
+    Los contenedores no llevan sidecar de CRC: cada registro trae el suyo y lo valida quien lee.
+    """
+    return get_block_store(block_dir_instance).write_container_record(block_id, offset, data)
+
+def compact_container(block_id, new_block_id, records, block_dir_instance):
+    """Copia los registros vivos [(offset, longitud), ...], en ese orden y contiguos, a un contenedor nuevo.
+
+    Todas las réplicas reciben la misma lista, así que construyen contenedores idénticos. Un registro
+    incompleto en esta réplica se rellena con ceros para no desplazar a los siguientes (el lector lo rechaza).
+    """
+    return get_block_store(block_dir_instance).compact_container(block_id, new_block_id, records)
 
 def store_block_data(block_id, data, block_dir_instance): # Usado por ReplicateBlock
-    path = get_block_path(block_id, block_dir_instance)
-    try:
-        with open(path, 'wb') as f:
-            f.write(data)
-        logger.info(f"Bloque {block_id} almacenado (replicado) en {path}, tamaño: {len(data)}")
-        return True, "Bloque almacenado."
-    except Exception as e:
-        logger.error(f"Error almacenando bloque {block_id}: {e}")
-        return False, str(e)
+    return get_block_store(block_dir_instance).store(block_id, data)
 
 def delete_block_data(block_id, block_dir_instance):
-    path = get_block_path(block_id, block_dir_instance)
-    try:
-        if os.path.exists(path):
-            os.remove(path)
-            logger.info(f"Bloque {block_id} eliminado de {path}.")
-            return True, "Bloque eliminado."
-        else:
-            logger.warning(f"Bloque {block_id} no encontrado para eliminar en {path}.")
-            return False, "Bloque no encontrado para eliminar." # NameNode puede tratar esto como éxito
-    except Exception as e:
-        logger.error(f"Error eliminando bloque {block_id}: {e}")
-        return False, str(e)
\ No newline at end of file
+    return get_block_store(block_dir_instance).delete(block_id)
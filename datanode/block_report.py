@@ -0,0 +1,55 @@
+# datanode/block_report.py
+import threading
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import block_manager
+
+
+class BlockReportTracker:
+    """Acumula altas y bajas de bloques entre heartbeats para el reporte incremental al NameNode."""
+
+    def __init__(self, block_dir_instance):
+        self.block_dir = block_dir_instance
+        self._lock = threading.Lock()
+        self._added = set()
+        self._deleted = set()
+        self.full_report_needed = True # Al arrancar siempre se envía el reporte completo
+
+    # Observador de block_manager
+    def block_added(self, block_id):
+        with self._lock:
+            self._deleted.discard(block_id)
+            self._added.add(block_id)
+
+    def block_removed(self, block_id):
+        with self._lock:
+            self._added.discard(block_id)
+            self._deleted.add(block_id)
+
+    def full_report(self):
+        """Lista completa de bloques. Los cambios posteriores quedan como incrementales (reaplicarlos es idempotente)."""
+        with self._lock:
+            self._added.clear()
+            self._deleted.clear()
+        return block_manager.list_block_ids(self.block_dir)
+
+    def drain(self):
+        """Devuelve el reporte incremental pendiente, o None si no hubo cambios."""
+        with self._lock:
+            if not self._added and not self._deleted:
+                return None
+            report = {"added": sorted(self._added), "deleted": sorted(self._deleted)}
+            self._added.clear()
+            self._deleted.clear()
+        return report
+
+    def restore(self, report):
+        """Reencola un reporte que no llegó al NameNode, sin pisar cambios más recientes."""
+        if not report: return
+        with self._lock:
+            for block_id in report["added"]:
+                if block_id not in self._deleted: self._added.add(block_id)
+            for block_id in report["deleted"]:
+                if block_id not in self._added: self._deleted.add(block_id)
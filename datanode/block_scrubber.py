@@ -0,0 +1,65 @@
+# datanode/block_scrubber.py
+import logging
+import threading
+import time
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common import config
+import block_manager
+
+logger = logging.getLogger(__name__)
+
+
+class _Throttle:
+    """Limita el ritmo de lectura a `bytes_per_sec` durmiendo cuando se adelanta."""
+
+    def __init__(self, bytes_per_sec):
+        self.bytes_per_sec = bytes_per_sec
+        self._start = time.monotonic()
+        self._bytes = 0
+
+    def __call__(self, nbytes):
+        self._bytes += nbytes
+        ahead = self._bytes / self.bytes_per_sec - (time.monotonic() - self._start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def scrub_pass(block_dir_instance, bytes_per_sec):
+    """Verifica todos los bloques del directorio una vez. Devuelve la lista de bloques corruptos."""
+    throttle = _Throttle(bytes_per_sec)
+    corrupt = []
+    for block_id in block_manager.list_block_ids(block_dir_instance):
+        try:
+            ok, message = block_manager.verify_block(block_id, block_dir_instance, throttle)
+        except FileNotFoundError:
+            continue # Eliminado mientras se recorría el directorio
+        except Exception as e:
+            ok, message = False, str(e)
+        if not ok:
+            logger.error(f"Scrubber: bloque {block_id} corrupto: {message}")
+            block_manager.quarantine_block(block_id, block_dir_instance)
+            corrupt.append(block_id)
+    return corrupt
+
+
+def scrub_blocks_forever(datanode_id, block_dir_instance, bytes_per_sec=None, interval_sec=None):
+    bytes_per_sec = bytes_per_sec or config.DATANODE_SCRUB_BYTES_PER_SEC
+    interval_sec = interval_sec or config.DATANODE_SCRUB_INTERVAL_SEC
+    while True:
+        start = time.monotonic()
+        try:
+            corrupt = scrub_pass(block_dir_instance, bytes_per_sec)
+            logger.info(f"[{datanode_id}] Pasada del scrubber completa en {time.monotonic() - start:.0f}s. Corruptos: {len(corrupt)}")
+        except Exception as e:
+            logger.error(f"[{datanode_id}] Error inesperado en el scrubber: {e}")
+        time.sleep(interval_sec)
+
+
+def start_scrubber(datanode_id, block_dir_instance, bytes_per_sec=None):
+    thread = threading.Thread(target=scrub_blocks_forever, args=(datanode_id, block_dir_instance, bytes_per_sec),
+                              daemon=True, name="block-scrubber")
+    thread.start()
+    return thread
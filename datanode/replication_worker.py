@@ -0,0 +1,65 @@
+# datanode/replication_worker.py
+import logging
+import threading
+from concurrent import futures
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'generated'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import generated.dfs_pb2 as dfs_pb2
+import generated.dfs_pb2_grpc as dfs_pb2_grpc
+from common import config
+from common.grpc_pool import get_channel_pool
+import block_manager
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicationWorker:
+    """Ejecuta las tareas de re-replicación del NameNode: copia un bloque local a otro DataNode por stream."""
+
+    def __init__(self, datanode_id, block_dir_instance):
+        self.datanode_id = datanode_id
+        self.block_dir = block_dir_instance
+        self._executor = futures.ThreadPoolExecutor(max_workers=config.REPLICATION_MAX_STREAMS_PER_NODE,
+                                                    thread_name_prefix="re-replication")
+        self._results = []
+        self._lock = threading.Lock()
+
+    def submit(self, tasks):
+        for task in tasks or []:
+            self._executor.submit(self._run, task)
+
+    def drain_results(self):
+        """Resultados pendientes de informar al NameNode en el próximo heartbeat."""
+        with self._lock:
+            results, self._results = self._results, []
+        return results
+
+    def restore_results(self, results): # Si el heartbeat falló, se reintentan en el siguiente
+        with self._lock:
+            self._results[:0] = results
+
+    def _requests(self, block_id):
+        yield dfs_pb2.ReplicateBlockStreamRequest(block_info=dfs_pb2.BlockInfo(block_id=block_id))
+        # read_block_views verifica checksums: nunca se propaga una réplica corrupta
+        for chunk_view in block_manager.read_block_views(block_id, self.block_dir):
+            yield dfs_pb2.ReplicateBlockStreamRequest(chunk_data=chunk_view.tobytes())
+
+    def _run(self, task):
+        block_id, target_addr = task['block_id'], task['target_grpc_address']
+        success = False
+        try:
+            with get_channel_pool().lease(target_addr, dfs_pb2_grpc.DataNodeServiceStub) as stub:
+                response = stub.ReplicateBlockStream(self._requests(block_id), timeout=config.REPLICATION_TASK_TIMEOUT_SEC)
+            success = response.success
+            if success:
+                logger.info(f"[{self.datanode_id}] Bloque {block_id} re-replicado a {target_addr}")
+            else:
+                logger.warning(f"[{self.datanode_id}] {target_addr} rechazó la réplica de {block_id}: {response.message}")
+        except Exception as e:
+            logger.error(f"[{self.datanode_id}] Error re-replicando bloque {block_id} a {target_addr}: {e}")
+        with self._lock:
+            self._results.append({"block_id": block_id, "target_datanode_id": task['target_datanode_id'], "success": success})
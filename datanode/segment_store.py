@@ -0,0 +1,471 @@
+# datanode/segment_store.py
+"""Almacén de bloques log-structured: los bloques se añaden al final de archivos de segmento grandes.
+
+Evita un archivo (y un inodo) por bloque: millones de bloques caben en unos cientos de segmentos.
+Un índice en memoria block_id -> (segmento, offset, longitud, CRCs) se persiste como un log de
+altas y bajas (index.log) que se reproduce al arrancar y se reescribe compacto, solo con las entradas
+vivas. Borrar un bloque solo deja espacio muerto; la compactación copia los bloques vivos de los
+segmentos con mucho espacio muerto al segmento activo y borra el segmento viejo.
+
+Los contenedores de archivos pequeños se escriben por registros en su offset (no son append-only),
+así que siguen siendo archivos propios en el subdirectorio containers/.
+"""
+import io
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common import config
+from common.container_format import is_container
+import block_manager
+from block_manager import BlockStore, BlockWriter, FileBlockStore, CORRUPT_SUBDIR, _notify, _read_range, _serve_views
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS_SUBDIR = 'segments'
+CONTAINERS_SUBDIR = 'containers'
+INDEX_FILE = 'index.log'
+SEGMENT_SUFFIX = '.seg'
+
+# Entradas del índice: cabecera (tipo, longitud del block_id), block_id, cuerpo y CRC32 de la entrada
+_INDEX_MAGIC = b'DFSI'
+_ENTRY_HEAD = struct.Struct('<BH')
+_PUT_BODY = struct.Struct('<IQQI') # segmento, offset, longitud, bytes por checksum; siguen los CRC32 del bloque
+_ENTRY_CRC = struct.Struct('<I')
+_PUT, _DEL = 1, 2
+
+# crcs: CRC32 little-endian empaquetados (un bytes ocupa mucho menos que una tupla de enteros)
+_Location = namedtuple('_Location', 'segment offset length bytes_per_checksum crcs')
+
+
+def _unit_count(length, bytes_per_checksum):
+    return -(-length // bytes_per_checksum) if bytes_per_checksum else 0
+
+def _checksums(loc):
+    count = len(loc.crcs) // _ENTRY_CRC.size
+    return loc.bytes_per_checksum, struct.unpack(f'<{count}I', loc.crcs)
+
+def _encode_entry(op, block_id, loc=None):
+    raw_id = block_id.encode()
+    entry = _ENTRY_HEAD.pack(op, len(raw_id)) + raw_id
+    if op == _PUT:
+        entry += _PUT_BODY.pack(loc.segment, loc.offset, loc.length, loc.bytes_per_checksum) + loc.crcs
+    return entry + _ENTRY_CRC.pack(zlib.crc32(entry))
+
+def _replay_index(raw):
+    """Reproduce el log del índice. Devuelve (índice, entradas, bytes válidos).
+
+    Se detiene en la primera entrada incompleta o con CRC inválido (caída a mitad de una escritura).
+    """
+    index = {}
+    entries = 0
+    pos = len(_INDEX_MAGIC)
+    while pos < len(raw):
+        try:
+            op, id_len = _ENTRY_HEAD.unpack_from(raw, pos)
+            p = pos + _ENTRY_HEAD.size
+            raw_id = raw[p:p + id_len]
+            p += id_len
+            loc = None
+            if op == _PUT:
+                segment, offset, length, bytes_per_checksum = _PUT_BODY.unpack_from(raw, p)
+                p += _PUT_BODY.size
+                crc_len = _unit_count(length, bytes_per_checksum) * _ENTRY_CRC.size
+                loc = _Location(segment, offset, length, bytes_per_checksum, raw[p:p + crc_len])
+                p += crc_len
+            elif op != _DEL:
+                break
+            (crc,) = _ENTRY_CRC.unpack_from(raw, p)
+            if crc != zlib.crc32(raw[pos:p]):
+                break
+            block_id = raw_id.decode()
+        except (struct.error, UnicodeDecodeError):
+            break
+        if loc is None:
+            index.pop(block_id, None)
+        else:
+            index[block_id] = loc
+        entries += 1
+        pos = p + _ENTRY_CRC.size
+    return index, entries, pos
+
+
+class _SegmentBlockWriter(BlockWriter):
+    """Acumula el bloque (en memoria, o en disco si crece) y lo añade al segmento de una vez al confirmar."""
+
+    def __init__(self, store, block_id):
+        self.store = store
+        self.block_id = block_id
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=config.DATANODE_SEGMENT_SPOOL_BYTES, dir=store.segment_dir)
+        self.size = 0
+
+    def write(self, data):
+        try:
+            self._buffer.write(data)
+            self.size += len(data)
+            return True, None
+        except Exception as e:
+            logger.error(f"Error escribiendo chunk al bloque {self.block_id}: {e}")
+            return False, str(e)
+
+    def commit(self):
+        try:
+            self._buffer.seek(0)
+            self.store._append_durable(self.block_id, self._buffer.read, self.size)
+        except Exception as e:
+            logger.error(f"Error confirmando el bloque {self.block_id} en el segmento: {e}")
+            return False, str(e)
+        finally:
+            self._buffer.close()
+        self.committed = True
+        _notify('block_added', self.block_id)
+        return True, None
+
+    def abort(self):
+        self._buffer.close()
+
+
+class SegmentBlockStore(BlockStore):
+    """Backend 'segments' de block_manager."""
+    name = 'segments'
+
+    def __init__(self, block_dir, fsync_policy=None, segment_bytes=None):
+        super().__init__(block_dir, fsync_policy)
+        self.segment_bytes = segment_bytes or config.DATANODE_SEGMENT_BYTES
+        self.segment_dir = os.path.join(block_dir, SEGMENTS_SUBDIR)
+        os.makedirs(self.segment_dir, exist_ok=True)
+        containers_dir = os.path.join(block_dir, CONTAINERS_SUBDIR)
+        os.makedirs(containers_dir, exist_ok=True)
+        self._containers = FileBlockStore(containers_dir, self.fsync_policy)
+        self._lock = threading.RLock() # Índice, estadísticas y escritura en el segmento activo
+        self._index = {} # block_id -> _Location
+        self._segments = {} # número de segmento -> [tamaño, bytes vivos]
+        self._index_file = None
+        self._index_entries = 0
+        self._active = None
+        self._active_file = None
+        self._load()
+        self._migrate_flat_files()
+
+    # --- Arranque ---
+    def _segment_path(self, segment):
+        return os.path.join(self.segment_dir, f"{segment:08d}{SEGMENT_SUFFIX}")
+
+    def _load(self):
+        index_path = os.path.join(self.segment_dir, INDEX_FILE)
+        try:
+            with open(index_path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raw = b''
+        if raw and not raw.startswith(_INDEX_MAGIC):
+            raise IOError(f"Índice de segmentos inválido en {index_path}")
+        index, entries, valid = _replay_index(raw) if raw else ({}, 0, 0)
+        if valid < len(raw):
+            logger.warning(f"Índice de segmentos: se descartan {len(raw) - valid} bytes de una entrada incompleta.")
+        with os.scandir(self.segment_dir) as it:
+            for e in it:
+                if e.name.endswith(SEGMENT_SUFFIX):
+                    self._segments[int(e.name[:-len(SEGMENT_SUFFIX)])] = [e.stat().st_size, 0]
+        for block_id, loc in index.items():
+            stats = self._segments.get(loc.segment)
+            if stats is None or loc.offset + loc.length > stats[0]:
+                logger.warning(f"Bloque {block_id} apunta a un segmento ausente o truncado; se descarta del índice.")
+                continue
+            stats[1] += loc.length
+            self._index[block_id] = loc
+        with self._lock:
+            self._rewrite_index_locked() # Arranca con un índice compacto, sin cola rota ni entradas muertas
+            last = max(self._segments, default=None)
+            if last is None or self._segments[last][0] >= self.segment_bytes:
+                self._roll_segment_locked()
+            else: # Datos sin entrada en el índice al final del segmento (caída) quedan como espacio muerto
+                self._active, self._active_file = last, open(self._segment_path(last), 'ab')
+        logger.info(f"Almacén de segmentos en {self.segment_dir}: {len(self._index)} bloques, {len(self._segments)} segmentos.")
+
+    def _migrate_flat_files(self):
+        """Importa los bloques que un backend 'files' anterior dejó como archivos sueltos en el directorio."""
+        flat = FileBlockStore(self.block_dir)
+        migrated = 0
+        for block_id in flat.list_block_ids():
+            src = block_manager.get_block_path(block_id, self.block_dir)
+            if is_container(block_id):
+                os.replace(src, block_manager.get_block_path(block_id, self._containers.block_dir))
+                continue
+            ok, message = flat.verify(block_id)
+            if not ok:
+                logger.error(f"Bloque {block_id} corrupto al migrar a segmentos: {message}")
+                flat.quarantine(block_id)
+                continue
+            with open(src, 'rb') as f:
+                data = f.read()
+            with self._lock:
+                self._append_locked(block_id, io.BytesIO(data).read, len(data))
+                self._sync_locked() # El archivo suelto se borra solo cuando su copia es durable
+            os.remove(src)
+            crc_path = block_manager.get_checksum_path(block_id, self.block_dir)
+            if os.path.exists(crc_path): os.remove(crc_path)
+            migrated += 1
+        if migrated:
+            logger.info(f"{migrated} bloques migrados de archivos sueltos a segmentos.")
+
+    # --- Escritura (con self._lock tomado) ---
+    def _roll_segment_locked(self):
+        if self._active_file:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno()) # Un segmento cerrado ya no vuelve a tocarse
+            self._active_file.close()
+        self._active = max(self._segments, default=0) + 1
+        self._segments[self._active] = [0, 0]
+        self._active_file = open(self._segment_path(self._active), 'ab')
+
+    def _append_locked(self, block_id, read, length):
+        """Añade `length` bytes leídos con read(n) al segmento activo, calculando sus CRC, y los indexa."""
+        if self._segments[self._active][0] and self._segments[self._active][0] + length > self.segment_bytes:
+            self._roll_segment_locked()
+        stats = self._segments[self._active]
+        offset = stats[0]
+        bytes_per_checksum = config.DATANODE_BYTES_PER_CHECKSUM
+        crcs = []
+        f = self._active_file
+        try:
+            remaining = length
+            while remaining:
+                unit = read(min(bytes_per_checksum, remaining))
+                if not unit:
+                    raise IOError(f"Datos incompletos para el bloque {block_id}")
+                crcs.append(zlib.crc32(unit))
+                f.write(unit)
+                remaining -= len(unit)
+            f.flush()
+        finally:
+            stats[0] = f.tell() # Si falló a medias, lo escrito queda como espacio muerto
+        loc = _Location(self._active, offset, length, bytes_per_checksum, struct.pack(f'<{len(crcs)}I', *crcs))
+        self._write_index_entry_locked(_encode_entry(_PUT, block_id, loc))
+        old = self._index.get(block_id)
+        if old is not None and old.segment in self._segments:
+            self._segments[old.segment][1] -= old.length
+        self._index[block_id] = loc
+        stats[1] += length
+        return loc
+
+    def _remove_locked(self, block_id):
+        loc = self._index.pop(block_id)
+        self._write_index_entry_locked(_encode_entry(_DEL, block_id))
+        if loc.segment in self._segments:
+            self._segments[loc.segment][1] -= loc.length
+        return loc
+
+    def _write_index_entry_locked(self, entry):
+        self._index_file.write(entry)
+        self._index_file.flush()
+        self._index_entries += 1
+
+    def _rewrite_index_locked(self):
+        index_path = os.path.join(self.segment_dir, INDEX_FILE)
+        tmp = index_path + block_manager.TMP_SUFFIX
+        with open(tmp, 'wb') as f:
+            f.write(_INDEX_MAGIC)
+            for block_id, loc in self._index.items():
+                f.write(_encode_entry(_PUT, block_id, loc))
+            f.flush()
+            os.fsync(f.fileno())
+        if self._index_file:
+            self._index_file.close()
+        os.replace(tmp, index_path)
+        self._index_file = open(index_path, 'ab')
+        self._index_entries = len(self._index)
+
+    def _sync_locked(self):
+        for f in (self._active_file, self._index_file):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _locate(self, block_id):
+        loc = self._index.get(block_id)
+        if loc is None:
+            raise FileNotFoundError(f"Bloque {block_id} no encontrado en {self.segment_dir}")
+        return loc
+
+    # --- Interfaz BlockStore ---
+    def _append_durable(self, block_id, read, length):
+        """Añade el bloque y espera a que sea durable según la política de fsync."""
+        with self._lock:
+            loc = self._append_locked(block_id, read, length)
+            # Duplicados: el segmento puede cerrarse y el índice reescribirse mientras se espera el fsync
+            fds = [] if self.fsync_policy == 'none' else [os.dup(f.fileno()) for f in (self._active_file, self._index_file)]
+        try:
+            for fd in fds:
+                self._sync(fd)
+        finally:
+            for fd in fds:
+                os.close(fd)
+        return loc
+
+    def open_writer(self, block_id):
+        if is_container(block_id):
+            return self._containers.open_writer(block_id)
+        return _SegmentBlockWriter(self, block_id)
+
+    def store(self, block_id, data):
+        if is_container(block_id):
+            return self._containers.store(block_id, data)
+        try:
+            loc = self._append_durable(block_id, io.BytesIO(data).read, len(data))
+        except Exception as e:
+            logger.error(f"Error almacenando bloque {block_id}: {e}")
+            return False, str(e)
+        _notify('block_added', block_id)
+        logger.info(f"Bloque {block_id} almacenado (replicado) en el segmento {loc.segment}, tamaño: {len(data)}")
+        return True, "Bloque almacenado."
+
+    def read_views(self, block_id, chunk_size, offset=0, length=0):
+        if is_container(block_id):
+            yield from self._containers.read_views(block_id, chunk_size, offset, length)
+            return
+        loc = self._locate(block_id)
+        try:
+            f = open(self._segment_path(loc.segment), 'rb')
+        except FileNotFoundError: # Compactado entre la consulta al índice y la apertura
+            loc = self._locate(block_id)
+            f = open(self._segment_path(loc.segment), 'rb')
+        with f:
+            end = _read_range(block_id, loc.length, offset, length)
+            if end == offset:
+                return
+            map_start = loc.offset - loc.offset % mmap.ALLOCATIONGRANULARITY # mmap exige offsets alineados
+            with mmap.mmap(f.fileno(), loc.offset + loc.length - map_start, access=mmap.ACCESS_READ, offset=map_start) as mm:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mm) as mapped, mapped[loc.offset - map_start:] as view:
+                    yield from _serve_views(view, block_id, _checksums(loc), chunk_size, offset, end)
+
+    def verify(self, block_id, throttle=None):
+        if is_container(block_id):
+            return self._containers.verify(block_id, throttle)
+        loc = self._locate(block_id)
+        bytes_per_checksum, crcs = _checksums(loc)
+        with open(self._segment_path(loc.segment), 'rb') as f:
+            for unit, crc in enumerate(crcs):
+                start = unit * bytes_per_checksum
+                data = os.pread(f.fileno(), min(bytes_per_checksum, loc.length - start), loc.offset + start)
+                if zlib.crc32(data) != crc:
+                    return False, f"Checksum inválido en la unidad {unit}."
+                if throttle: throttle(len(data))
+        return True, "Bloque íntegro."
+
+    def quarantine(self, block_id, expected=None):
+        """Copia el bloque a corrupt/ y lo quita del índice. Con `expected`, solo si sigue en esa ubicación."""
+        if is_container(block_id):
+            return self._containers.quarantine(block_id)
+        with self._lock:
+            loc = self._index.get(block_id)
+            if loc is None or (expected is not None and loc is not expected):
+                return
+            corrupt_dir = os.path.join(self.block_dir, CORRUPT_SUBDIR)
+            try:
+                os.makedirs(corrupt_dir, exist_ok=True)
+                with open(self._segment_path(loc.segment), 'rb') as f_in, open(os.path.join(corrupt_dir, block_id), 'wb') as f_out:
+                    f_out.write(os.pread(f_in.fileno(), loc.length, loc.offset))
+            except OSError as e:
+                logger.warning(f"No se pudo copiar el bloque corrupto {block_id} a {corrupt_dir}: {e}")
+            self._remove_locked(block_id)
+        _notify('block_removed', block_id)
+        logger.warning(f"Bloque {block_id} en cuarentena por corrupción.")
+
+    def list_block_ids(self):
+        with self._lock:
+            block_ids = list(self._index)
+        return block_ids + self._containers.list_block_ids()
+
+    def write_container_record(self, block_id, offset, data):
+        return self._containers.write_container_record(block_id, offset, data)
+
+    def compact_container(self, block_id, new_block_id, records):
+        return self._containers.compact_container(block_id, new_block_id, records)
+
+    def delete(self, block_id):
+        if is_container(block_id):
+            return self._containers.delete(block_id)
+        try:
+            with self._lock:
+                if block_id not in self._index:
+                    logger.warning(f"Bloque {block_id} no encontrado para eliminar en {self.segment_dir}.")
+                    return False, "Bloque no encontrado para eliminar." # NameNode puede tratar esto como éxito
+                loc = self._remove_locked(block_id)
+        except Exception as e:
+            logger.error(f"Error eliminando bloque {block_id}: {e}")
+            return False, str(e)
+        _notify('block_removed', block_id)
+        logger.info(f"Bloque {block_id} eliminado del segmento {loc.segment}.")
+        return True, "Bloque eliminado."
+
+    # --- Compactación ---
+    def segment_stats(self):
+        with self._lock:
+            return {segment: {"bytes": size, "live_bytes": live} for segment, (size, live) in self._segments.items()}
+
+    def compact(self, min_dead_ratio=None):
+        """Reescribe los segmentos cerrados con al menos `min_dead_ratio` de espacio muerto. Devuelve los bytes liberados."""
+        min_dead_ratio = config.DATANODE_SEGMENT_COMPACTION_MIN_DEAD_RATIO if min_dead_ratio is None else min_dead_ratio
+        with self._lock:
+            candidates = sorted((live / size if size else 0.0, segment) for segment, (size, live) in self._segments.items()
+                                if segment != self._active and (not size or (size - live) / size >= min_dead_ratio))
+        freed = sum(self._compact_segment(segment) for _, segment in candidates)
+        with self._lock:
+            if self._index_entries > 2 * len(self._index) + 1024: # El log acumula bajas y reubicaciones
+                self._rewrite_index_locked()
+        return freed
+
+    def _compact_segment(self, segment):
+        with self._lock:
+            live = sorted((loc.offset, block_id, loc) for block_id, loc in self._index.items() if loc.segment == segment)
+        moved = 0
+        path = self._segment_path(segment)
+        with open(path, 'rb') as f:
+            for _, block_id, loc in live:
+                data = os.pread(f.fileno(), loc.length, loc.offset)
+                bytes_per_checksum, crcs = _checksums(loc)
+                if [zlib.crc32(data[i:i + bytes_per_checksum]) for i in range(0, len(data), bytes_per_checksum)] != list(crcs):
+                    logger.error(f"Bloque {block_id} corrupto durante la compactación del segmento {segment}.")
+                    self.quarantine(block_id, expected=loc) # No se copia un bloque dañado a un segmento nuevo
+                    continue
+                with self._lock:
+                    if self._index.get(block_id) is not loc:
+                        continue # Borrado o reescrito mientras tanto
+                    self._append_locked(block_id, io.BytesIO(data).read, loc.length)
+                moved += loc.length
+        with self._lock:
+            self._sync_locked() # Las copias y sus entradas deben ser durables antes de borrar el original
+            size, _ = self._segments.pop(segment)
+        os.remove(path) # Lectores que ya lo abrieron siguen leyendo del inodo hasta cerrarlo
+        logger.info(f"Segmento {segment} compactado: {len(live)} bloques reubicados, {size - moved} bytes liberados.")
+        return size - moved
+
+
+def compact_segments_forever(datanode_id, store, interval_sec=None):
+    interval_sec = interval_sec or config.DATANODE_SEGMENT_COMPACTION_INTERVAL_SEC
+    while True:
+        time.sleep(interval_sec)
+        try:
+            freed = store.compact()
+            if freed:
+                logger.info(f"[{datanode_id}] Compactación de segmentos: {freed} bytes liberados.")
+        except Exception as e:
+            logger.error(f"[{datanode_id}] Error inesperado compactando segmentos: {e}")
+
+
+def start_compactor(datanode_id, store, interval_sec=None):
+    thread = threading.Thread(target=compact_segments_forever, args=(datanode_id, store, interval_sec),
+                              daemon=True, name="segment-compactor")
+    thread.start()
+    return thread
@@ -1,8 +1,12 @@
 # datanode/services_datanode.py
+import functools
 import grpc
+import inspect
 import logging
 import os
+import queue
 import sys
+import threading
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'generated'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -11,68 +15,216 @@ import generated.dfs_pb2 as dfs_pb2
 import generated.dfs_pb2_grpc as dfs_pb2_grpc
 import block_manager
 from common import config
+from common.grpc_pool import get_channel_pool
 
 logger = logging.getLogger(__name__)
 
+REPLICATION_QUEUE_CHUNKS = 4 # Chunks en vuelo hacia el secundario; acota la memoria por bloque
+REPLICATION_TIMEOUT_SEC = 60
+
+class _TransferCounter:
+    """Transferencias de bloques en curso en este DataNode; se informan al NameNode en el heartbeat."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def __enter__(self):
+        with self._lock: self.value += 1
+
+    def __exit__(self, *exc):
+        with self._lock: self.value -= 1
+
+active_transfers = _TransferCounter()
+
+def _counts_as_transfer(method):
+    if inspect.isgeneratorfunction(method): # Streams de respuesta: cuenta hasta que se consume el último chunk
+        @functools.wraps(method)
+        def stream_wrapper(self, request, context):
+            with active_transfers:
+                yield from method(self, request, context)
+        return stream_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, request, context):
+        with active_transfers:
+            return method(self, request, context)
+    return wrapper
+
+class _ReplicationPipeline:
+    """Reenvía al secundario, por un stream gRPC, cada chunk que el primario recibe del cliente."""
+    _END = object()
+
+    def __init__(self, datanode_id, block_info_msg, secondary_dn_address):
+        self.datanode_id = datanode_id
+        self.block_id = block_info_msg.block_id
+        self.secondary_dn_address = secondary_dn_address
+        self._queue = queue.Queue(maxsize=REPLICATION_QUEUE_CHUNKS)
+        self._closed = threading.Event()
+        self.failed = False # El secundario falló: no se reenvía nada más
+        self._pool = get_channel_pool()
+        stub = self._pool.acquire(secondary_dn_address, dfs_pb2_grpc.DataNodeServiceStub)
+        first = dfs_pb2.ReplicateBlockStreamRequest(block_info=dfs_pb2.BlockInfo(
+            block_id=block_info_msg.block_id, file_id=block_info_msg.file_id,
+            packed=block_info_msg.packed, packed_offset=block_info_msg.packed_offset))
+        self._future = stub.ReplicateBlockStream.future(self._requests(first), timeout=REPLICATION_TIMEOUT_SEC)
+
+    def _requests(self, first):
+        yield first
+        while not self._closed.is_set(): # Evita dejar colgado el hilo de envío de gRPC tras un abort
+            try:
+                chunk = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if chunk is self._END: return
+            yield dfs_pb2.ReplicateBlockStreamRequest(chunk_data=chunk)
+
+    def _put(self, item):
+        while not self._future.done(): # Si el secundario ya falló, dejar de reenviar
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def forward(self, chunk_data):
+        """Encola el chunk para el secundario. False si el secundario ya falló (se deja de reenviar)."""
+        if self.failed:
+            return False
+        if not self._put(chunk_data):
+            self.failed = True
+            logger.error(f"[{self.datanode_id}] El secundario {self.secondary_dn_address} cortó la réplica del bloque "
+                         f"{self.block_id}; se deja de reenviar y el bloque queda sub-replicado.")
+        return not self.failed
+
+    def finish(self):
+        """Cierra el stream y espera el ack del secundario. Devuelve (replicado, mensaje de estado)."""
+        error = None
+        try:
+            if not self.failed:
+                self._put(self._END)
+            rep_resp = self._future.result()
+            if rep_resp.success and not self.failed:
+                return True, f"Replicado exitosamente a {self.secondary_dn_address}."
+            msg = f"Fallo al replicar a {self.secondary_dn_address}: {rep_resp.message}"
+        except Exception as e_rep:
+            error = e_rep
+            msg = f"Error replicando a {self.secondary_dn_address}: {str(e_rep)}"
+        finally:
+            self._closed.set()
+            self._pool.release(self.secondary_dn_address, error)
+        if not self.failed: # Si ya se registró al cortarse el stream, no repetirlo
+            logger.error(f"[{self.datanode_id}] Bloque {self.block_id}: {msg}")
+        return False, msg
+
+    def abort(self):
+        self._closed.set()
+        self._future.cancel()
+        self._pool.release(self.secondary_dn_address)
+
 class DataNodeServiceImpl(dfs_pb2_grpc.DataNodeServiceServicer):
-    def __init__(self, datanode_id, block_dir):
+    def __init__(self, datanode_id, block_dir, block_cache=None):
         self.datanode_id = datanode_id
         self.block_dir = block_dir
+        self.block_cache = block_cache # BlockCache opcional de bloques calientes
         block_manager.setup_block_storage(self.block_dir)
         logger.info(f"DataNodeService inicializado para {datanode_id} usando dir {self.block_dir}")
 
+    def _open_writer(self, block_id):
+        writer = block_manager.open_block_writer(block_id, self.block_dir)
+        return self.block_cache.wrap_writer(block_id, writer) if self.block_cache else writer
+
+    def _read_views(self, block_id, chunk_size, offset, length):
+        if self.block_cache:
+            return self.block_cache.read_views(block_id, self.block_dir, chunk_size, offset, length)
+        return block_manager.read_block_views(block_id, self.block_dir, chunk_size, offset, length)
+
+    @_counts_as_transfer
     def WriteBlock(self, request_iterator, context): # Escritura directa Cliente-DataNode [cite: 18]
         logger.info(f"[{self.datanode_id}] WriteBlock invocado.")
         block_info_msg = next(request_iterator).block_info
         block_id = block_info_msg.block_id
         secondary_dn_address = block_info_msg.secondary_datanode_grpc_address # El NameNode informa cuál es el secundario [cite: 27]
+        if block_info_msg.packed:
+            return self._write_packed_record(block_info_msg, request_iterator, context)
 
-        is_first_chunk = True
-        full_block_data_for_replication = bytearray()
-        for req_chunk in request_iterator:
-            chunk_data = req_chunk.chunk_data
-            success, err = block_manager.write_block_chunk(block_id, chunk_data, is_first_chunk, self.block_dir)
-            if not success:
-                context.set_code(grpc.StatusCode.INTERNAL)
-                context.set_details(f"Fallo al escribir chunk: {err}")
-                return dfs_pb2.WriteBlockResponse(block_id=block_id, success=False, message=err)
-            is_first_chunk = False
-            full_block_data_for_replication.extend(chunk_data)
-        
-        logger.info(f"[{self.datanode_id}] Bloque {block_id} escrito. Tamaño: {len(full_block_data_for_replication)}")
-        
-        # Replicar al DataNode secundario (Follower del bloque) [cite: 27]
-        rep_success_msg = "Replicación no intentada (sin secundario)."
+        # Replicar al DataNode secundario (Follower del bloque) en pipeline, chunk a chunk [cite: 27]
+        pipeline = None
         if secondary_dn_address:
-            logger.info(f"[{self.datanode_id}] Replicando bloque {block_id} a {secondary_dn_address}")
+            logger.info(f"[{self.datanode_id}] Replicando bloque {block_id} a {secondary_dn_address} en pipeline")
+            pipeline = _ReplicationPipeline(self.datanode_id, block_info_msg, secondary_dn_address)
+
+        # Un solo escritor por stream; si el stream se corta, el temporal se descarta y el bloque nunca aparece
+        with self._open_writer(block_id) as writer:
             try:
-                with grpc.insecure_channel(secondary_dn_address) as channel:
-                    stub = dfs_pb2_grpc.DataNodeServiceStub(channel)
-                    rep_req = dfs_pb2.ReplicateBlockRequest(block_id=block_id, data=bytes(full_block_data_for_replication))
-                    rep_resp = stub.ReplicateBlock(rep_req, timeout=10)
-                    if rep_resp.success:
-                        rep_success_msg = f"Replicado exitosamente a {secondary_dn_address}."
-                    else:
-                        rep_success_msg = f"Fallo al replicar a {secondary_dn_address}: {rep_resp.message}"
-            except Exception as e_rep:
-                rep_success_msg = f"Error replicando a {secondary_dn_address}: {str(e_rep)}"
-                logger.error(f"[{self.datanode_id}] {rep_success_msg}")
+                for req_chunk in request_iterator:
+                    chunk_data = req_chunk.chunk_data
+                    success, err = writer.write(chunk_data)
+                    if not success:
+                        break
+                    if pipeline: pipeline.forward(chunk_data) # Tras un fallo del secundario solo se escribe localmente
+                else:
+                    success, err = writer.commit()
+            except Exception:
+                if pipeline: pipeline.abort()
+                raise
+        if not success:
+            if pipeline: pipeline.abort()
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Fallo al escribir el bloque: {err}")
+            return dfs_pb2.WriteBlockResponse(block_id=block_id, success=False, message=err)
+        logger.info(f"[{self.datanode_id}] Bloque {block_id} escrito. Tamaño: {writer.size}")
+        
+        # El ack al cliente espera el ack del secundario
+        replicated, rep_success_msg = pipeline.finish() if pipeline else (True, "Replicación no intentada (sin secundario).")
         
-        return dfs_pb2.WriteBlockResponse(block_id=block_id, success=True, message=f"Bloque escrito en primario. {rep_success_msg}")
+        return dfs_pb2.WriteBlockResponse(block_id=block_id, success=True, under_replicated=not replicated,
+                                          message=f"Bloque escrito en primario. {rep_success_msg}")
+
+    def _write_packed_record(self, block_info_msg, request_iterator, context):
+        """Registro de un archivo pequeño: es pequeño, así que se reúne entero y se escribe con una sola llamada."""
+        block_id = block_info_msg.block_id
+        record = b"".join(req_chunk.chunk_data for req_chunk in request_iterator)
+        pipeline = None
+        if block_info_msg.secondary_datanode_grpc_address:
+            pipeline = _ReplicationPipeline(self.datanode_id, block_info_msg, block_info_msg.secondary_datanode_grpc_address)
+            pipeline.forward(record)
+        success, err = block_manager.write_container_record(block_id, block_info_msg.packed_offset, record, self.block_dir)
+        if not success:
+            if pipeline: pipeline.abort()
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Fallo al escribir registro: {err}")
+            return dfs_pb2.WriteBlockResponse(block_id=block_id, success=False, message=err)
+        replicated, rep_success_msg = pipeline.finish() if pipeline else (True, "Replicación no intentada (sin secundario).")
+        return dfs_pb2.WriteBlockResponse(block_id=block_id, success=True, under_replicated=not replicated,
+                                          message=f"Registro escrito en el contenedor. {rep_success_msg}")
 
+    @_counts_as_transfer
     def ReadBlock(self, request, context): # Lectura directa Cliente-DataNode [cite: 18]
         block_id = request.block_id
-        logger.info(f"[{self.datanode_id}] ReadBlock invocado para: {block_id}")
+        chunk_size = block_manager.clamp_read_chunk_size(request.chunk_size)
+        logger.info(f"[{self.datanode_id}] ReadBlock invocado para: {block_id} (chunk {chunk_size} bytes)")
         try:
-            for chunk_data in block_manager.read_block_chunks(block_id, self.block_dir):
-                yield dfs_pb2.ReadBlockResponse(chunk_data=chunk_data)
+            for chunk_view in self._read_views(block_id, chunk_size, request.offset, request.length):
+                # Única copia: de la página mapeada (o de la caché) al mensaje protobuf
+                yield dfs_pb2.ReadBlockResponse(chunk_data=chunk_view.tobytes())
         except FileNotFoundError:
             context.set_code(grpc.StatusCode.NOT_FOUND)
             context.set_details(f"Bloque {block_id} no encontrado.")
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.OUT_OF_RANGE)
+            context.set_details(str(e))
+        except block_manager.ChecksumError as e: # El cliente pasa a otra réplica
+            logger.error(f"[{self.datanode_id}] {e}")
+            block_manager.quarantine_block(block_id, self.block_dir)
+            context.set_code(grpc.StatusCode.DATA_LOSS)
+            context.set_details(str(e))
         except Exception as e:
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(f"Error leyendo bloque: {str(e)}")
     
+    @_counts_as_transfer
     def ReplicateBlock(self, request, context): # DataNode (Líder del bloque) a DataNode (Seguidor del bloque) [cite: 27]
         block_id = request.block_id
         data = request.data
@@ -80,6 +232,26 @@ class DataNodeServiceImpl(dfs_pb2_grpc.DataNodeServiceServicer):
         success, message = block_manager.store_block_data(block_id, data, self.block_dir)
         return dfs_pb2.ReplicateBlockResponse(block_id=block_id, success=success, message=message)
 
+    @_counts_as_transfer
+    def ReplicateBlockStream(self, request_iterator, context): # Destino del pipeline de replicación [cite: 27]
+        block_info_msg = next(request_iterator).block_info
+        block_id = block_info_msg.block_id
+        logger.info(f"[{self.datanode_id}] ReplicateBlockStream invocado para: {block_id}")
+        if block_info_msg.packed: # Registro de archivo pequeño reenviado por el primario
+            record = b"".join(req_chunk.chunk_data for req_chunk in request_iterator)
+            success, err = block_manager.write_container_record(block_id, block_info_msg.packed_offset, record, self.block_dir)
+            return dfs_pb2.ReplicateBlockResponse(block_id=block_id, success=success, message=err or "Registro almacenado.")
+        with self._open_writer(block_id) as writer: # Un bloque vacío también se confirma
+            for req_chunk in request_iterator:
+                success, err = writer.write(req_chunk.chunk_data)
+                if not success:
+                    return dfs_pb2.ReplicateBlockResponse(block_id=block_id, success=False, message=err)
+            success, err = writer.commit()
+        if not success:
+            return dfs_pb2.ReplicateBlockResponse(block_id=block_id, success=False, message=err)
+        logger.info(f"[{self.datanode_id}] Bloque {block_id} replicado por stream. Tamaño: {writer.size}")
+        return dfs_pb2.ReplicateBlockResponse(block_id=block_id, success=True, message="Bloque almacenado.")
+
     def DeleteBlock(self, request, context):
         block_id = request.block_id
         logger.info(f"[{self.datanode_id}] DeleteBlock invocado para: {block_id}")
@@ -0,0 +1,157 @@
+# datanode/test_segment_store.py
+"""Almacén de segmentos: reproducción del índice al reiniciar, cola rota del índice, borrado y compactación."""
+import os
+
+import pytest
+
+from block_manager import BlockStore
+from segment_store import INDEX_FILE, SegmentBlockStore
+
+BLOCK_SIZE = 1500
+SEGMENT_BYTES = 4096 # Dos bloques por segmento
+
+
+def _data(i, size=BLOCK_SIZE):
+    return bytes((i + n) % 251 for n in range(size))
+
+
+def _read(store, block_id):
+    return b''.join(store.read_chunks(block_id, 512))
+
+
+def _close(store):
+    """Simula la parada del proceso: suelta los descriptores sin reescribir nada."""
+    store._active_file.close()
+    store._index_file.close()
+
+
+@pytest.fixture
+def block_dir(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def open_store(block_dir):
+    stores = []
+    def _open():
+        store = SegmentBlockStore(block_dir, fsync_policy='none', segment_bytes=SEGMENT_BYTES)
+        stores.append(store)
+        return store
+    yield _open
+    for store in stores:
+        if not store._index_file.closed:
+            _close(store)
+
+
+def _fill(store, count):
+    for i in range(count):
+        ok, message = store.store(f"{i}_0", _data(i))
+        assert ok, message
+
+
+def test_index_replay_after_restart(open_store):
+    store = open_store()
+    _fill(store, 5)
+    store.delete('1_0')
+    store.store('2_0', _data(20)) # Reescritura: gana la última entrada
+    _close(store)
+
+    store = open_store()
+    assert sorted(store.list_block_ids()) == ['0_0', '2_0', '3_0', '4_0']
+    for i in (0, 3, 4):
+        assert _read(store, f"{i}_0") == _data(i)
+    assert _read(store, '2_0') == _data(20)
+    assert store.verify('0_0')[0]
+    store.store('5_0', _data(5)) # Sigue escribiendo tras el arranque
+    _close(store)
+    assert _read(open_store(), '5_0') == _data(5)
+
+
+@pytest.mark.parametrize('damage', ['truncate', 'garbage', 'bad_crc'])
+def test_torn_final_index_record_is_discarded(open_store, block_dir, damage):
+    store = open_store()
+    _fill(store, 3)
+    _close(store)
+    index_path = os.path.join(block_dir, 'segments', INDEX_FILE)
+    size = os.path.getsize(index_path)
+    with open(index_path, 'r+b') as f:
+        if damage == 'truncate': # Caída a mitad de la última entrada
+            f.truncate(size - 3)
+        elif damage == 'garbage':
+            f.seek(size)
+            f.write(b'\x01\x03\x00')
+        else:
+            f.seek(size - 1)
+            last = f.read(1)
+            f.seek(size - 1)
+            f.write(bytes([last[0] ^ 0xFF]))
+
+    store = open_store()
+    expected = ['0_0', '1_0'] if damage != 'garbage' else ['0_0', '1_0', '2_0']
+    assert sorted(store.list_block_ids()) == expected
+    for block_id in expected:
+        assert _read(store, block_id) == _data(int(block_id[0]))
+    store.store('9_0', _data(9)) # El índice se reescribió sin la cola rota: las nuevas entradas se reproducen
+    _close(store)
+    assert sorted(open_store().list_block_ids()) == sorted(expected + ['9_0'])
+
+
+def test_index_entry_pointing_past_a_truncated_segment_is_dropped(open_store, block_dir):
+    store = open_store()
+    _fill(store, 2)
+    _close(store)
+    segment_path = os.path.join(block_dir, 'segments', '00000001.seg')
+    os.truncate(segment_path, BLOCK_SIZE + 10)
+    assert open_store().list_block_ids() == ['0_0']
+
+
+def test_delete_then_compaction_reclaims_space(open_store, block_dir):
+    store = open_store()
+    _fill(store, 6) # Segmentos 1, 2 (cerrados) y 3 (activo)
+    assert store.delete('0_0')[0] and store.delete('2_0')[0] and store.delete('3_0')[0]
+    assert not store.delete('0_0')[0]
+    stats = store.segment_stats()
+    assert stats[1]['live_bytes'] == BLOCK_SIZE and stats[2]['live_bytes'] == 0
+
+    assert store.compact(min_dead_ratio=0.5) == 3 * BLOCK_SIZE # 1_0 se copia; 0_0, 2_0 y 3_0 se liberan
+    stats = store.segment_stats()
+    assert 1 not in stats and 2 not in stats
+    assert not os.path.exists(os.path.join(block_dir, 'segments', '00000001.seg'))
+    assert sorted(store.list_block_ids()) == ['1_0', '4_0', '5_0']
+    for i in (1, 4, 5):
+        assert _read(store, f"{i}_0") == _data(i)
+        assert store.verify(f"{i}_0")[0]
+    _close(store)
+
+    store = open_store() # Las reubicaciones también están en el índice
+    assert sorted(store.list_block_ids()) == ['1_0', '4_0', '5_0']
+    assert _read(store, '1_0') == _data(1)
+    assert sum(s['live_bytes'] for s in store.segment_stats().values()) == 3 * BLOCK_SIZE
+
+
+def test_compaction_skips_the_active_segment_and_live_segments(open_store):
+    store = open_store()
+    _fill(store, 3)
+    store.delete('2_0') # Vive en el segmento activo
+    assert store.compact(min_dead_ratio=0.5) == 0
+    assert sorted(store.segment_stats()) == [1, 2]
+
+
+def test_reads_during_compaction(open_store):
+    store = open_store()
+    _fill(store, 4)
+    store.delete('0_0')
+    reader = store.read_views('1_0', 512)
+    first = bytes(next(reader)) # El lector ya tiene mapeado el segmento viejo
+    assert store.compact(min_dead_ratio=0.5) > 0
+    assert 1 not in store.segment_stats()
+    rest = b''.join(bytes(view) for view in reader)
+    assert first + rest == _data(1) # Sigue leyendo del inodo borrado
+    assert _read(store, '1_0') == _data(1) # Las lecturas nuevas van a la ubicación nueva
+
+
+def test_incomplete_store_fails_at_instantiation(block_dir):
+    class _NoDelete(SegmentBlockStore):
+        delete = BlockStore.delete # Vuelve a dejar abstracto un método obligatorio
+    with pytest.raises(TypeError):
+        _NoDelete(block_dir, fsync_policy='none')
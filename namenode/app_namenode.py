@@ -1,13 +1,17 @@
 # namenode/app_namenode.py
 from flask import Flask, request, jsonify
+import argparse
 import logging
 import os
 import sys
+import threading
+import time
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 import metadata_manager
+from metadata_writer import MetadataWriter
 from common import config
 # Importar gRPC generado si el NameNode necesita hacer llamadas gRPC (ej. a DataNodes)
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'generated'))
@@ -20,6 +24,14 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_writer = None # MetadataWriter en modo servidor; sin él, cada petición abre su propia transacción
+
+def _mutate(fn, *args, **kwargs):
+    """Las mutaciones de metadatos pasan por el hilo escritor (group commit) cuando está activo."""
+    if _writer is None:
+        return fn(*args, **kwargs)
+    return _writer.call(fn, *args, **kwargs)
+
 # --- Operaciones del Sistema de Archivos (API REST) ---
 @app.route('/mkdir', methods=['POST']) # [cite: 28]
 def mkdir():
@@ -27,7 +39,7 @@ def mkdir():
     path = data.get('path')
     if not path:
         return jsonify({"error": "Se requiere la ruta"}), 400
-    obj, message = metadata_manager.create_directory(path)
+    obj, message = _mutate(metadata_manager.create_directory, path)
     if obj:
         return jsonify({"message": message, "path": path, "id": obj['id']}), 201
     return jsonify({"error": message}), 400
@@ -47,28 +59,12 @@ def rm():
     if not path:
         return jsonify({"error": "Se requiere la ruta"}), 400
     
-    success, message, block_ids_to_delete = metadata_manager.remove_object(path)
+    # recursive=True elimina directorios con contenido (rm -r) en una sola transacción
+    success, message, block_ids_to_delete = _mutate(metadata_manager.remove_object, path, recursive=bool(data.get('recursive', False)))
     
     if success:
-        if block_ids_to_delete: # Si era un archivo y tenía bloques
-            logger.info(f"Archivo {path} eliminado. Bloques a limpiar en DataNodes: {block_ids_to_delete}")
-            # Instruir a los DataNodes para que eliminen estos bloques físicamente
-            for block_id in block_ids_to_delete:
-                datanode_grpc_addresses = metadata_manager.get_block_locations_for_delete(block_id)
-                for dn_addr in datanode_grpc_addresses:
-                    try:
-                        with grpc.insecure_channel(dn_addr) as channel:
-                            stub = dfs_pb2_grpc.DataNodeServiceStub(channel)
-                            delete_req = dfs_pb2.DeleteBlockRequest(block_id=block_id)
-                            response = stub.DeleteBlock(delete_req, timeout=5)
-                            if response.success:
-                                logger.info(f"Bloque {block_id} eliminado de DataNode {dn_addr}")
-                            else:
-                                logger.warning(f"DataNode {dn_addr} falló al eliminar el bloque {block_id}: {response.message}")
-                    except grpc.RpcError as e:
-                        logger.error(f"Error gRPC al contactar a DataNode {dn_addr} para eliminar bloque {block_id}: {e.details()}")
-                    except Exception as e_gen:
-                        logger.error(f"Error inesperado al contactar a DataNode {dn_addr} para eliminar bloque {block_id}: {str(e_gen)}")
+        if block_ids_to_delete: # La limpieza física queda encolada y se entrega en los heartbeats de cada DataNode
+            logger.info(f"{path} eliminado. {len(block_ids_to_delete)} bloques encolados para eliminación en DataNodes.")
         return jsonify({"message": message}), 200
     return jsonify({"error": message}), 400
 
@@ -81,10 +77,27 @@ def rmdir():
     obj = metadata_manager._get_object_by_path(path) # Verificar que es un directorio
     if not obj: return jsonify({"error": "Directorio no encontrado"}), 404
     if not obj['is_directory']: return jsonify({"error": f"Ruta '{path}' no es un directorio."}), 400
-    success, message, _ = metadata_manager.remove_object(path) # remove_object maneja si está vacío
+    success, message, _ = _mutate(metadata_manager.remove_object, path) # remove_object maneja si está vacío
     if success: return jsonify({"message": message}), 200
     return jsonify({"error": message}), 400
 
+@app.route('/batch', methods=['POST'])
+def batch():
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({"error": "Se requiere una lista 'operations'"}), 400
+    atomic = bool(data.get('atomic', False))
+    if metadata_manager.is_read_only_batch(operations): # Solo lecturas: en paralelo, sin pasar por el escritor
+        results, message, block_ids_to_delete = metadata_manager.execute_batch(operations, atomic=atomic)
+    else:
+        results, message, block_ids_to_delete = _mutate(metadata_manager.execute_batch, operations, atomic=atomic)
+    if results is None:
+        return jsonify({"error": message}), 400
+    if block_ids_to_delete: # Encolados en la misma transacción; se limpian vía heartbeats
+        logger.info(f"Lote eliminó {len(block_ids_to_delete)} bloques, encolados para eliminación en DataNodes.")
+    return jsonify({"message": message, "results": results}), 200
+
 # --- Operaciones de Transferencia de Archivos (API REST) ---
 @app.route('/put/initiate', methods=['POST']) # [cite: 26, 28]
 def put_initiate():
@@ -95,8 +108,11 @@ def put_initiate():
         return jsonify({"error": "Se requieren ruta de archivo y tamaño total"}), 400
     if not isinstance(total_size, int) or total_size < 0:
         return jsonify({"error": "Tamaño total inválido"}), 400
+    codec, codec_level = data.get('codec'), data.get('codec_level') # Opcionales: el NameNode decide el códec final
+    if (codec is not None and not isinstance(codec, str)) or (codec_level is not None and not isinstance(codec_level, int)):
+        return jsonify({"error": "Códec o nivel de compresión inválido"}), 400
 
-    assignment_info, message = metadata_manager.initiate_file_put(file_path, total_size)
+    assignment_info, message = _mutate(metadata_manager.initiate_file_put, file_path, total_size, codec, codec_level)
     if assignment_info:
         return jsonify({"message": message, "data": assignment_info}), 200 # [cite: 25]
     return jsonify({"error": message}), 400
@@ -107,6 +123,9 @@ def put_complete():
     file_path = data.get('path')
     if not file_path: return jsonify({"error": "Se requiere la ruta del archivo"}), 400
     logger.info(f"Cliente completó 'put' para: {file_path}")
+    under_replicated = data.get('under_replicated') or [] # Bloques cuyo secundario falló en el pipeline
+    if under_replicated and isinstance(data.get('file_id'), int) and all(isinstance(b, str) for b in under_replicated):
+        _mutate(metadata_manager.report_under_replicated_blocks, data['file_id'], under_replicated)
     return jsonify({"message": f"Procesamiento de archivo {file_path} reconocido como completo por NameNode."}), 200
 
 @app.route('/get', methods=['GET']) # [cite: 28]
@@ -126,7 +145,7 @@ def register_datanode_route():
     flask_address = data.get('flask_address')
     if not all([datanode_id, grpc_address, flask_address]):
         return jsonify({"error": "datanode_id, grpc_address, y flask_address son requeridos"}), 400
-    result, message = metadata_manager.register_datanode(datanode_id, grpc_address, flask_address)
+    result, message = _mutate(metadata_manager.register_datanode, datanode_id, grpc_address, flask_address)
     if result: return jsonify({"message": message, "datanode_id_assigned": result['id']}), 201
     return jsonify({"error": message}), 400
 
@@ -135,22 +154,88 @@ def datanode_heartbeat_route():
     data = request.get_json()
     datanode_id = data.get('datanode_id')
     if not datanode_id: return jsonify({"error": "datanode_id es requerido"}), 400
-    success, message, tasks = metadata_manager.datanode_heartbeat(datanode_id)
+    args = (datanode_id, data.get('replication_results'), data.get('block_report'), data.get('deletion_results'),
+            data.get('storage'), data.get('grpc_address'), data.get('flask_address'))
+    # El heartbeat habitual solo renueva la tabla de vida en memoria: no ocupa el hilo escritor
+    read_only = metadata_manager.is_read_only_heartbeat(datanode_id, args[5], args[6], args[1], args[2], args[3])
+    heartbeat = metadata_manager.datanode_heartbeat
+    result = heartbeat(*args, read_only=True) if read_only else None
+    success, message, tasks = result or _mutate(heartbeat, *args) # None: hay algo que escribir
     if success: return jsonify({"message": message, "tasks": tasks}), 200
     return jsonify({"error": message}), 400
 
+@app.route('/datanode/block_report', methods=['POST'])
+def datanode_block_report_route():
+    data = request.get_json()
+    datanode_id = data.get('datanode_id')
+    block_ids = data.get('block_ids')
+    if not datanode_id or not isinstance(block_ids, list):
+        return jsonify({"error": "datanode_id y block_ids son requeridos"}), 400
+    success, message, orphans = _mutate(metadata_manager.process_full_block_report, datanode_id, block_ids)
+    if success: return jsonify({"message": message, "deletion_tasks": orphans}), 200
+    return jsonify({"error": message}), 400
+
+@app.route('/replication/status', methods=['GET'])
+def replication_status_route():
+    return jsonify(metadata_manager.get_replication_status()), 200
+
+@app.route('/containers/compact', methods=['POST'])
+def compact_containers_route(): # Pasada de mantenimiento de contenedores bajo demanda
+    summary, message = _mutate(metadata_manager.compact_containers)
+    if summary is not None: return jsonify({"message": message, **summary}), 200
+    return jsonify({"error": message}), 500
+
+def _liveness_loop():
+    """Persiste las caídas de DataNodes desde el hilo escritor; las lecturas ya los excluyen al vencer."""
+    while True:
+        time.sleep(config.HEARTBEAT_INTERVAL_SEC)
+        try:
+            _mutate(metadata_manager.expire_datanodes)
+        except Exception as e:
+            logger.error(f"Error marcando DataNodes caídos: {e}")
+
+def _container_maintenance_loop():
+    """Compactación periódica de contenedores de archivos pequeños (espacio de registros borrados)."""
+    while True:
+        time.sleep(config.CONTAINER_COMPACTION_INTERVAL_SEC)
+        try:
+            _mutate(metadata_manager.compact_containers)
+        except Exception as e:
+            logger.error(f"Error en la compactación periódica de contenedores: {e}")
+
 @app.cli.command('init-db')
 def init_db_command():
     metadata_manager.init_db()
     logger.info('Base de datos inicializada.')
 
+def serve(host, port, server='waitress', threads=None, group_commit=True):
+    """Arranca el NameNode. 'waitress' es el modo de producción (multihilo); 'flask' es el servidor de desarrollo."""
+    global _writer
+    if group_commit:
+        _writer = MetadataWriter(metadata_manager.get_pool).start()
+    threading.Thread(target=_liveness_loop, daemon=True, name="datanode-liveness").start()
+    threading.Thread(target=_container_maintenance_loop, daemon=True, name="container-compaction").start()
+    if server == 'waitress':
+        from waitress import serve as waitress_serve # Solo necesario en modo producción
+        waitress_serve(app, host=host, port=port, threads=threads or config.NAMENODE_SERVER_THREADS)
+    else:
+        app.run(host=host, port=port, debug=True, use_reloader=False, threaded=True)
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor NameNode para DFS.")
+    parser.add_argument("--server", choices=("waitress", "flask"), default="waitress", help="Servidor WSGI (flask = desarrollo).")
+    parser.add_argument("--threads", type=int, default=config.NAMENODE_SERVER_THREADS, help="Hilos que atienden peticiones.")
+    parser.add_argument("--no_group_commit", action="store_true", help="Cada mutación en su propia transacción, sin hilo escritor.")
+    args = parser.parse_args()
+
     db_file_path = os.path.join(os.path.dirname(__file__), config.METADATA_DB_PATH)
     if not os.path.exists(db_file_path):
          logger.info("Archivo de BD no encontrado, inicializando...")
          metadata_manager.init_db()
     else:
         logger.info("Archivo de BD encontrado.")
-    metadata_manager.get_active_datanodes() # Marcar DNs inactivos al inicio
-    logger.info(f"NameNode iniciando en {config.NAMENODE_HOST}:{config.NAMENODE_PORT}")
-    app.run(host=config.NAMENODE_HOST, port=config.NAMENODE_PORT, debug=True, use_reloader=False)
\ No newline at end of file
+        metadata_manager.init_db() # El esquema es idempotente: aplica índices/tablas nuevas a BDs existentes
+    metadata_manager.expire_datanodes() # Marcar DNs inactivos al inicio
+    metadata_manager.get_namespace() # Reconstruir el árbol del espacio de nombres en memoria
+    logger.info(f"NameNode iniciando en {config.NAMENODE_HOST}:{config.NAMENODE_PORT} ({args.server}, {args.threads} hilos)")
+    serve(config.NAMENODE_HOST, config.NAMENODE_PORT, args.server, args.threads, group_commit=not args.no_group_commit)
\ No newline at end of file
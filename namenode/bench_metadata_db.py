@@ -0,0 +1,121 @@
+# namenode/bench_metadata_db.py
+"""Benchmark de la capa SQLite de metadatos: conexión por operación (antes) vs. pool WAL (después).
+
+Uso: python bench_metadata_db.py [--ops N] [--readers N]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from db_pool import ConnectionPool
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'db_schema.sql')
+
+
+class LegacyAccess:
+    """Reproduce el patrón original: sqlite3.connect + PRAGMA por llamada, journal en modo rollback."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return conn
+
+    def write(self, sql, params):
+        conn = self._connect()
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    def read(self, sql, params):
+        conn = self._connect()
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+        return rows
+
+
+class PooledAccess:
+    def __init__(self, db_path):
+        self.pool = ConnectionPool(db_path)
+
+    def write(self, sql, params):
+        with self.pool.transaction() as conn:
+            conn.execute(sql, params)
+
+    def read(self, sql, params):
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+
+def _fresh_db(tmp_dir, name):
+    db_path = os.path.join(tmp_dir, name)
+    conn = sqlite3.connect(db_path)
+    with open(SCHEMA_PATH) as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO datanodes (datanode_id, grpc_address, flask_address) VALUES ('dn1', 'h:1', 'http://h:1')")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def run_mixed(access, num_ops):
+    """mkdir + heartbeat + ls secuenciales, proporción 1:1:2."""
+    start = time.perf_counter()
+    for i in range(num_ops // 4):
+        access.write("INSERT INTO fs_objects (parent_id, name, is_directory) VALUES (1, ?, TRUE)", (f"d{i}",))
+        access.write("UPDATE datanodes SET last_heartbeat = ? WHERE datanode_id = 'dn1'", (datetime.utcnow(),))
+        access.read("SELECT name, is_directory, size FROM fs_objects WHERE parent_id = 1 LIMIT 50", ())
+        access.read("SELECT id FROM datanodes WHERE is_active = TRUE", ())
+    return num_ops / (time.perf_counter() - start)
+
+
+def run_concurrent_reads(access, num_ops, num_readers):
+    """Lectores (/ls, /get) en paralelo con un escritor de heartbeats continuo."""
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            access.write("UPDATE datanodes SET last_heartbeat = ? WHERE datanode_id = 'dn1'", (datetime.utcnow(),))
+
+    def reader(n):
+        for _ in range(n):
+            access.read("SELECT name, is_directory, size FROM fs_objects WHERE parent_id = 1 LIMIT 50", ())
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+    per_reader = num_ops // num_readers
+    readers = [threading.Thread(target=reader, args=(per_reader,)) for _ in range(num_readers)]
+    start = time.perf_counter()
+    for t in readers: t.start()
+    for t in readers: t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    writer_thread.join()
+    return per_reader * num_readers / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark de acceso a la BD de metadatos.")
+    parser.add_argument("--ops", type=int, default=4000, help="Operaciones por escenario.")
+    parser.add_argument("--readers", type=int, default=4, help="Hilos lectores en el escenario concurrente.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {}
+        for label, factory in (("antes (conexión por op)", LegacyAccess), ("después (pool WAL)", PooledAccess)):
+            access = factory(_fresh_db(tmp_dir, f"{factory.__name__}.db"))
+            results[label] = (run_mixed(access, args.ops), run_concurrent_reads(access, args.ops, args.readers))
+
+        print(f"{'modo':<26}{'mixto ops/s':>14}{'lecturas concurrentes ops/s':>30}")
+        for label, (mixed, concurrent) in results.items():
+            print(f"{label:<26}{mixed:>14.0f}{concurrent:>30.0f}")
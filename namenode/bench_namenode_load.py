@@ -0,0 +1,141 @@
+# namenode/bench_namenode_load.py
+"""Benchmark de carga mixta del NameNode: mkdir + put/initiate + ls desde muchos hilos concurrentes.
+
+Compara cada petición con su propia transacción (antes) contra el hilo escritor con group commit (después).
+Los hilos simulan los del servidor WSGI llamando a metadata_manager igual que las rutas de app_namenode.
+Con --url se envía la misma carga por HTTP a un NameNode en ejecución.
+
+Uso: python bench_namenode_load.py [--workers N] [--ops N] [--url http://host:5000]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import metadata_manager
+from metadata_writer import MetadataWriter
+
+FILE_SIZE = 3 * 1024 * 1024 # Tres bloques por put/initiate con el tamaño de bloque por defecto
+
+
+class InProcessTarget:
+    def __init__(self, writer=None):
+        self.writer = writer
+
+    def _mutate(self, fn, *args):
+        return self.writer.call(fn, *args) if self.writer else fn(*args)
+
+    def mkdir(self, path):
+        obj, message = self._mutate(metadata_manager.create_directory, path)
+        return obj is not None, message
+
+    def put_initiate(self, path):
+        info, message = self._mutate(metadata_manager.initiate_file_put, path, FILE_SIZE)
+        return info is not None, message
+
+    def ls(self, path):
+        items, message = metadata_manager.list_directory(path)
+        return items is not None, message
+
+
+class HttpTarget:
+    def __init__(self, url):
+        import requests
+        self.url = url
+        self._local = threading.local()
+        self._requests = requests
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = self._requests.Session()
+        return self._local.session
+
+    def _call(self, method, endpoint, **kwargs):
+        response = self._session().request(method, f"{self.url}{endpoint}", timeout=30, **kwargs)
+        body = response.json()
+        return response.ok, body.get('error') or body.get('message')
+
+    def mkdir(self, path): return self._call('POST', '/mkdir', json={'path': path})
+    def put_initiate(self, path): return self._call('POST', '/put/initiate', json={'path': path, 'size': FILE_SIZE})
+    def ls(self, path): return self._call('GET', '/ls', params={'path': path})
+
+
+def run_mixed_load(target, run_id, num_workers, ops_per_worker):
+    """Cada iteración de un hilo: mkdir, put/initiate y dos ls (1:1:2). Devuelve métricas agregadas."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(num_workers + 1)
+
+    def worker(w):
+        base = f"/bench_{run_id}/w{w}"
+        local_lat, local_err = [], []
+        target.mkdir(base)
+        start_barrier.wait()
+        for i in range(ops_per_worker // 4):
+            for op, path in (('mkdir', f"{base}/d{i}"), ('put_initiate', f"{base}/f{i}"), ('ls', base), ('ls', f"{base}/d{i}")):
+                t0 = time.perf_counter()
+                try:
+                    ok, message = getattr(target, op)(path)
+                except Exception as e:
+                    ok, message = False, str(e)
+                local_lat.append(time.perf_counter() - t0)
+                if not ok: local_err.append(f"{op}: {message}")
+        with lock:
+            latencies.extend(local_lat)
+            errors.extend(local_err)
+
+    target.mkdir(f"/bench_{run_id}")
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(num_workers)]
+    for t in threads: t.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    return {"ops_per_sec": len(latencies) / elapsed, "p50_ms": pct(0.50), "p99_ms": pct(0.99),
+            "errors": len(errors), "sample_error": errors[0] if errors else ""}
+
+
+def _setup_db(tmp_dir, name):
+    metadata_manager.DB_PATH = os.path.join(tmp_dir, name)
+    metadata_manager.init_db()
+    for n in range(3): # put/initiate necesita DataNodes activos
+        metadata_manager.register_datanode(f"bench-dn{n}", f"bench:{n}", f"http://bench:{n}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark de carga mixta del NameNode.")
+    parser.add_argument("--workers", type=int, default=16, help="Hilos concurrentes (como los del servidor).")
+    parser.add_argument("--ops", type=int, default=400, help="Operaciones por hilo.")
+    parser.add_argument("--url", default=None, help="NameNode en ejecución a medir por HTTP en lugar de en proceso.")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO) # Los logs por operación distorsionan la medición
+
+    results = {}
+    if args.url:
+        results["http"] = run_mixed_load(HttpTarget(args.url), int(time.time()), args.workers, args.ops)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _setup_db(tmp_dir, "per_request.db")
+            results["antes (transacción por petición)"] = run_mixed_load(InProcessTarget(), "a", args.workers, args.ops)
+
+            _setup_db(tmp_dir, "group_commit.db")
+            writer = MetadataWriter(metadata_manager.get_pool).start()
+            results["después (escritor + group commit)"] = run_mixed_load(InProcessTarget(writer), "b", args.workers, args.ops)
+            writer.stop()
+            print(f"Escritor: {writer.stats['operations']} mutaciones en {writer.stats['batches']} transacciones "
+                  f"(máx. {writer.stats['max_batch']} por lote)")
+            metadata_manager.get_pool().close_all()
+
+    print(f"{'modo':<36}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errores':>10}")
+    for label, r in results.items():
+        print(f"{label:<36}{r['ops_per_sec']:>10.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['errors']:>10}")
+        if r['sample_error']: print(f"    p. ej.: {r['sample_error']}")
@@ -0,0 +1,37 @@
+# namenode/conftest.py
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import metadata_manager
+import placement_policy
+from replication_manager import ReplicationScheduler
+from common import config
+
+
+@pytest.fixture
+def metadata(tmp_path, monkeypatch):
+    """metadata_manager sobre una BD nueva en tmp_path, sin el hilo escritor (cada operación confirma sola)."""
+    monkeypatch.setattr(metadata_manager, 'DB_PATH', str(tmp_path / 'metadata.db'))
+    monkeypatch.setattr(metadata_manager, '_replication', ReplicationScheduler())
+    monkeypatch.setattr(metadata_manager, '_full_report_received', set())
+    monkeypatch.setattr(metadata_manager, '_compaction_dispatched', {})
+    monkeypatch.setattr(placement_policy, '_policy', None)
+    monkeypatch.setattr(config, 'PLACEMENT_POLICY', 'random')
+    metadata_manager.init_db()
+    yield metadata_manager
+    metadata_manager.get_pool().close_all()
+
+
+@pytest.fixture
+def datanodes(metadata):
+    """Tres DataNodes registrados y vivos; devuelve sus ids de BD por datanode_id."""
+    ids = {}
+    for i in range(3):
+        node, _ = metadata.register_datanode(f"dn{i}", f"127.0.0.1:{50051 + i}", f"http://127.0.0.1:{5001 + i}")
+        ids[node['datanode_id']] = node['id']
+    return ids
@@ -0,0 +1,165 @@
+# namenode/db_pool.py
+import sqlite3
+import threading
+import contextlib
+import logging
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common import config
+
+logger = logging.getLogger(__name__)
+
+
+def default_pragmas():
+    return [
+        "PRAGMA journal_mode = WAL;", # Los lectores no se bloquean detrás de un escritor
+        f"PRAGMA synchronous = {config.METADATA_DB_SYNCHRONOUS};",
+        f"PRAGMA cache_size = -{config.METADATA_DB_CACHE_SIZE_KB};", # Negativo = KiB
+        f"PRAGMA mmap_size = {config.METADATA_DB_MMAP_SIZE_BYTES};",
+        f"PRAGMA busy_timeout = {config.METADATA_DB_BUSY_TIMEOUT_MS};",
+        "PRAGMA temp_store = MEMORY;",
+        "PRAGMA foreign_keys = ON;",
+    ]
+
+
+class ConnectionPool:
+    """Pool de conexiones SQLite: cada hilo reutiliza una conexión mientras la tiene prestada.
+
+    Las conexiones se abren en modo autocommit (isolation_level=None) y las transacciones
+    se controlan explícitamente con transaction(), que admite anidamiento mediante SAVEPOINTs.
+    """
+
+    def __init__(self, db_path, max_idle=None, pragmas=None):
+        self.db_path = db_path
+        self.max_idle = max_idle if max_idle is not None else config.METADATA_DB_POOL_MAX_IDLE
+        self.pragmas = pragmas if pragmas is not None else default_pragmas()
+        self._idle = []
+        self._idle_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False,
+                               cached_statements=config.METADATA_DB_STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def _release(self, conn):
+        if conn.in_transaction: # Nunca devolver al pool una transacción a medias
+            conn.execute("ROLLBACK")
+        with self._idle_lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _state(self):
+        state = self._local
+        if not hasattr(state, 'conn'):
+            state.conn = None
+            state.depth = 0
+            state.tx_depth = 0
+            state.undo = []
+            state.after_commit = []
+        return state
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Presta la conexión del hilo actual; las llamadas anidadas comparten la misma."""
+        state = self._state()
+        if state.conn is not None:
+            state.depth += 1
+            try:
+                yield state.conn
+            finally:
+                state.depth -= 1
+            return
+        conn = self._acquire()
+        state.conn, state.depth = conn, 1
+        try:
+            yield conn
+        finally:
+            state.conn, state.depth = None, 0
+            state.tx_depth = 0
+            state.undo = []
+            state.after_commit = []
+            self._release(conn)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Transacción de escritura. Anidada dentro de otra, usa un SAVEPOINT propio."""
+        with self.connection() as conn:
+            state = self._state()
+            savepoint = f"sp_{state.tx_depth}" if state.tx_depth else None
+            conn.execute(f"SAVEPOINT {savepoint}" if savepoint else "BEGIN IMMEDIATE")
+            undo_mark, commit_mark = len(state.undo), len(state.after_commit)
+            state.tx_depth += 1
+            committed = []
+            try:
+                yield conn
+                if savepoint:
+                    conn.execute(f"RELEASE {savepoint}")
+                else:
+                    conn.execute("COMMIT")
+                    committed = state.after_commit
+            except BaseException:
+                if savepoint:
+                    conn.execute(f"ROLLBACK TO {savepoint}")
+                    conn.execute(f"RELEASE {savepoint}")
+                elif conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                del state.after_commit[commit_mark:]
+                self._run_undo(state, undo_mark)
+                raise
+            finally:
+                state.tx_depth -= 1
+                if not state.tx_depth:
+                    state.undo = []
+                    state.after_commit = []
+            self._run_actions(committed, "tras COMMIT")
+
+    def on_rollback(self, fn):
+        """Registra una acción que deshace un cambio en memoria si la transacción actual se revierte."""
+        state = self._state()
+        if state.tx_depth:
+            state.undo.append(fn)
+
+    def on_commit(self, fn):
+        """Registra una acción que publica un cambio en memoria cuando la transacción exterior confirma.
+
+        Si el SAVEPOINT donde se registró se revierte, la acción se descarta. Fuera de una transacción corre ya.
+        """
+        state = self._state()
+        if state.tx_depth:
+            state.after_commit.append(fn)
+        else:
+            fn()
+
+    @classmethod
+    def _run_undo(cls, state, undo_mark):
+        pending = state.undo[undo_mark:]
+        del state.undo[undo_mark:]
+        cls._run_actions(reversed(pending), "tras rollback")
+
+    @staticmethod
+    def _run_actions(actions, when):
+        for fn in actions:
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"Error aplicando cambio en memoria {when}: {e}")
+
+    def close_all(self):
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
@@ -42,5 +42,60 @@ CREATE TABLE IF NOT EXISTS block_locations (
     UNIQUE (block_id, datanode_id)
 );
 
+-- Bloques de un archivo (borrado en cascada y rm -r)
+CREATE INDEX IF NOT EXISTS idx_blocks_file ON blocks(file_id);
+
+-- Reconciliación de reportes de bloques por DataNode
+CREATE INDEX IF NOT EXISTS idx_block_locations_datanode ON block_locations(datanode_id);
+
+-- Cola persistente de eliminaciones físicas pendientes por DataNode (se entrega en los heartbeats)
+CREATE TABLE IF NOT EXISTS pending_deletions (
+    block_id TEXT NOT NULL, -- Sin FK: el bloque ya no existe en `blocks`
+    datanode_id INTEGER NOT NULL, -- Referencia a datanodes.id
+    queued_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    dispatched_time TIMESTAMP, -- NULL hasta entregarse; se reenvía si no se confirma a tiempo
+    FOREIGN KEY (datanode_id) REFERENCES datanodes(id) ON DELETE CASCADE,
+    PRIMARY KEY (datanode_id, block_id)
+);
+
+-- Contenedores de archivos pequeños: bloques compartidos (fila en `blocks`, tamaño = bytes reservados)
+CREATE TABLE IF NOT EXISTS containers (
+    block_id TEXT PRIMARY KEY,
+    live_bytes INTEGER NOT NULL DEFAULT 0, -- Bytes de registros de archivos que aún existen
+    sealed BOOLEAN NOT NULL DEFAULT FALSE, -- Lleno o con réplicas caídas: sin más registros, compactable
+    FOREIGN KEY (block_id) REFERENCES blocks(block_id) ON DELETE CASCADE
+);
+
+-- Archivos empaquetados: (contenedor, offset, longitud) de su registro en lugar de bloques propios
+CREATE TABLE IF NOT EXISTS packed_files (
+    file_id INTEGER PRIMARY KEY,
+    container_id TEXT NOT NULL,
+    record_offset INTEGER NOT NULL,
+    record_length INTEGER NOT NULL, -- Cabecera + datos
+    FOREIGN KEY (file_id) REFERENCES fs_objects(id) ON DELETE CASCADE,
+    FOREIGN KEY (container_id) REFERENCES containers(block_id)
+);
+CREATE INDEX IF NOT EXISTS idx_packed_files_container ON packed_files(container_id);
+
+-- Compactaciones en curso: los DataNodes copian los registros vivos, en orden, a un contenedor nuevo
+CREATE TABLE IF NOT EXISTS container_compactions (
+    old_block_id TEXT PRIMARY KEY,
+    new_block_id TEXT NOT NULL,
+    layout TEXT NOT NULL, -- JSON [[offset, longitud], ...]; en el nuevo contenedor quedan contiguos en ese orden
+    created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Códec de los bloques comprimidos (sin fila: bloque sin comprimir); `blocks.size` sigue siendo el tamaño sin comprimir
+CREATE TABLE IF NOT EXISTS block_codecs (
+    block_id TEXT PRIMARY KEY,
+    codec TEXT NOT NULL, -- 'zlib' o 'lzma'
+    level INTEGER NOT NULL,
+    frame_size INTEGER NOT NULL, -- Bytes sin comprimir por frame
+    FOREIGN KEY (block_id) REFERENCES blocks(block_id) ON DELETE CASCADE
+);
+
 -- Inicializar directorio raíz si no existe
-INSERT OR IGNORE INTO fs_objects (id, parent_id, name, is_directory) VALUES (1, NULL, '/', TRUE);
\ No newline at end of file
+INSERT OR IGNORE INTO fs_objects (id, parent_id, name, is_directory) VALUES (1, NULL, '/', TRUE);
+
+-- Propietario oculto de los bloques contenedor (tras la raíz, que debe quedar con id 1; fuera del árbol: parent_id 0 no es un directorio)
+INSERT OR IGNORE INTO fs_objects (parent_id, name, is_directory) VALUES (0, '.containers', FALSE);
\ No newline at end of file
@@ -0,0 +1,109 @@
+# namenode/liveness.py
+import heapq
+import itertools
+import threading
+
+
+class _NodeState:
+    __slots__ = ('id', 'datanode_id', 'grpc_address', 'flask_address', 'active', 'expires_at')
+
+    def __init__(self, id, datanode_id, grpc_address, flask_address):
+        self.id = id
+        self.datanode_id = datanode_id
+        self.grpc_address = grpc_address
+        self.flask_address = flask_address
+        self.active = False
+        self.expires_at = 0.0
+
+    def to_dict(self):
+        return {"id": self.id, "datanode_id": self.datanode_id,
+                "grpc_address": self.grpc_address, "flask_address": self.flask_address}
+
+
+class LivenessTable:
+    """Estado vivo/caído de los DataNodes en memoria, con un índice de expiración (heap por vencimiento).
+
+    Un heartbeat solo renueva el vencimiento en memoria; a SQLite solo llegan las transiciones
+    (alta, vuelta a la vida, caída), que devuelven touch()/register()/expire().
+    """
+
+    def __init__(self, timeout_sec):
+        self.timeout_sec = timeout_sec
+        self._lock = threading.Lock()
+        self._nodes = {} # datanode_id -> _NodeState
+        self._expiry = [] # (vencimiento, secuencia, datanode_id); entradas obsoletas se descartan al salir
+        self._seq = itertools.count()
+        self._active_cache = None
+
+    @classmethod
+    def load(cls, conn, timeout_sec, now):
+        """Carga los DataNodes registrados. Los que la BD da por activos reciben un periodo de gracia."""
+        table = cls(timeout_sec)
+        rows = conn.execute("SELECT id, datanode_id, grpc_address, flask_address, is_active FROM datanodes").fetchall()
+        for row in rows:
+            node = table._nodes[row['datanode_id']] = _NodeState(row['id'], row['datanode_id'], row['grpc_address'], row['flask_address'])
+            if row['is_active']:
+                table._renew_locked(node, now)
+        return table
+
+    def _renew_locked(self, node, now):
+        revived = not node.active
+        node.active = True
+        node.expires_at = now + self.timeout_sec
+        heapq.heappush(self._expiry, (node.expires_at, next(self._seq), node.datanode_id))
+        if revived:
+            self._active_cache = None
+        return revived
+
+    def get(self, datanode_id):
+        with self._lock:
+            return self._nodes.get(datanode_id)
+
+    def register(self, node_id, datanode_id, grpc_address, flask_address, now):
+        with self._lock:
+            node = self._nodes.get(datanode_id)
+            if node is None or node.id != node_id:
+                node = self._nodes[datanode_id] = _NodeState(node_id, datanode_id, grpc_address, flask_address)
+            elif (node.grpc_address, node.flask_address) != (grpc_address, flask_address):
+                node.grpc_address, node.flask_address = grpc_address, flask_address
+                self._active_cache = None
+            return node, self._renew_locked(node, now)
+
+    def touch(self, datanode_id, now):
+        """Renueva el vencimiento. Devuelve True si el nodo estaba caído (transición a persistir)."""
+        with self._lock:
+            return self._renew_locked(self._nodes[datanode_id], now)
+
+    def touch_if_alive(self, datanode_id, now):
+        """Renueva el vencimiento solo si el nodo sigue activo y sin vencer: nunca produce una transición."""
+        with self._lock:
+            node = self._nodes.get(datanode_id)
+            if node is None or not node.active or node.expires_at <= now:
+                return False
+            self._renew_locked(node, now)
+            return True
+
+    def expire(self, now):
+        """Marca caídos los nodos vencidos. Coste proporcional a las entradas vencidas, no al total de nodos."""
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, _, datanode_id = heapq.heappop(self._expiry)
+                node = self._nodes.get(datanode_id)
+                if node is None or not node.active or node.expires_at != expires_at:
+                    continue # Renovado después: entrada obsoleta
+                node.active = False
+                expired.append(node)
+            if expired:
+                self._active_cache = None
+        return expired
+
+    def active_nodes(self, now=None):
+        """Lista de DataNodes activos; se reconstruye solo cuando hubo transiciones.
+
+        Con `now`, excluye también los vencidos cuya caída aún no se procesó con expire().
+        """
+        with self._lock:
+            if self._active_cache is None:
+                self._active_cache = [n for n in self._nodes.values() if n.active]
+            return [n.to_dict() for n in self._active_cache if now is None or n.expires_at > now]
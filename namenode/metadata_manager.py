@@ -1,223 +1,427 @@
 # namenode/metadata_manager.py
+import json
+import random
 import sqlite3
 import os
 import uuid
 from datetime import datetime, timedelta
-import random
 import logging
+import threading
+import time
 
 import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from common import config
+from common.container_format import CONTAINER_PREFIX, record_length
+from common import block_codec
+from namespace_tree import NamespaceTree, Inode, SYSTEM_PARENT_ID
+from db_pool import ConnectionPool
+from replication_manager import ReplicationScheduler
+from placement_policy import get_placement_policy
+from liveness import LivenessTable
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 DB_PATH = os.path.join(os.path.dirname(__file__), config.METADATA_DB_PATH)
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Pool de conexiones compartido por todo el proceso (WAL, pragmas ajustados)."""
+    global _pool
+    if _pool is None or _pool.db_path != DB_PATH:
+        with _pool_lock:
+            if _pool is None or _pool.db_path != DB_PATH:
+                if _pool is not None:
+                    _pool.close_all()
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
 
 def init_db():
+    global _namespace, _liveness, _container_owner_id
     if os.path.exists(DB_PATH):
         logging.info("La base de datos ya existe.")
-    conn = get_db_connection()
     schema_path = os.path.join(os.path.dirname(__file__), 'db_schema.sql')
     with open(schema_path) as f:
-        conn.executescript(f.read())
-    conn.commit()
-    conn.close()
+        schema_sql = f.read()
+    with get_pool().connection() as conn:
+        conn.executescript(schema_sql)
+    _namespace = None # Forzar la recarga del árbol en memoria
+    _liveness = None
+    _container_owner_id = None
     logging.info("Base de datos inicializada.")
 
+_replication = ReplicationScheduler() # Estado de re-replicación; se reconstruye escaneando la BD
+
+# --- Árbol del espacio de nombres en memoria ---
+_namespace = None
+_namespace_load_lock = threading.Lock()
+
+def get_namespace():
+    """Devuelve el árbol en memoria, cargándolo desde la BD en el primer uso."""
+    global _namespace
+    if _namespace is None:
+        with _namespace_load_lock:
+            if _namespace is None:
+                with get_pool().connection() as conn:
+                    _namespace = NamespaceTree.load(conn)
+    return _namespace
+
+# --- Tabla de vida de los DataNodes en memoria ---
+_liveness = None
+_liveness_load_lock = threading.Lock()
+
+def get_liveness():
+    """Devuelve la tabla de vida en memoria, cargándola desde la BD en el primer uso."""
+    global _liveness
+    if _liveness is None:
+        with _liveness_load_lock:
+            if _liveness is None:
+                with get_pool().connection() as conn:
+                    _liveness = LivenessTable.load(conn, config.HEARTBEAT_INTERVAL_SEC * config.HEARTBEAT_TIMEOUT_FACTOR, time.monotonic())
+    return _liveness
+
+def _stage_tree_add(pool, tree, inode):
+    """Engancha el inodo en el árbol dentro de la transacción actual; los lectores lo ven tras el COMMIT."""
+    tree.stage_add(inode)
+    pool.on_rollback(lambda: tree.discard_add(inode))
+    pool.on_commit(lambda: tree.publish_add(inode))
+    return inode
+
+def _stage_tree_remove(pool, tree, inode):
+    tree.stage_remove(inode)
+    pool.on_rollback(lambda: tree.discard_remove(inode))
+    pool.on_commit(lambda: tree.publish_remove(inode))
+
+def _now_timestamp():
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S') # Mismo formato que CURRENT_TIMESTAMP
+
+def _in_flight_since():
+    """Archivos creados desde este instante pueden tener escrituras aún en vuelo hacia los DataNodes."""
+    return (datetime.utcnow() - timedelta(seconds=config.WRITE_IN_FLIGHT_GRACE_SEC)).strftime('%Y-%m-%d %H:%M:%S')
+
+# Contenedores con algún registro de un archivo creado desde el instante dado
+RECENT_CONTAINER_RECORDS_QUERY = "SELECT p.container_id FROM packed_files p JOIN fs_objects f ON f.id = p.file_id WHERE f.creation_time >= ?"
+
 # --- Operaciones de Directorios y Archivos ---
 def _get_object_by_path(path_str):
-    conn = get_db_connection()
-    parts = [p for p in path_str.strip('/').split('/') if p]
-    current_parent_id = 1 # ID del directorio raíz
-
-    if not parts: # La ruta es la raíz
-        obj = conn.execute("SELECT * FROM fs_objects WHERE id = ?", (current_parent_id,)).fetchone()
-        conn.close()
-        return obj
-
-    obj = None
-    for i, part_name in enumerate(parts):
-        is_last_part = (i == len(parts) - 1)
-        query = "SELECT * FROM fs_objects WHERE parent_id = ? AND name = ?"
-        if not is_last_part: # Debe ser un directorio si no es la última parte
-            query += " AND is_directory = TRUE"
-
-        obj = conn.execute(query, (current_parent_id, part_name)).fetchone()
-        if not obj:
-            conn.close()
-            return None
-        current_parent_id = obj['id']
-    conn.close()
-    return obj
+    return get_namespace().lookup(path_str)
+
+def _split_parent(path_str):
+    parts = NamespaceTree.split_path(path_str)
+    return parts[-1], '/' + '/'.join(parts[:-1])
 
 def create_directory(path_str): # Para `mkdir` [cite: 28]
-    conn = get_db_connection()
     if not path_str.startswith('/'):
         return None, "La ruta debe ser absoluta (comenzar con '/')."
     if path_str == '/':
         return _get_object_by_path('/'), "El directorio raíz ya existe."
 
-    parts = [p for p in path_str.strip('/').split('/') if p]
+    parts = NamespaceTree.split_path(path_str)
     if not parts:
          return _get_object_by_path('/'), "No se puede crear la raíz."
 
-    dir_name = parts[-1]
-    parent_path = '/' + '/'.join(parts[:-1])
+    dir_name, parent_path = _split_parent(path_str)
 
-    parent_obj = _get_object_by_path(parent_path)
+    tree = get_namespace()
+    parent_obj = tree.lookup(parent_path)
     if not parent_obj:
         return None, f"La ruta padre '{parent_path}' no existe."
     if not parent_obj['is_directory']:
         return None, f"La ruta padre '{parent_path}' no es un directorio."
+    if tree.child(parent_obj, dir_name):
+        return None, f"El directorio o archivo '{dir_name}' ya existe en '{parent_path}'."
 
+    now = _now_timestamp()
+    pool = get_pool()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO fs_objects (parent_id, name, is_directory) VALUES (?, ?, TRUE)",
-            (parent_obj['id'], dir_name)
-        )
-        new_dir_id = cursor.lastrowid
-        conn.commit()
-        new_dir_obj = conn.execute("SELECT * FROM fs_objects WHERE id = ?", (new_dir_id,)).fetchone()
-        conn.close()
+        with pool.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO fs_objects (parent_id, name, is_directory, creation_time, modification_time) VALUES (?, ?, TRUE, ?, ?)",
+                (parent_obj['id'], dir_name, now, now)
+            )
+            new_dir_obj = _stage_tree_add(pool, tree, Inode(cursor.lastrowid, parent_obj['id'], dir_name, True, 0, now, now))
         return new_dir_obj, "Directorio creado exitosamente."
     except sqlite3.IntegrityError:
-        conn.close()
         return None, f"El directorio o archivo '{dir_name}' ya existe en '{parent_path}'."
 
 def list_directory(path_str): # Para `ls` [cite: 28]
-    parent_obj = _get_object_by_path(path_str)
+    tree = get_namespace()
+    parent_obj = tree.lookup(path_str)
     if not parent_obj:
         return None, f"Ruta '{path_str}' no encontrada."
     if not parent_obj['is_directory']:
         return None, f"Ruta '{path_str}' no es un directorio."
+    return tree.list_children(parent_obj), "Listado exitoso."
 
-    conn = get_db_connection()
-    items = conn.execute(
-        "SELECT name, is_directory, size, modification_time FROM fs_objects WHERE parent_id = ?",
-        (parent_obj['id'],)
-    ).fetchall()
-    conn.close()
-    return [{"name": item['name'], "is_directory": bool(item['is_directory']),
-             "size": item['size'], "modified": item['modification_time']} for item in items], "Listado exitoso."
+def _queue_block_deletions(conn, block_ids_query, params):
+    """Encola la eliminación física de cada réplica de los bloques seleccionados, en la misma transacción.
 
-def remove_object(path_str): # Para `rm` y `rmdir` [cite: 28]
-    conn = get_db_connection()
-    obj = _get_object_by_path(path_str)
+    Debe llamarse antes del DELETE en cascada: las ubicaciones desaparecen con los bloques.
+    """
+    conn.execute(f"""
+        INSERT OR IGNORE INTO pending_deletions (block_id, datanode_id)
+        SELECT bl.block_id, bl.datanode_id FROM block_locations bl
+        WHERE bl.block_id IN ({block_ids_query})
+    """, params)
+
+def remove_object(path_str, recursive=False): # Para `rm` y `rmdir` [cite: 28]
+    tree = get_namespace()
+    obj = tree.lookup(path_str)
     if not obj:
         return False, "Objeto no encontrado.", []
     if obj['name'] == '/' and obj['parent_id'] is None: # Directorio Raíz
         return False, "No se puede eliminar el directorio raíz.", []
 
-    if obj['is_directory']:
-        children = conn.execute("SELECT 1 FROM fs_objects WHERE parent_id = ? LIMIT 1", (obj['id'],)).fetchone()
-        if children:
-            return False, "El directorio no está vacío.", []
-    
-    deleted_block_ids = []
-    if not obj['is_directory']: # Si es un archivo, obtener sus bloques antes de la eliminación en cascada
-        blocks_stmt = conn.execute("SELECT block_id FROM blocks WHERE file_id = ?", (obj['id'],))
-        deleted_block_ids = [row['block_id'] for row in blocks_stmt.fetchall()]
+    if obj['is_directory'] and tree.has_children(obj) and not recursive:
+        return False, "El directorio no está vacío.", []
 
+    pool = get_pool()
+    deleted_block_ids = []
     try:
-        conn.execute("DELETE FROM fs_objects WHERE id = ?", (obj['id'],)) # CASCADE se encarga de blocks y block_locations
-        conn.commit()
-        conn.close()
+        with pool.transaction() as conn:
+            if obj['is_directory'] and obj.children: # También hijos aún sin confirmar: el SQL ve toda la transacción
+                deleted_block_ids = _remove_subtree(conn, obj['id'])
+            else:
+                if not obj['is_directory']: # Si es un archivo, obtener sus bloques antes de la eliminación en cascada
+                    blocks_stmt = conn.execute("SELECT block_id FROM blocks WHERE file_id = ?", (obj['id'],))
+                    deleted_block_ids = [row['block_id'] for row in blocks_stmt.fetchall()]
+                    _queue_block_deletions(conn, "SELECT block_id FROM blocks WHERE file_id = ?", (obj['id'],))
+                    _release_packed_records(conn, "SELECT ?", (obj['id'],))
+                conn.execute("DELETE FROM fs_objects WHERE id = ?", (obj['id'],)) # CASCADE se encarga de blocks y block_locations
+            _stage_tree_remove(pool, tree, obj)
         return True, "Objeto eliminado exitosamente.", deleted_block_ids
     except Exception as e:
-        conn.rollback()
-        conn.close()
         logging.error(f"Error eliminando objeto {path_str}: {e}")
         return False, f"Error eliminando objeto: {e}", []
 
+def _remove_subtree(conn, root_id):
+    """Elimina un directorio y todo su contenido (rm -r). Devuelve los block_ids encolados para limpieza.
+
+    El subárbol se resuelve con una sola consulta recursiva y se materializa en una tabla temporal;
+    el resto son operaciones de conjuntos, sin ida y vuelta por objeto.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS removed_subtree (id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM removed_subtree")
+    conn.execute("""
+        INSERT INTO removed_subtree (id)
+        WITH RECURSIVE subtree(id) AS (
+            SELECT ?
+            UNION ALL
+            SELECT f.id FROM fs_objects f JOIN subtree s ON f.parent_id = s.id
+        )
+        SELECT id FROM subtree
+    """, (root_id,))
+    subtree_blocks = "SELECT block_id FROM blocks WHERE file_id IN (SELECT id FROM removed_subtree)"
+    deleted_block_ids = [row['block_id'] for row in conn.execute(subtree_blocks).fetchall()]
+    _queue_block_deletions(conn, subtree_blocks, ())
+    _release_packed_records(conn, "SELECT id FROM removed_subtree", ())
+    conn.execute("DELETE FROM blocks WHERE file_id IN (SELECT id FROM removed_subtree)") # CASCADE: block_locations
+    conn.execute("DELETE FROM fs_objects WHERE id IN (SELECT id FROM removed_subtree)")
+    conn.execute("DELETE FROM removed_subtree")
+    return deleted_block_ids
+
+
+# --- Contenedores de archivos pequeños ---
+_container_owner_id = None
+
+def _get_container_owner_id(conn):
+    """id del objeto oculto dueño de los bloques contenedor (fuera del árbol del espacio de nombres)."""
+    global _container_owner_id
+    if _container_owner_id is None:
+        row = conn.execute("SELECT id FROM fs_objects WHERE parent_id = ? AND name = '.containers'", (SYSTEM_PARENT_ID,)).fetchone()
+        _container_owner_id = row['id']
+    return _container_owner_id
+
+def _is_small_file(total_size):
+    return 0 < total_size <= config.SMALL_FILE_THRESHOLD_BYTES
+
+def _release_packed_records(conn, file_ids_query, params):
+    """Descuenta de cada contenedor los registros de los archivos eliminados; la compactación recupera el espacio.
+
+    Debe llamarse antes del DELETE en cascada de fs_objects, que borra sus filas de packed_files.
+    """
+    conn.execute(f"""
+        UPDATE containers SET live_bytes = live_bytes - (
+            SELECT SUM(p.record_length) FROM packed_files p
+            WHERE p.container_id = containers.block_id AND p.file_id IN ({file_ids_query}))
+        WHERE block_id IN (SELECT container_id FROM packed_files WHERE file_id IN ({file_ids_query}))
+    """, params + params)
+
+def _seal_containers_on(conn, node_ids):
+    """Sella los contenedores abiertos con réplica en nodos caídos: solo se re-replican contenedores inmutables."""
+    conn.executemany("""
+        UPDATE containers SET sealed = TRUE
+        WHERE NOT sealed AND block_id IN (SELECT block_id FROM block_locations WHERE datanode_id = ?)
+    """, ((node_id,) for node_id in node_ids))
+
+def _open_container(conn, active_datanodes):
+    block_id = f"{CONTAINER_PREFIX}{uuid.uuid4().hex[:16]}"
+    nodes = get_placement_policy().start_file(active_datanodes).choose(config.CONTAINER_SIZE_BYTES)
+    conn.execute("INSERT INTO blocks (block_id, file_id, block_sequence, size) VALUES (?, ?, 0, 0)",
+                 (block_id, _get_container_owner_id(conn)))
+    conn.execute("INSERT INTO containers (block_id) VALUES (?)", (block_id,))
+    conn.executemany("INSERT INTO block_locations (block_id, datanode_id, is_primary) VALUES (?, ?, ?)",
+                     ((block_id, node['id'], i == 0) for i, node in enumerate(nodes)))
+    logging.info(f"Contenedor {block_id} abierto en {[node['datanode_id'] for node in nodes]}")
+    return block_id, 0, nodes
+
+def _assign_container_record(conn, file_id, total_size, active_datanodes):
+    """Reserva el registro de un archivo pequeño al final de un contenedor abierto (o de uno nuevo).
+
+    Solo se agrega a contenedores con todas sus réplicas vivas; los llenos o degradados se sellan.
+    Varios contenedores abiertos reparten las escrituras concurrentes entre DataNodes.
+    """
+    length = record_length(total_size)
+    max_record = record_length(config.SMALL_FILE_THRESHOLD_BYTES)
+    nodes_by_id = {dn['id']: dn for dn in active_datanodes}
+    rows = conn.execute("""
+        SELECT c.block_id, b.size, GROUP_CONCAT(bl.datanode_id) AS node_ids,
+               MAX(CASE WHEN bl.is_primary THEN bl.datanode_id END) AS primary_id
+        FROM containers c
+        JOIN blocks b ON b.block_id = c.block_id
+        LEFT JOIN block_locations bl ON bl.block_id = c.block_id
+        WHERE NOT c.sealed
+        GROUP BY c.block_id, b.size
+    """).fetchall()
+    candidates, to_seal = [], []
+    for row in rows:
+        node_ids = [int(x) for x in row['node_ids'].split(',')] if row['node_ids'] else []
+        healthy = len(node_ids) >= config.REPLICATION_FACTOR and all(n in nodes_by_id for n in node_ids)
+        if not healthy or config.CONTAINER_SIZE_BYTES - row['size'] < max_record: # Lleno para el mayor registro posible
+            to_seal.append((row['block_id'],))
+            continue
+        primary_id = row['primary_id'] if row['primary_id'] in node_ids else node_ids[0]
+        ordered = [nodes_by_id[primary_id]] + [nodes_by_id[n] for n in node_ids if n != primary_id]
+        candidates.append((row['block_id'], row['size'], ordered))
+    if to_seal:
+        conn.executemany("UPDATE containers SET sealed = TRUE WHERE block_id = ?", to_seal)
+
+    if len(candidates) < config.CONTAINER_MAX_OPEN:
+        container_id, offset, nodes = _open_container(conn, active_datanodes)
+    else:
+        container_id, offset, nodes = random.choice(candidates)
+    conn.execute("UPDATE blocks SET size = size + ? WHERE block_id = ?", (length, container_id))
+    conn.execute("UPDATE containers SET live_bytes = live_bytes + ? WHERE block_id = ?", (length, container_id))
+    conn.execute("INSERT INTO packed_files (file_id, container_id, record_offset, record_length) VALUES (?, ?, ?, ?)",
+                 (file_id, container_id, offset, length))
+    return {
+        "block_id": container_id,
+        "container_offset": offset, # El cliente envía el registro (cabecera + datos) para escribirlo aquí
+        "primary_datanode_grpc": nodes[0]['grpc_address'],
+        "secondary_datanode_grpc": nodes[1]['grpc_address'] if len(nodes) > 1 else None
+    }
+
 
 # --- Operaciones de Bloques de Archivo ---
-def initiate_file_put(file_path_str, total_size): # Para `put` [cite: 28]
-    conn = get_db_connection()
+def initiate_file_put(file_path_str, total_size, codec=None, codec_level=None): # Para `put` [cite: 28]
     if not file_path_str.startswith('/'):
         return None, "La ruta debe ser absoluta."
     if file_path_str.endswith('/'):
         return None, "La ruta no puede ser un directorio para 'put'."
 
-    parts = [p for p in file_path_str.strip('/').split('/') if p]
-    file_name = parts[-1]
-    parent_path = '/' + '/'.join(parts[:-1])
+    file_name, parent_path = _split_parent(file_path_str)
 
-    parent_obj = _get_object_by_path(parent_path)
+    tree = get_namespace()
+    parent_obj = tree.lookup(parent_path)
     if not parent_obj:
         return None, f"Ruta padre '{parent_path}' no existe."
     if not parent_obj['is_directory']:
         return None, f"Ruta padre '{parent_path}' no es un directorio."
 
-    existing_obj = conn.execute("SELECT id FROM fs_objects WHERE parent_id = ? AND name = ?", (parent_obj['id'], file_name)).fetchone()
-    if existing_obj: # WORM: no sobrescribir [cite: 10, 15]
+    if tree.child(parent_obj, file_name): # WORM: no sobrescribir [cite: 10, 15]
         return None, f"Archivo '{file_name}' ya existe en '{parent_path}'. Elimínalo primero."
 
     active_datanodes = get_active_datanodes()
     if len(active_datanodes) < config.REPLICATION_FACTOR: # [cite: 23]
         return None, f"No hay suficientes DataNodes activos ({len(active_datanodes)}) para el factor de replicación {config.REPLICATION_FACTOR}."
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO fs_objects (parent_id, name, is_directory, size) VALUES (?, ?, FALSE, ?)",
-            (parent_obj['id'], file_name, total_size)
-        )
-        file_id = cursor.lastrowid
-        conn.commit() 
-
-        num_blocks = (total_size + config.BLOCK_SIZE_BYTES - 1) // config.BLOCK_SIZE_BYTES # [cite: 20]
-        block_assignments = []
+    try: # Los archivos empaquetados no se comprimen: sus registros ya son pequeños
+        block_codec_info = None if _is_small_file(total_size) else block_codec.negotiate(
+            codec, codec_level, config.BLOCK_CODECS_ALLOWED, config.BLOCK_CODEC_DEFAULT, config.BLOCK_CODEC_FRAME_BYTES)
+    except ValueError as e:
+        return None, str(e)
 
-        for i in range(num_blocks):
-            block_id = f"{file_id}_{i}"
-            actual_block_size = min(config.BLOCK_SIZE_BYTES, total_size - (i * config.BLOCK_SIZE_BYTES))
-
-            # Selección de DataNodes para este bloque [cite: 19, 26]
-            chosen_nodes_for_block = random.sample(active_datanodes, config.REPLICATION_FACTOR)
-            primary_node = chosen_nodes_for_block[0] # El DataNode que recibe del Cliente es Líder del bloque [cite: 27]
-            secondary_nodes = chosen_nodes_for_block[1:] # El Seguidor del bloque [cite: 27]
-
-            cursor.execute(
-                "INSERT INTO blocks (block_id, file_id, block_sequence, size) VALUES (?, ?, ?, ?)",
-                (block_id, file_id, i, actual_block_size)
-            )
-            cursor.execute( # Primario
-                "INSERT INTO block_locations (block_id, datanode_id, is_primary) VALUES (?, ?, TRUE)",
-                (block_id, primary_node['id'])
+    now = _now_timestamp()
+    pool = get_pool()
+    try:
+        with pool.transaction() as conn: # El archivo y todos sus bloques se confirman juntos
+            cursor = conn.execute(
+                "INSERT INTO fs_objects (parent_id, name, is_directory, size, creation_time, modification_time) VALUES (?, ?, FALSE, ?, ?, ?)",
+                (parent_obj['id'], file_name, total_size, now, now)
             )
-            for node in secondary_nodes: # Secundarios/Réplicas [cite: 22]
-                 cursor.execute(
-                    "INSERT INTO block_locations (block_id, datanode_id, is_primary) VALUES (?, ?, FALSE)",
-                    (block_id, node['id'])
-                )
-
-            block_assignments.append({
-                "block_id": block_id,
-                "primary_datanode_grpc": primary_node['grpc_address'],
-                "secondary_datanode_grpc": secondary_nodes[0]['grpc_address'] if secondary_nodes else None
-            })
-        conn.commit()
-        conn.close()
-        return {"file_id": file_id, "block_assignments": block_assignments, "block_size": config.BLOCK_SIZE_BYTES}, "Inicio de 'put' de archivo exitoso."
-    except Exception as e:
+            file_id = cursor.lastrowid
+
+            # Archivos pequeños: un registro dentro de un contenedor compartido en lugar de bloques propios
+            num_blocks = 0 if _is_small_file(total_size) else (total_size + config.BLOCK_SIZE_BYTES - 1) // config.BLOCK_SIZE_BYTES # [cite: 20]
+            block_rows = []
+            location_rows = []
+            block_assignments = []
+            placement = get_placement_policy().start_file(active_datanodes)
+
+            for i in range(num_blocks):
+                block_id = f"{file_id}_{i}"
+                actual_block_size = min(config.BLOCK_SIZE_BYTES, total_size - (i * config.BLOCK_SIZE_BYTES))
+
+                # Selección de DataNodes para este bloque [cite: 19, 26]
+                chosen_nodes_for_block = placement.choose(actual_block_size)
+                primary_node = chosen_nodes_for_block[0] # El DataNode que recibe del Cliente es Líder del bloque [cite: 27]
+                secondary_nodes = chosen_nodes_for_block[1:] # El Seguidor del bloque [cite: 27]
+
+                block_rows.append((block_id, file_id, i, actual_block_size))
+                location_rows.append((block_id, primary_node['id'], True)) # Primario
+                for node in secondary_nodes: # Secundarios/Réplicas [cite: 22]
+                    location_rows.append((block_id, node['id'], False))
+
+                block_assignments.append({
+                    "block_id": block_id,
+                    "primary_datanode_grpc": primary_node['grpc_address'],
+                    "secondary_datanode_grpc": secondary_nodes[0]['grpc_address'] if secondary_nodes else None
+                })
+
+            if _is_small_file(total_size):
+                block_assignments.append(_assign_container_record(conn, file_id, total_size, active_datanodes))
+            conn.executemany(
+                "INSERT INTO blocks (block_id, file_id, block_sequence, size) VALUES (?, ?, ?, ?)", block_rows)
+            conn.executemany(
+                "INSERT INTO block_locations (block_id, datanode_id, is_primary) VALUES (?, ?, ?)", location_rows)
+            if block_codec_info:
+                conn.executemany(
+                    "INSERT INTO block_codecs (block_id, codec, level, frame_size) VALUES (?, ?, ?, ?)",
+                    [(row[0], block_codec_info['name'], block_codec_info['level'], block_codec_info['frame_size']) for row in block_rows])
+            _stage_tree_add(pool, tree, Inode(file_id, parent_obj['id'], file_name, False, total_size, now, now))
+        return {"file_id": file_id, "block_assignments": block_assignments, "block_size": config.BLOCK_SIZE_BYTES,
+                "codec": block_codec_info}, "Inicio de 'put' de archivo exitoso."
+    except Exception as e: # La transacción ya se revirtió: no quedan filas huérfanas que limpiar
         logging.error(f"Error en initiate_file_put: {e}")
-        conn.rollback()
-        conn.close()
-        if 'file_id' in locals() and file_id: # Limpieza
-            cleanup_conn = get_db_connection()
-            cleanup_conn.execute("DELETE FROM fs_objects WHERE id = ?", (file_id,))
-            cleanup_conn.commit()
-            cleanup_conn.close()
         return None, f"Falló el inicio de 'put' de archivo: {str(e)}"
 
+def report_under_replicated_blocks(file_id, block_ids): # Para `/put/complete`
+    """Bloques cuyo secundario no confirmó la copia durante el pipeline de escritura.
+
+    Se quita la ubicación secundaria registrada al iniciar el `put` para que la re-replicación los recoja
+    ya, sin esperar al reporte completo del secundario. Si el secundario sí lo guardó, su reporte lo vuelve a añadir.
+    """
+    if not block_ids:
+        return 0, "Sin bloques sub-replicados."
+    try:
+        with get_pool().transaction() as conn:
+            removed = 0
+            for block_id in block_ids: # Solo bloques propios del archivo: un contenedor compartido conserva sus réplicas
+                removed += conn.execute("""
+                    DELETE FROM block_locations WHERE block_id = ? AND NOT is_primary
+                    AND block_id IN (SELECT block_id FROM blocks WHERE file_id = ?)
+                """, (block_id, file_id)).rowcount
+        if removed:
+            _replication.mark_dirty()
+        logging.warning(f"Archivo {file_id}: {len(block_ids)} bloques sin confirmar en el secundario, {removed} ubicaciones retiradas.")
+        return removed, "Bloques sub-replicados registrados."
+    except Exception as e:
+        logging.error(f"Error registrando bloques sub-replicados del archivo {file_id}: {e}")
+        return 0, f"No se pudieron registrar los bloques sub-replicados: {e}"
+
 def get_file_info_for_read(file_path_str): # Para `get` [cite: 28]
     file_obj = _get_object_by_path(file_path_str)
     if not file_obj:
@@ -225,19 +429,36 @@ def get_file_info_for_read(file_path_str): # Para `get` [cite: 28]
     if file_obj['is_directory']:
         return None, "La ruta es un directorio, no un archivo."
 
-    conn = get_db_connection() # El NameNode entrega al cliente la lista y orden de bloques [cite: 25]
+    # El NameNode entrega al cliente la lista y orden de bloques [cite: 25]
     blocks_query = """
-        SELECT b.block_id, b.block_sequence, b.size, GROUP_CONCAT(dn.grpc_address) as datanode_grpc_addresses
+        SELECT b.block_id, b.block_sequence, b.size, bc.codec, bc.level, bc.frame_size,
+               GROUP_CONCAT(dn.grpc_address) as datanode_grpc_addresses
         FROM blocks b
         JOIN block_locations bl ON b.block_id = bl.block_id
         JOIN datanodes dn ON bl.datanode_id = dn.id
+        LEFT JOIN block_codecs bc ON bc.block_id = b.block_id
         WHERE b.file_id = ? AND dn.is_active = TRUE
-        GROUP BY b.block_id, b.block_sequence, b.size
+        GROUP BY b.block_id, b.block_sequence, b.size, bc.codec, bc.level, bc.frame_size
         ORDER BY b.block_sequence
     """
-    blocks_data = conn.execute(blocks_query, (file_obj['id'],)).fetchall()
-    conn.close()
-
+    packed = None
+    with get_pool().connection() as conn:
+        blocks_data = conn.execute(blocks_query, (file_obj['id'],)).fetchall()
+        if not blocks_data and file_obj['size'] > 0: # Archivo empaquetado: su registro dentro de un contenedor
+            packed = conn.execute("""
+                SELECT p.container_id, p.record_offset, GROUP_CONCAT(dn.grpc_address) AS datanode_grpc_addresses
+                FROM packed_files p
+                JOIN block_locations bl ON bl.block_id = p.container_id
+                JOIN datanodes dn ON bl.datanode_id = dn.id
+                WHERE p.file_id = ? AND dn.is_active = TRUE
+                GROUP BY p.container_id, p.record_offset
+            """, (file_obj['id'],)).fetchone()
+
+    if packed:
+        # Un solo "bloque": lectura por rango del contenedor; el cliente valida la cabecera con file_id
+        blocks_data = [{"block_id": packed['container_id'], "block_sequence": 0, "size": file_obj['size'],
+                        "datanode_grpc_addresses": packed['datanode_grpc_addresses'],
+                        "container_offset": packed['record_offset'], "file_id": file_obj['id']}]
     if not blocks_data:
         return None, "Archivo encontrado, pero ningún DataNode activo contiene sus bloques."
     
@@ -250,6 +471,10 @@ def get_file_info_for_read(file_path_str): # Para `get` [cite: 28]
             "size": row['size'],
             "datanode_grpc_addresses": available_dns # El cliente elige uno [cite: 24]
         })
+        if packed:
+            formatted_blocks[-1].update(container_offset=row['container_offset'], file_id=row['file_id'])
+        elif row['codec']: # El cliente descomprime; los DataNodes sirven los bytes almacenados tal cual
+            formatted_blocks[-1]["codec"] = {"name": row['codec'], "level": row['level'], "frame_size": row['frame_size']}
     
     # Validar que todos los bloques estén presentes
     expected_num_blocks = (file_obj['size'] + config.BLOCK_SIZE_BYTES - 1) // config.BLOCK_SIZE_BYTES
@@ -265,72 +490,450 @@ def get_file_info_for_read(file_path_str): # Para `get` [cite: 28]
     }, "Información de archivo recuperada para lectura."
 
 
+# --- Operaciones por lotes ---
+BATCH_READ_OPERATIONS = ('ls', 'get')
+BATCH_WRITE_OPERATIONS = ('mkdir', 'rm', 'rmdir')
+
+class _BatchAborted(Exception):
+    pass
+
+def _run_batch_operation(op, path, deleted_block_ids, recursive=False):
+    if op == 'mkdir':
+        obj, message = create_directory(path)
+        return {"message": message, "id": obj['id']} if obj else {"error": message}
+    if op == 'ls':
+        items, message = list_directory(path)
+        return {"contents": items} if items is not None else {"error": message}
+    if op == 'get':
+        file_info, message = get_file_info_for_read(path)
+        return {"message": message, "data": file_info} if file_info else {"error": message}
+    if op == 'rmdir': # Misma validación que el endpoint /rmdir
+        obj = _get_object_by_path(path)
+        if not obj: return {"error": "Directorio no encontrado"}
+        if not obj['is_directory']: return {"error": f"Ruta '{path}' no es un directorio."}
+    success, message, block_ids = remove_object(path, recursive=recursive and op == 'rm') # 'rm' y 'rmdir'
+    if not success:
+        return {"error": message}
+    deleted_block_ids.extend(block_ids)
+    return {"message": message}
+
+def is_read_only_batch(operations):
+    return all(isinstance(o, dict) and o.get('op') in BATCH_READ_OPERATIONS for o in operations)
+
+def execute_batch(operations, atomic=False): # Para `/batch`
+    """Ejecuta operaciones heterogéneas en una sola transacción de metadatos.
+
+    Cada operación corre en su propio SAVEPOINT, así que un fallo solo revierte esa operación,
+    salvo con atomic=True, donde cualquier fallo revierte el lote completo.
+    Devuelve (resultados por operación, block_ids a limpiar en los DataNodes).
+    """
+    if len(operations) > config.BATCH_MAX_OPERATIONS:
+        return None, f"El lote excede el máximo de {config.BATCH_MAX_OPERATIONS} operaciones.", []
+
+    results = []
+    deleted_block_ids = []
+    pool = get_pool()
+    read_only = is_read_only_batch(operations)
+    # Un lote de solo lectura no necesita el bloqueo de escritura
+    scope = pool.connection() if read_only else pool.transaction()
+    try:
+        with scope:
+            for op_spec in operations:
+                op = op_spec.get('op') if isinstance(op_spec, dict) else None
+                path = op_spec.get('path') if isinstance(op_spec, dict) else None
+                if op not in BATCH_READ_OPERATIONS + BATCH_WRITE_OPERATIONS:
+                    result = {"error": f"Operación no soportada: {op}"}
+                elif not path:
+                    result = {"error": "Se requiere la ruta"}
+                else:
+                    result = _run_batch_operation(op, path, deleted_block_ids, bool(op_spec.get('recursive')))
+                result.update({"op": op, "path": path, "success": "error" not in result})
+                results.append(result)
+                if atomic and not result["success"]:
+                    raise _BatchAborted()
+    except _BatchAborted:
+        for result in results:
+            if result["success"]:
+                result.pop("message", None)
+                result.update({"success": False, "error": "Revertido: otra operación del lote falló."})
+        return results, "Lote revertido.", []
+    except Exception as e:
+        logging.error(f"Error ejecutando lote: {e}")
+        return None, f"Error ejecutando lote: {e}", []
+    return results, "Lote ejecutado.", deleted_block_ids
+
+
 # --- Gestión de DataNode ---
+def _publish_registration(dn_db_id, datanode_id, grpc_address, flask_address):
+    _, revived = get_liveness().register(dn_db_id, datanode_id, grpc_address, flask_address, time.monotonic())
+    if revived: # Sus réplicas vuelven a contar como vivas
+        _replication.mark_dirty()
+
 def register_datanode(datanode_id, grpc_address, flask_address):
-    conn = get_db_connection()
+    pool = get_pool()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO datanodes (datanode_id, grpc_address, flask_address, last_heartbeat, is_active)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP, TRUE)
-            ON CONFLICT(datanode_id) DO UPDATE SET
-                grpc_address = excluded.grpc_address,
-                flask_address = excluded.flask_address,
-                last_heartbeat = CURRENT_TIMESTAMP,
-                is_active = TRUE
-            """, (datanode_id, grpc_address, flask_address)
-        )
-        conn.commit()
-        dn_db_id = cursor.lastrowid or conn.execute("SELECT id FROM datanodes WHERE datanode_id = ?", (datanode_id,)).fetchone()['id']
-        conn.close()
+        with pool.transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO datanodes (datanode_id, grpc_address, flask_address, last_heartbeat, is_active)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP, TRUE)
+                ON CONFLICT(datanode_id) DO UPDATE SET
+                    grpc_address = excluded.grpc_address,
+                    flask_address = excluded.flask_address,
+                    last_heartbeat = CURRENT_TIMESTAMP,
+                    is_active = TRUE
+                """, (datanode_id, grpc_address, flask_address)
+            )
+            # lastrowid no es fiable tras un UPSERT en una conexión reutilizada
+            dn_db_id = conn.execute("SELECT id FROM datanodes WHERE datanode_id = ?", (datanode_id,)).fetchone()['id']
+            # Como el árbol: la tabla de vida solo ve el alta cuando el lote del escritor confirma
+            pool.on_commit(lambda: _publish_registration(dn_db_id, datanode_id, grpc_address, flask_address))
         logging.info(f"DataNode {datanode_id} registrado/actualizado. DB ID: {dn_db_id}")
         return {"id": dn_db_id, "datanode_id": datanode_id}, "DataNode registrado/actualizado."
     except sqlite3.IntegrityError as e:
-        conn.close()
         logging.error(f"Fallo al registrar DataNode {datanode_id}: {e}")
         return None, f"Registro de DataNode fallido: {e}"
 
-def datanode_heartbeat(datanode_id):
-    conn = get_db_connection()
+def expire_datanodes(): # Tarea periódica del hilo escritor
+    """Marca caídos los DataNodes vencidos en memoria y persiste solo esas transiciones.
+
+    Es la única escritura de las caídas; mientras no corre, get_active_datanodes() ya excluye a los vencidos.
+    """
+    expired = get_liveness().expire(time.monotonic())
+    if not expired:
+        return []
+    with get_pool().transaction() as conn:
+        conn.executemany("UPDATE datanodes SET is_active = FALSE WHERE id = ?", ((node.id,) for node in expired))
+        _seal_containers_on(conn, [node.id for node in expired])
+    _replication.mark_dirty() # Sus bloques pueden haber quedado sub-replicados
+    logging.warning(f"DataNodes sin heartbeat marcados como caídos: {', '.join(node.datanode_id for node in expired)}")
+    return [node.datanode_id for node in expired]
+
+def _apply_replication_results(conn, replication_results):
+    for result in replication_results or []:
+        block_id, target_id = result.get('block_id'), result.get('target_datanode_id')
+        if not block_id or target_id is None:
+            continue
+        if _replication.complete(block_id, target_id, bool(result.get('success'))):
+            # El bloque pudo haberse eliminado mientras se copiaba
+            conn.execute(
+                "INSERT OR IGNORE INTO block_locations (block_id, datanode_id, is_primary) "
+                "SELECT ?, ?, FALSE WHERE EXISTS (SELECT 1 FROM blocks WHERE block_id = ?)",
+                (block_id, target_id, block_id))
+
+# --- Reportes de bloques de los DataNodes ---
+_full_report_received = set() # ids de BD de DataNodes con reporte completo desde que arrancó el NameNode
+
+def _load_reported_blocks(conn, block_ids):
+    """Carga los ids reportados en una tabla temporal para reconciliar con operaciones de conjuntos en SQL."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS reported_blocks (block_id TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM reported_blocks")
+    conn.executemany("INSERT OR IGNORE INTO reported_blocks (block_id) VALUES (?)", ((b,) for b in block_ids))
+
+def _add_reported_locations(conn, node_id):
+    """Registra las réplicas reportadas de bloques conocidos y devuelve los huérfanos (sin metadatos)."""
+    added = conn.execute(
+        "INSERT OR IGNORE INTO block_locations (block_id, datanode_id, is_primary) "
+        "SELECT r.block_id, ?, FALSE FROM reported_blocks r JOIN blocks b ON b.block_id = r.block_id",
+        (node_id,)).rowcount
+    orphans = conn.execute(
+        "SELECT r.block_id FROM reported_blocks r LEFT JOIN blocks b ON b.block_id = r.block_id WHERE b.block_id IS NULL"
+    ).fetchall()
+    return added, [row['block_id'] for row in orphans]
+
+# Bloques con una escritura iniciada después del instante dado: el DataNode puede no tenerlos aún
+RECENTLY_WRITTEN_BLOCKS_QUERY = f"""
+    SELECT b.block_id FROM blocks b JOIN fs_objects f ON f.id = b.file_id WHERE f.creation_time >= ?
+    UNION
+    {RECENT_CONTAINER_RECORDS_QUERY}
+"""
+
+def process_full_block_report(datanode_id, block_ids): # Para `/datanode/block_report`
+    """Reemplaza las ubicaciones del DataNode por lo que realmente tiene. Devuelve bloques huérfanos a eliminar.
+
+    Las ubicaciones de escrituras iniciadas hace menos de WRITE_IN_FLIGHT_GRACE_SEC se conservan aunque
+    falten del reporte: pueden seguir en vuelo, y el reporte incremental las confirmará al llegar.
+    """
+    try:
+        with get_pool().transaction() as conn:
+            node = conn.execute("SELECT id FROM datanodes WHERE datanode_id = ?", (datanode_id,)).fetchone()
+            if node is None:
+                return False, "DataNode no registrado.", []
+            _load_reported_blocks(conn, block_ids)
+            grace_start = _in_flight_since()
+            removed = conn.execute(
+                f"DELETE FROM block_locations WHERE datanode_id = ? AND block_id NOT IN (SELECT block_id FROM reported_blocks) "
+                f"AND block_id NOT IN ({RECENTLY_WRITTEN_BLOCKS_QUERY})",
+                (node['id'], grace_start, grace_start)).rowcount
+            added, orphans = _add_reported_locations(conn, node['id'])
+            conn.execute("DELETE FROM reported_blocks")
+        _full_report_received.add(node['id'])
+        if removed or added:
+            _replication.mark_dirty()
+        logging.info(f"Reporte completo de {datanode_id}: {len(block_ids)} bloques, +{added} -{removed} ubicaciones, {len(orphans)} huérfanos.")
+        return True, "Reporte de bloques procesado.", orphans
+    except Exception as e:
+        logging.error(f"Error procesando reporte de bloques de {datanode_id}: {e}")
+        return False, f"Reporte de bloques fallido: {e}", []
+
+def _apply_incremental_report(conn, node_id, block_report):
+    """Aplica bloques añadidos/eliminados desde el último heartbeat. Devuelve huérfanos a eliminar."""
+    added_ids = block_report.get('added') or []
+    deleted_ids = block_report.get('deleted') or []
+    orphans = []
+    changed = 0
+    if added_ids:
+        _load_reported_blocks(conn, added_ids)
+        changed, orphans = _add_reported_locations(conn, node_id)
+        conn.execute("DELETE FROM reported_blocks")
+    if deleted_ids:
+        _load_reported_blocks(conn, deleted_ids)
+        changed += conn.execute(
+            "DELETE FROM block_locations WHERE datanode_id = ? AND block_id IN (SELECT block_id FROM reported_blocks)",
+            (node_id,)).rowcount
+        conn.execute("DELETE FROM reported_blocks")
+    if changed:
+        _replication.mark_dirty()
+    return orphans
+
+def _take_pending_deletions(conn, node_id, deleted_block_ids, now):
+    """Confirma las eliminaciones ya hechas y entrega el siguiente lote pendiente del DataNode.
+
+    Las entregas no confirmadas en DELETION_REDISPATCH_SEC se reenvían (eliminar es idempotente), así que
+    un nodo caído recibe su cola completa cuando vuelve.
+    """
+    if deleted_block_ids:
+        conn.executemany("DELETE FROM pending_deletions WHERE datanode_id = ? AND block_id = ?",
+                         ((node_id, block_id) for block_id in deleted_block_ids))
+    redispatch_before = now - timedelta(seconds=config.DELETION_REDISPATCH_SEC)
+    rows = conn.execute("""
+        SELECT block_id FROM pending_deletions
+        WHERE datanode_id = ? AND (dispatched_time IS NULL OR dispatched_time < ?)
+        ORDER BY queued_time LIMIT ?
+    """, (node_id, redispatch_before, config.DELETION_MAX_BLOCKS_PER_HEARTBEAT)).fetchall()
+    block_ids = [row['block_id'] for row in rows]
+    if block_ids:
+        conn.executemany("UPDATE pending_deletions SET dispatched_time = ? WHERE datanode_id = ? AND block_id = ?",
+                         ((now, node_id, block_id) for block_id in block_ids))
+    return block_ids
+
+def _needs_registration(node, grpc_address, flask_address):
+    return grpc_address is not None and (node is None or (node.grpc_address, node.flask_address) != (grpc_address, flask_address))
+
+def _has_heartbeat_writes(conn, node_id, replication_results, block_report, deletion_results, now):
+    if replication_results or deletion_results or (block_report and (block_report.get('added') or block_report.get('deleted'))):
+        return True
+    redispatch_before = now - timedelta(seconds=config.DELETION_REDISPATCH_SEC)
+    return conn.execute(
+        "SELECT 1 FROM pending_deletions WHERE datanode_id = ? AND (dispatched_time IS NULL OR dispatched_time < ?) LIMIT 1",
+        (node_id, redispatch_before)).fetchone() is not None
+
+def is_read_only_heartbeat(datanode_id, grpc_address=None, flask_address=None, replication_results=None, block_report=None, deletion_results=None):
+    """True si el heartbeat solo renueva la vida en memoria: no hace falta pasar por el hilo escritor."""
+    node = get_liveness().get(datanode_id)
+    if node is None or not node.active or _needs_registration(node, grpc_address, flask_address):
+        return False
+    with get_pool().connection() as conn:
+        return not _has_heartbeat_writes(conn, node.id, replication_results, block_report, deletion_results, datetime.utcnow())
+
+def datanode_heartbeat(datanode_id, replication_results=None, block_report=None, deletion_results=None, storage=None,
+                       grpc_address=None, flask_address=None, read_only=False):
+    """Heartbeat con registro combinado: si trae direcciones y el nodo es nuevo o cambió, se registra aquí.
+
+    La vida del nodo se renueva en memoria; a SQLite solo se escriben las transiciones (alta, vuelta a la
+    vida) y lo que el heartbeat trae o recoge (resultados, reporte incremental, cola de eliminaciones).
+    read_only=True (fuera del hilo escritor): nunca escribe; devuelve None si resulta necesario escribir.
+    """
     now = datetime.utcnow()
     try:
-        cursor = conn.execute("UPDATE datanodes SET last_heartbeat = ?, is_active = TRUE WHERE datanode_id = ?", (now, datanode_id))
-        if cursor.rowcount == 0:
-            conn.close()
+        liveness = get_liveness()
+        node = liveness.get(datanode_id)
+        revived = False
+        if read_only:
+            if node is None or _needs_registration(node, grpc_address, flask_address) or not liveness.touch_if_alive(datanode_id, time.monotonic()):
+                return None # Venció o cambió desde is_read_only_heartbeat(): la transición va por el escritor
+            node_id, transition = node.id, False
+        elif _needs_registration(node, grpc_address, flask_address):
+            registered, message = register_datanode(datanode_id, grpc_address, flask_address)
+            if registered is None:
+                return False, message, []
+            node_id = registered['id'] # En la tabla de vida aparece al confirmar el lote
+            transition = True
+        elif node is None:
             return False, "DataNode no encontrado para heartbeat.", []
-        conn.commit()
-        # Aquí se podrían añadir tareas de re-replicación/eliminación si se detectan inconsistencias
-        replication_tasks = [] 
-        deletion_tasks = [] 
-        conn.close()
+        else:
+            node_id = node.id
+            transition = revived = liveness.touch(datanode_id, time.monotonic())
+        if storage: # Capacidad, espacio usado y transferencias activas para la política de colocación
+            get_placement_policy().update_node(node_id, storage)
+
+        pool = get_pool()
+        deletion_tasks = []
+        with pool.connection() as conn:
+            needs_write = transition or _has_heartbeat_writes(conn, node_id, replication_results, block_report, deletion_results, now)
+            if read_only and needs_write:
+                return None
+            compaction_tasks = _take_compaction_tasks(conn, node_id)
+        if needs_write:
+            with pool.transaction() as conn:
+                if transition:
+                    conn.execute("UPDATE datanodes SET last_heartbeat = ?, is_active = TRUE WHERE id = ?", (now, node_id))
+                    if storage: # El espacio en BD es informativo: se refresca solo en las transiciones
+                        conn.execute("UPDATE datanodes SET total_space = ?, used_space = ? WHERE id = ?",
+                                     (storage.get('capacity', 0), storage.get('used', 0), node_id))
+                _apply_replication_results(conn, replication_results)
+                orphans = _apply_incremental_report(conn, node_id, block_report) if block_report else []
+                deletion_tasks = _take_pending_deletions(conn, node_id, deletion_results, now) + orphans
+        if revived: # Sus réplicas vuelven a contar como vivas
+            _replication.mark_dirty()
+
+        active_datanodes = get_active_datanodes()
+        if _replication.needs_rescan():
+            with pool.connection() as conn:
+                _replication.rescan(conn)
+        replication_tasks = _replication.assign_tasks(node_id, active_datanodes)
         logging.info(f"Heartbeat recibido de {datanode_id}")
-        return True, "Heartbeat exitoso.", {"replication_tasks": replication_tasks, "deletion_tasks": deletion_tasks}
+        return True, "Heartbeat exitoso.", {"replication_tasks": replication_tasks, "deletion_tasks": deletion_tasks,
+                                            "compaction_tasks": compaction_tasks,
+                                            "full_block_report_required": node_id not in _full_report_received}
     except Exception as e:
-        conn.close()
         logging.error(f"Error procesando heartbeat para {datanode_id}: {e}")
         return False, f"Heartbeat fallido: {e}", []
 
 def get_active_datanodes():
-    conn = get_db_connection()
-    timeout_threshold = datetime.utcnow() - timedelta(seconds=config.HEARTBEAT_INTERVAL_SEC * config.HEARTBEAT_TIMEOUT_FACTOR)
-    conn.execute("UPDATE datanodes SET is_active = FALSE WHERE last_heartbeat < ? AND is_active = TRUE", (timeout_threshold,))
-    conn.commit()
-    datanodes = conn.execute("SELECT id, datanode_id, grpc_address, flask_address FROM datanodes WHERE is_active = TRUE").fetchall()
-    conn.close()
-    return [dict(dn) for dn in datanodes]
-
-def get_block_locations_for_delete(block_id):
-    conn = get_db_connection()
-    # Obtener todas las ubicaciones, incluso si el DN está inactivo, para intentar la eliminación
-    locations = conn.execute("""
-        SELECT dn.grpc_address
-        FROM block_locations bl
-        JOIN datanodes dn ON bl.datanode_id = dn.id
-        WHERE bl.block_id = ?
-    """, (block_id,)).fetchall()
-    conn.close()
-    return [loc['grpc_address'] for loc in locations]
+    """DataNodes vivos ahora mismo. Solo lee: los vencidos se excluyen aunque expire_datanodes() aún no los persistiera."""
+    return get_liveness().active_nodes(time.monotonic())
+
+# --- Compactación de contenedores ---
+_compaction_dispatched = {} # (contenedor viejo, id de BD del DataNode) -> instante de la última entrega
+_compaction_dispatched_lock = threading.Lock() # Heartbeats de solo lectura (hilos de petición) y el hilo escritor
+
+def _take_compaction_tasks(conn, node_id):
+    """Compactaciones pendientes en este DataNode: tiene el contenedor viejo y todavía no reportó el nuevo."""
+    rows = conn.execute("""
+        SELECT cc.old_block_id, cc.new_block_id, cc.layout FROM container_compactions cc
+        JOIN block_locations bl ON bl.block_id = cc.old_block_id AND bl.datanode_id = ?
+        WHERE NOT EXISTS (SELECT 1 FROM block_locations n WHERE n.block_id = cc.new_block_id AND n.datanode_id = ?)
+    """, (node_id, node_id)).fetchall()
+    now = time.monotonic()
+    tasks = []
+    for row in rows:
+        key = (row['old_block_id'], node_id)
+        with _compaction_dispatched_lock: # Comprobar y marcar juntos: dos heartbeats no entregan la misma tarea
+            if now - _compaction_dispatched.get(key, float('-inf')) < config.REPLICATION_TASK_TIMEOUT_SEC:
+                continue # Ya entregada; se reenvía si no llega el reporte del contenedor nuevo
+            _compaction_dispatched[key] = now
+        tasks.append({"container_id": row['old_block_id'], "new_container_id": row['new_block_id'],
+                      "records": json.loads(row['layout'])})
+    return tasks
+
+def _delete_container(conn, block_id):
+    _queue_block_deletions(conn, "SELECT ?", (block_id,))
+    conn.execute("DELETE FROM blocks WHERE block_id = ?", (block_id,)) # CASCADE: containers y block_locations
+
+def _finish_compactions(conn):
+    """Apunta los archivos al contenedor nuevo cuando todas las réplicas vivas del viejo ya lo tienen."""
+    rows = conn.execute("""
+        SELECT cc.old_block_id, cc.new_block_id, cc.layout,
+               (SELECT COUNT(*) FROM block_locations bl JOIN datanodes dn ON dn.id = bl.datanode_id
+                WHERE bl.block_id = cc.old_block_id AND dn.is_active AND NOT EXISTS (
+                    SELECT 1 FROM block_locations n WHERE n.block_id = cc.new_block_id AND n.datanode_id = bl.datanode_id)) AS missing,
+               (SELECT COUNT(*) FROM block_locations n WHERE n.block_id = cc.new_block_id) AS done
+        FROM container_compactions cc
+    """).fetchall()
+    finished = 0
+    for row in rows:
+        if row['missing'] or not row['done']:
+            continue
+        old_id, new_id = row['old_block_id'], row['new_block_id']
+        moves, new_offset = [], 0
+        for old_offset, length in json.loads(row['layout']):
+            moves.append((new_id, new_offset, old_id, old_offset))
+            new_offset += length
+        conn.executemany("UPDATE packed_files SET container_id = ?, record_offset = ? WHERE container_id = ? AND record_offset = ?", moves)
+        conn.execute("""
+            UPDATE containers SET live_bytes = (SELECT COALESCE(SUM(record_length), 0) FROM packed_files WHERE container_id = ?)
+            WHERE block_id = ?
+        """, (new_id, new_id))
+        conn.execute("DELETE FROM container_compactions WHERE old_block_id = ?", (old_id,))
+        _delete_container(conn, old_id)
+        with _compaction_dispatched_lock:
+            for key in [k for k in _compaction_dispatched if k[0] == old_id]:
+                del _compaction_dispatched[key]
+        finished += 1
+    return finished
+
+def _seal_compactable_containers(conn, in_flight_since):
+    """Sella los contenedores abiertos con suficiente espacio muerto: si no, solo se compactarían al llenarse."""
+    return conn.execute(f"""
+        UPDATE containers SET sealed = TRUE
+        WHERE NOT sealed AND live_bytes <= (SELECT b.size FROM blocks b WHERE b.block_id = containers.block_id) * ?
+          AND block_id NOT IN ({RECENT_CONTAINER_RECORDS_QUERY})
+    """, (1 - config.CONTAINER_COMPACTION_MIN_DEAD_RATIO, in_flight_since)).rowcount
+
+def _plan_compactions(conn, in_flight_since):
+    """Contenedores sellados con suficiente espacio muerto: se planifica su reescritura con solo los registros vivos.
+
+    El contenedor nuevo queda definido por la lista ordenada de registros vivos, así que cada DataNode lo
+    construye por su cuenta con un resultado idéntico y el NameNode conoce de antemano los nuevos offsets.
+    Se omiten los contenedores con registros que aún pueden estar escribiéndose: se copiarían incompletos.
+    """
+    rows = conn.execute(f"""
+        SELECT c.block_id FROM containers c JOIN blocks b ON b.block_id = c.block_id
+        WHERE c.sealed AND c.live_bytes > 0 AND c.live_bytes <= b.size * ?
+          AND c.block_id NOT IN (SELECT old_block_id FROM container_compactions)
+          AND c.block_id NOT IN (SELECT new_block_id FROM container_compactions)
+          AND c.block_id NOT IN ({RECENT_CONTAINER_RECORDS_QUERY})
+        ORDER BY CAST(c.live_bytes AS REAL) / b.size LIMIT ?
+    """, (1 - config.CONTAINER_COMPACTION_MIN_DEAD_RATIO, in_flight_since, config.CONTAINER_COMPACTION_MAX_PER_PASS)).fetchall()
+    for row in rows:
+        layout = [[r['record_offset'], r['record_length']] for r in conn.execute(
+            "SELECT record_offset, record_length FROM packed_files WHERE container_id = ? ORDER BY record_offset", (row['block_id'],))]
+        new_id = f"{CONTAINER_PREFIX}{uuid.uuid4().hex[:16]}"
+        new_size = sum(length for _, length in layout)
+        conn.execute("INSERT INTO blocks (block_id, file_id, block_sequence, size) VALUES (?, ?, 0, ?)",
+                     (new_id, _get_container_owner_id(conn), new_size))
+        conn.execute("INSERT INTO containers (block_id, live_bytes, sealed) VALUES (?, ?, TRUE)", (new_id, new_size))
+        conn.execute("INSERT INTO container_compactions (old_block_id, new_block_id, layout) VALUES (?, ?, ?)",
+                     (row['block_id'], new_id, json.dumps(layout)))
+    return len(rows)
+
+def compact_containers(): # Para `/containers/compact` y la pasada periódica del NameNode
+    """Cierra las compactaciones terminadas, elimina contenedores sin registros vivos y planifica nuevas."""
+    try:
+        with get_pool().transaction() as conn:
+            in_flight_since = _in_flight_since()
+            finished = _finish_compactions(conn)
+            sealed = _seal_compactable_containers(conn, in_flight_since)
+            empty = [row['block_id'] for row in conn.execute("""
+                SELECT c.block_id FROM containers c
+                WHERE c.sealed AND NOT EXISTS (SELECT 1 FROM packed_files p WHERE p.container_id = c.block_id)
+                  AND c.block_id NOT IN (SELECT new_block_id FROM container_compactions)
+                  AND c.block_id NOT IN (SELECT old_block_id FROM container_compactions)
+            """).fetchall()]
+            for block_id in empty:
+                _delete_container(conn, block_id)
+            planned = _plan_compactions(conn, in_flight_since)
+        summary = {"compactions_finished": finished, "containers_sealed": sealed, "empty_containers_deleted": len(empty),
+                   "compactions_planned": planned}
+        if finished or sealed or empty or planned:
+            logging.info(f"Mantenimiento de contenedores: {summary}")
+        return summary, "Mantenimiento de contenedores completado."
+    except Exception as e:
+        logging.error(f"Error en el mantenimiento de contenedores: {e}")
+        return None, f"Mantenimiento de contenedores fallido: {e}"
+
+def get_replication_status():
+    status = _replication.status(len(get_active_datanodes()))
+    with get_pool().connection() as conn:
+        status["pending_deletions"] = conn.execute("SELECT COUNT(*) FROM pending_deletions").fetchone()[0]
+        status["containers"] = dict(conn.execute("""
+            SELECT COUNT(*) AS total, COALESCE(SUM(NOT c.sealed), 0) AS open, COALESCE(SUM(b.size), 0) AS reserved_bytes,
+                   COALESCE(SUM(c.live_bytes), 0) AS live_bytes,
+                   (SELECT COUNT(*) FROM container_compactions) AS compactions_in_progress
+            FROM containers c JOIN blocks b ON b.block_id = c.block_id
+        """).fetchone())
+    return status
 
 
 if __name__ == '__main__':
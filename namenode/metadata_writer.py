@@ -0,0 +1,95 @@
+# namenode/metadata_writer.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common import config
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataWriter:
+    """Hilo escritor único: las mutaciones de metadatos se encolan y se confirman en grupo.
+
+    Cada lote es una sola transacción (un BEGIN IMMEDIATE y un COMMIT para muchas operaciones) y cada
+    operación corre en su propio SAVEPOINT, así que un fallo solo revierte esa operación. El llamador
+    recibe el resultado cuando el COMMIT del lote terminó: nunca ve un cambio que luego se pierda.
+    Los lectores no pasan por aquí; con WAL leen en paralelo con sus propias conexiones.
+    """
+    _STOP = object()
+
+    def __init__(self, get_pool, max_ops=None, linger_ms=None):
+        self._get_pool = get_pool
+        self.max_ops = max_ops or config.NAMENODE_GROUP_COMMIT_MAX_OPS
+        self.linger_sec = (linger_ms if linger_ms is not None else config.NAMENODE_GROUP_COMMIT_LINGER_MS) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self.stats = {"batches": 0, "operations": 0, "max_batch": 0, "failed_commits": 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="metadata-writer")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def call(self, fn, *args, **kwargs):
+        """Ejecuta fn(*args, **kwargs) en el hilo escritor y devuelve su resultado."""
+        if threading.current_thread() is self._thread: # Llamada anidada desde una operación en curso
+            return fn(*args, **kwargs)
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future.result()
+
+    def _next_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.linger_sec
+        while len(batch) < self.max_ops:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                self._queue.put(item) # Terminar tras confirmar este lote
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is self._STOP:
+                return
+            batch = self._next_batch(first)
+            pool = self._get_pool()
+            outcomes = []
+            try:
+                with pool.transaction():
+                    for future, fn, args, kwargs in batch:
+                        try:
+                            with pool.transaction(): # SAVEPOINT por operación
+                                outcomes.append((future, fn(*args, **kwargs), None))
+                        except Exception as e:
+                            outcomes.append((future, None, e))
+            except Exception as e:
+                self.stats["failed_commits"] += 1
+                logger.error(f"Fallo al confirmar un lote de {len(batch)} operaciones de metadatos: {e}")
+                for future, *_ in batch:
+                    future.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["operations"] += len(batch)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
@@ -0,0 +1,167 @@
+# namenode/namespace_tree.py
+import threading
+import logging
+from threading import get_ident
+
+logger = logging.getLogger(__name__)
+
+ROOT_ID = 1 # ID del directorio raíz en fs_objects
+SYSTEM_PARENT_ID = 0 # parent_id de objetos internos fuera del árbol (p. ej. el propietario de los contenedores)
+
+
+class Inode:
+    """Registro compacto de un objeto de fs_objects mantenido en memoria."""
+    __slots__ = ('id', 'parent_id', 'name', 'is_directory', 'size',
+                 'creation_time', 'modification_time', 'children', 'staged_by', 'removed_by')
+
+    def __init__(self, id, parent_id, name, is_directory, size=0, creation_time=None, modification_time=None):
+        self.id = id
+        self.parent_id = parent_id
+        self.name = name
+        self.is_directory = bool(is_directory)
+        self.size = size or 0
+        self.creation_time = creation_time
+        self.modification_time = modification_time
+        self.children = {} if self.is_directory else None # nombre -> Inode
+        self.staged_by = None # Hilo de la transacción que lo creó, hasta su COMMIT
+        self.removed_by = None # Hilo de la transacción que lo eliminó, hasta su COMMIT
+
+    def __getitem__(self, key): # Compatibilidad con el acceso tipo sqlite3.Row (obj['id'])
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def keys(self):
+        return [k for k in self.__slots__ if k not in ('children', 'staged_by', 'removed_by')]
+
+    def visible(self):
+        """Los cambios sin confirmar solo los ve el hilo de su transacción; el resto ve lo confirmado."""
+        me = get_ident()
+        return self.staged_by in (None, me) and self.removed_by != me
+
+    def to_listing(self):
+        return {"name": self.name, "is_directory": self.is_directory,
+                "size": self.size, "modified": self.modification_time}
+
+
+class NamespaceTree:
+    """Árbol completo del espacio de nombres. SQLite es la copia durable; aquí se resuelven las rutas.
+
+    Las mutaciones se preparan dentro de la transacción (stage_add/stage_remove) y se publican tras su
+    COMMIT (publish_*) o se deshacen si se revierte (discard_*). Mientras tanto solo el hilo que las hizo
+    las ve, así que ningún lector observa un inodo que luego pueda desaparecer.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.inodes = {} # id -> Inode
+
+    @classmethod
+    def load(cls, conn):
+        """Reconstruye el árbol desde fs_objects con un único escaneo."""
+        tree = cls()
+        rows = conn.execute(
+            "SELECT id, parent_id, name, is_directory, size, creation_time, modification_time FROM fs_objects"
+        ).fetchall()
+        for row in rows:
+            tree.inodes[row[0]] = Inode(*row)
+        for inode in tree.inodes.values():
+            if inode.parent_id is None or inode.parent_id == SYSTEM_PARENT_ID:
+                continue
+            parent = tree.inodes.get(inode.parent_id)
+            if parent is None or not parent.is_directory:
+                logger.warning(f"Objeto huérfano en fs_objects ignorado: id={inode.id} parent_id={inode.parent_id}")
+                continue
+            parent.children[inode.name] = inode
+        if ROOT_ID not in tree.inodes:
+            tree.inodes[ROOT_ID] = Inode(ROOT_ID, None, '/', True)
+        logger.info(f"Árbol de espacio de nombres cargado: {len(tree.inodes)} objetos.")
+        return tree
+
+    @property
+    def root(self):
+        return self.inodes[ROOT_ID]
+
+    @staticmethod
+    def split_path(path_str):
+        return [p for p in path_str.strip('/').split('/') if p]
+
+    def lookup(self, path_str):
+        """Resuelve una ruta en O(profundidad) saltos de diccionario."""
+        with self.lock:
+            node = self.root
+            for part_name in self.split_path(path_str):
+                if not node.is_directory: # Solo se puede descender por directorios
+                    return None
+                node = node.children.get(part_name)
+                if node is None or not node.visible():
+                    return None
+            return node
+
+    def child(self, inode, name):
+        with self.lock:
+            node = inode.children.get(name)
+            return node if node is not None and node.visible() else None
+
+    def has_children(self, inode):
+        with self.lock:
+            return any(child.visible() for child in inode.children.values())
+
+    def get(self, inode_id):
+        return self.inodes.get(inode_id)
+
+    @staticmethod
+    def walk(inode):
+        """El inodo y todos sus descendientes (iterativo: sin límite de profundidad)."""
+        stack = [inode]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.is_directory:
+                stack.extend(node.children.values())
+
+    def add(self, inode):
+        """Engancha el inodo (con su subárbol, si lo tiene) bajo su padre."""
+        with self.lock:
+            parent = self.inodes[inode.parent_id]
+            parent.children[inode.name] = inode
+            for node in self.walk(inode):
+                self.inodes[node.id] = node
+            return inode
+
+    def remove(self, inode):
+        """Desengancha el inodo y su subárbol; los hijos se conservan para poder reinsertarlo con add()."""
+        with self.lock:
+            parent = self.inodes.get(inode.parent_id)
+            if parent is not None and parent.children.get(inode.name) is inode:
+                del parent.children[inode.name]
+            for node in self.walk(inode):
+                self.inodes.pop(node.id, None)
+
+    def list_children(self, inode):
+        with self.lock:
+            return [child.to_listing() for child in inode.children.values() if child.visible()]
+
+    # --- Cambios dentro de una transacción ---
+    def stage_add(self, inode):
+        inode.staged_by = get_ident()
+        return self.add(inode)
+
+    def publish_add(self, inode):
+        inode.staged_by = None
+
+    def discard_add(self, inode):
+        self.remove(inode)
+
+    def stage_remove(self, inode):
+        inode.removed_by = get_ident()
+
+    def publish_remove(self, inode):
+        self.remove(inode)
+        inode.removed_by = None
+
+    def discard_remove(self, inode):
+        with self.lock:
+            inode.removed_by = None
+            self.add(inode) # Por si un alta revertida del mismo nombre lo había desplazado
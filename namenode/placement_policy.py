@@ -0,0 +1,156 @@
+# namenode/placement_policy.py
+import random
+import threading
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common import config
+
+CANDIDATE_ATTEMPTS = 8 # Muestras aleatorias antes de recurrir a un recorrido lineal
+
+
+class _NodeLoad:
+    """Último estado informado por un DataNode más lo asignado desde entonces."""
+    __slots__ = ('capacity', 'used', 'active_transfers', 'pending_bytes', 'pending_writes')
+
+    def __init__(self):
+        self.capacity = 0 # 0 = desconocido (aún sin heartbeat con estadísticas)
+        self.used = 0
+        self.active_transfers = 0
+        self.pending_bytes = 0
+        self.pending_writes = 0
+
+
+class RandomPlacementPolicy:
+    """Comportamiento original: réplicas elegidas al azar entre los DataNodes activos."""
+
+    def update_node(self, node_id, stats):
+        pass
+
+    def start_file(self, active_nodes):
+        return _RandomFilePlacement(active_nodes)
+
+
+class _RandomFilePlacement:
+    def __init__(self, active_nodes):
+        self.active_nodes = active_nodes
+
+    def choose(self, block_size, count=None):
+        return random.sample(self.active_nodes, count or config.REPLICATION_FACTOR)
+
+
+class LoadAwarePlacementPolicy:
+    """Selección por "potencia de dos opciones" ponderada por ocupación, transferencias activas y reparto del archivo.
+
+    Por cada réplica se muestrean dos candidatos y se queda el de menor coste, así que el coste por bloque
+    es O(1) sin importar cuántos DataNodes haya. Lo asignado entre heartbeats se suma al estado informado
+    para que varias escrituras seguidas no elijan todas el mismo nodo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loads = {} # id de BD del DataNode -> _NodeLoad
+
+    def update_node(self, node_id, stats):
+        """Estadísticas del heartbeat: {'capacity', 'used', 'active_transfers'}. Sustituye a lo asignado antes."""
+        with self._lock:
+            load = self._load(node_id)
+            load.capacity = int(stats.get('capacity') or 0)
+            load.used = int(stats.get('used') or 0)
+            load.active_transfers = int(stats.get('active_transfers') or 0)
+            load.pending_bytes = 0
+            load.pending_writes = 0
+
+    def start_file(self, active_nodes):
+        return _LoadAwareFilePlacement(self, active_nodes)
+
+    def _load(self, node_id):
+        load = self._loads.get(node_id)
+        if load is None:
+            load = self._loads[node_id] = _NodeLoad()
+        return load
+
+    def _has_room(self, load, block_size):
+        if not load.capacity:
+            return True
+        return load.capacity - load.used - load.pending_bytes - block_size >= config.PLACEMENT_MIN_FREE_BYTES
+
+    def _cost(self, load, blocks_of_file):
+        utilization = (load.used + load.pending_bytes) / load.capacity if load.capacity else 0.5
+        return (utilization
+                + config.PLACEMENT_LOAD_WEIGHT * (load.active_transfers + load.pending_writes)
+                + config.PLACEMENT_SPREAD_WEIGHT * blocks_of_file)
+
+
+class _LoadAwareFilePlacement:
+    """Colocación de los bloques de un archivo; recuerda cuántos bloques lleva cada nodo para repartirlos."""
+
+    def __init__(self, policy, active_nodes):
+        self.policy = policy
+        self.active_nodes = active_nodes
+        self.blocks_per_node = {} # id de BD -> bloques de este archivo
+
+    def _eligible(self, node, chosen_ids, block_size):
+        return node['id'] not in chosen_ids and self.policy._has_room(self.policy._load(node['id']), block_size)
+
+    def _cost(self, node):
+        return self.policy._cost(self.policy._load(node['id']), self.blocks_per_node.get(node['id'], 0))
+
+    def _pick(self, chosen_ids, block_size):
+        nodes = self.active_nodes
+        fallback = None
+        if len(nodes) >= 2:
+            for _ in range(CANDIDATE_ATTEMPTS):
+                candidates = [n for n in random.sample(nodes, 2) if self._eligible(n, chosen_ids, block_size)]
+                if len(candidates) == 2:
+                    return min(candidates, key=self._cost)
+                if candidates and fallback is None:
+                    fallback = candidates[0]
+        if fallback is not None:
+            return fallback
+        # Clúster pequeño o casi lleno: recorrido lineal; si nadie tiene espacio, el menos costoso
+        candidates = [n for n in nodes if self._eligible(n, chosen_ids, block_size)] \
+            or [n for n in nodes if n['id'] not in chosen_ids]
+        return min(candidates, key=self._cost) if candidates else None
+
+    def choose(self, block_size, count=None):
+        """Devuelve `count` DataNodes distintos para un bloque; el primero recibe la escritura del cliente."""
+        count = count or config.REPLICATION_FACTOR
+        chosen = []
+        chosen_ids = set()
+        with self.policy._lock:
+            while len(chosen) < count:
+                node = self._pick(chosen_ids, block_size)
+                if node is None:
+                    raise ValueError(f"No hay DataNodes suficientes para {count} réplicas.")
+                chosen.append(node)
+                chosen_ids.add(node['id'])
+                load = self.policy._load(node['id'])
+                load.pending_bytes += block_size
+                load.pending_writes += 1
+                self.blocks_per_node[node['id']] = self.blocks_per_node.get(node['id'], 0) + 1
+            # Primario: el de menos transferencias en curso entre los elegidos
+            chosen.sort(key=lambda n: self.policy._load(n['id']).active_transfers)
+        return chosen
+
+
+POLICIES = {
+    'random': RandomPlacementPolicy,
+    'load_aware': LoadAwarePlacementPolicy,
+}
+
+_policy = None
+_policy_lock = threading.Lock()
+
+def get_placement_policy():
+    """Política configurada en PLACEMENT_POLICY, compartida por todo el NameNode."""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                policy_cls = POLICIES.get(config.PLACEMENT_POLICY)
+                if policy_cls is None:
+                    raise ValueError(f"Política de colocación desconocida: {config.PLACEMENT_POLICY}")
+                _policy = policy_cls()
+    return _policy
@@ -0,0 +1,200 @@
+# namenode/replication_manager.py
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from common import config
+
+logger = logging.getLogger(__name__)
+
+# Réplicas vivas y totales de cada bloque; solo se usa al reescanear (caída/vuelta de un DataNode o periódicamente)
+UNDER_REPLICATED_QUERY = """
+    SELECT b.block_id, b.size,
+           GROUP_CONCAT(CASE WHEN dn.is_active THEN dn.id END) AS live_ids,
+           GROUP_CONCAT(dn.id) AS all_ids
+    FROM blocks b
+    LEFT JOIN block_locations bl ON bl.block_id = b.block_id
+    LEFT JOIN datanodes dn ON dn.id = bl.datanode_id
+    WHERE b.block_id NOT IN (SELECT new_block_id FROM container_compactions) -- Aún se construyen en los DataNodes
+    GROUP BY b.block_id, b.size
+    HAVING COUNT(CASE WHEN dn.is_active THEN 1 END) < ?
+"""
+
+
+def _parse_ids(csv):
+    return {int(x) for x in csv.split(',')} if csv else set()
+
+
+class _PendingBlock:
+    __slots__ = ('block_id', 'size', 'live_ids', 'all_ids', 'first_seen')
+
+    def __init__(self, block_id, size, live_ids, all_ids, first_seen):
+        self.block_id = block_id
+        self.size = size
+        self.live_ids = live_ids
+        self.all_ids = all_ids
+        self.first_seen = first_seen
+
+
+class _Task:
+    __slots__ = ('pending', 'source_id', 'target_id', 'deadline')
+
+    def __init__(self, pending, source_id, target_id, deadline):
+        self.pending = pending
+        self.source_id = source_id
+        self.target_id = target_id
+        self.deadline = deadline
+
+
+class ReplicationScheduler:
+    """Cola de prioridad de bloques sub-replicados; las tareas se reparten en las respuestas de heartbeat.
+
+    Prioridad: menos réplicas vivas primero (un bloque con una sola réplica va antes que uno con dos).
+    Límites por DataNode: copias concurrentes (como origen y como destino) y bytes asignados por heartbeat.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = [] # (réplicas vivas, secuencia, block_id)
+        self._pending = {} # block_id -> _PendingBlock en cola
+        self._in_flight = {} # (block_id, target_id) -> _Task
+        self._first_seen = {} # block_id -> instante en que se detectó sub-replicado
+        self._seq = itertools.count()
+        self._dirty = True
+        self._last_scan = 0.0
+        self.stats = {"completed": 0, "failed": 0, "expired": 0, "lost_blocks": 0,
+                      "last_recovery_sec": None, "max_recovery_sec": 0.0, "total_recovery_sec": 0.0}
+
+    def mark_dirty(self):
+        """El conjunto de DataNodes activos cambió: reescanear en la próxima oportunidad."""
+        self._dirty = True
+
+    def needs_rescan(self):
+        return self._dirty or time.monotonic() - self._last_scan > config.REPLICATION_SCAN_INTERVAL_SEC
+
+    def rescan(self, conn):
+        rows = conn.execute(UNDER_REPLICATED_QUERY, (config.REPLICATION_FACTOR,)).fetchall()
+        now = time.monotonic()
+        with self._lock:
+            self._dirty = False
+            self._last_scan = now
+            busy = {block_id for block_id, _ in self._in_flight}
+            self._heap, self._pending = [], {}
+            lost = 0
+            for row in rows:
+                live_ids = _parse_ids(row['live_ids'])
+                if not live_ids:
+                    lost += 1 # Sin réplicas vivas no hay origen posible
+                    continue
+                block_id = row['block_id']
+                first_seen = self._first_seen.setdefault(block_id, now)
+                if block_id in busy:
+                    continue
+                self._push_locked(_PendingBlock(block_id, row['size'], live_ids, _parse_ids(row['all_ids']), first_seen))
+            # Bloques que ya no están sub-replicados (p. ej. el nodo volvió) dejan de contar
+            still_under = {row['block_id'] for row in rows}
+            self._first_seen = {b: t for b, t in self._first_seen.items() if b in still_under}
+            self.stats["lost_blocks"] = lost
+        if rows:
+            logger.info(f"Re-replicación: {len(self._pending)} bloques en cola, {lost} sin réplicas vivas.")
+
+    def _push_locked(self, pending):
+        self._pending[pending.block_id] = pending
+        heapq.heappush(self._heap, (len(pending.live_ids), next(self._seq), pending.block_id))
+
+    def _expire_locked(self, now):
+        for key, task in list(self._in_flight.items()):
+            if task.deadline < now:
+                del self._in_flight[key]
+                self.stats["expired"] += 1
+                self._push_locked(task.pending)
+
+    def _load_locked(self):
+        sources, targets = {}, {}
+        for task in self._in_flight.values():
+            sources[task.source_id] = sources.get(task.source_id, 0) + 1
+            targets[task.target_id] = targets.get(task.target_id, 0) + 1
+        return sources, targets
+
+    def assign_tasks(self, source_id, active_nodes):
+        """Tareas de copia para el DataNode `source_id` (id de BD) dentro de sus límites."""
+        now = time.monotonic()
+        nodes_by_id = {dn['id']: dn for dn in active_nodes}
+        tasks = []
+        with self._lock:
+            self._expire_locked(now)
+            sources, targets = self._load_locked()
+            slots = config.REPLICATION_MAX_STREAMS_PER_NODE - sources.get(source_id, 0)
+            budget = config.REPLICATION_MAX_BYTES_PER_HEARTBEAT
+            skipped = []
+            scanned = 0
+            while self._heap and slots > 0 and budget > 0 and scanned < config.REPLICATION_SCAN_LIMIT:
+                entry = heapq.heappop(self._heap)
+                scanned += 1
+                pending = self._pending.get(entry[2])
+                if pending is None or entry[0] != len(pending.live_ids):
+                    continue # Entrada obsoleta
+                if source_id not in pending.live_ids:
+                    skipped.append(entry)
+                    continue
+                candidates = [dn_id for dn_id in nodes_by_id if dn_id not in pending.all_ids
+                              and targets.get(dn_id, 0) < config.REPLICATION_MAX_STREAMS_PER_NODE]
+                if not candidates:
+                    skipped.append(entry)
+                    continue
+                least_loaded = min(targets.get(dn_id, 0) for dn_id in candidates)
+                target_id = random.choice([dn_id for dn_id in candidates if targets.get(dn_id, 0) == least_loaded])
+                del self._pending[pending.block_id]
+                self._in_flight[(pending.block_id, target_id)] = _Task(
+                    pending, source_id, target_id, now + config.REPLICATION_TASK_TIMEOUT_SEC)
+                targets[target_id] = targets.get(target_id, 0) + 1
+                slots -= 1
+                budget -= pending.size
+                tasks.append({"block_id": pending.block_id,
+                              "target_datanode_id": target_id,
+                              "target_grpc_address": nodes_by_id[target_id]['grpc_address']})
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+        return tasks
+
+    def complete(self, block_id, target_id, success):
+        """Procesa el resultado informado por el DataNode origen. Devuelve True si hay que registrar la réplica."""
+        now = time.monotonic()
+        with self._lock:
+            task = self._in_flight.pop((block_id, target_id), None)
+            if task is None:
+                return success # Tarea ya expirada: igualmente registrar una copia exitosa
+            pending = task.pending
+            if not success:
+                self.stats["failed"] += 1
+                self._push_locked(pending)
+                return False
+            self.stats["completed"] += 1
+            pending.live_ids.add(target_id)
+            pending.all_ids.add(target_id)
+            if len(pending.live_ids) < config.REPLICATION_FACTOR:
+                self._push_locked(pending)
+            else:
+                recovery = now - pending.first_seen
+                self._first_seen.pop(block_id, None)
+                self.stats["last_recovery_sec"] = recovery
+                self.stats["max_recovery_sec"] = max(self.stats["max_recovery_sec"], recovery)
+                self.stats["total_recovery_sec"] += recovery
+            return True
+
+    def status(self, num_active_nodes):
+        with self._lock:
+            queued_bytes = sum(p.size for p in self._pending.values())
+            recovered = self.stats["completed"]
+            status = dict(self.stats, queued=len(self._pending), in_flight=len(self._in_flight), queued_bytes=queued_bytes)
+        status["mean_recovery_sec"] = status.pop("total_recovery_sec") / recovered if recovered else None
+        # Cota del tiempo de drenado con los límites actuales: cada nodo copia como mucho el presupuesto por heartbeat
+        per_interval = max(1, num_active_nodes) * config.REPLICATION_MAX_BYTES_PER_HEARTBEAT
+        status["estimated_drain_sec"] = -(-queued_bytes // per_interval) * config.HEARTBEAT_INTERVAL_SEC
+        return status
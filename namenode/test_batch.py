@@ -0,0 +1,87 @@
+# namenode/test_batch.py
+"""Lotes de /batch: SAVEPOINT por operación, o todo-o-nada con atomic=True (BD y árbol en memoria)."""
+import pytest
+
+from metadata_writer import MetadataWriter
+
+
+def _exists_in_db(metadata, name):
+    with metadata.get_pool().connection() as conn:
+        return conn.execute("SELECT 1 FROM fs_objects WHERE name = ?", (name,)).fetchone() is not None
+
+
+@pytest.fixture(params=['direct', 'writer'])
+def run_batch(request, metadata):
+    """execute_batch llamado directamente o a través del hilo escritor (group commit, como en el servidor)."""
+    if request.param == 'direct':
+        yield metadata.execute_batch
+        return
+    writer = MetadataWriter(metadata.get_pool).start()
+    yield lambda *args, **kwargs: writer.call(metadata.execute_batch, *args, **kwargs)
+    writer.stop()
+
+
+def test_non_atomic_batch_keeps_successful_operations(metadata, run_batch):
+    results, message, _ = run_batch([
+        {'op': 'mkdir', 'path': '/a'},
+        {'op': 'mkdir', 'path': '/missing/x'},
+        {'op': 'mkdir', 'path': '/a/b'},
+        {'op': 'rename', 'path': '/a'},
+    ])
+    assert message == "Lote ejecutado."
+    assert [r['success'] for r in results] == [True, False, True, False]
+    assert "Operación no soportada" in results[3]['error']
+    tree = metadata.get_namespace()
+    assert tree.lookup('/a/b') is not None and tree.lookup('/missing') is None
+    assert _exists_in_db(metadata, 'a') and _exists_in_db(metadata, 'b')
+
+
+def test_failing_atomic_batch_reverts_earlier_operations(metadata, run_batch):
+    metadata.create_directory('/keep')
+    results, message, deleted = run_batch([
+        {'op': 'mkdir', 'path': '/a'},
+        {'op': 'rmdir', 'path': '/keep'},
+        {'op': 'rm', 'path': '/does-not-exist'},
+        {'op': 'mkdir', 'path': '/never-run'},
+    ], atomic=True)
+    assert message == "Lote revertido." and deleted == []
+    assert len(results) == 3 # Se detiene en el primer fallo
+    for result in results[:2]:
+        assert not result['success'] and result['error'] == "Revertido: otra operación del lote falló."
+        assert 'message' not in result
+    assert results[2]['error'] == "Objeto no encontrado."
+    tree = metadata.get_namespace()
+    assert tree.lookup('/a') is None and not _exists_in_db(metadata, 'a')
+    assert tree.lookup('/keep') is not None and _exists_in_db(metadata, 'keep')
+    assert not _exists_in_db(metadata, 'never-run')
+
+
+def test_successful_atomic_batch_commits_everything(metadata, datanodes, run_batch):
+    metadata.create_directory('/d')
+    metadata.initiate_file_put('/d/f', 2 * metadata.config.BLOCK_SIZE_BYTES + 1)
+    results, message, deleted = run_batch([
+        {'op': 'mkdir', 'path': '/e'},
+        {'op': 'rm', 'path': '/d', 'recursive': True},
+        {'op': 'ls', 'path': '/'},
+    ], atomic=True)
+    assert message == "Lote ejecutado." and all(r['success'] for r in results)
+    assert len(deleted) == 3 # Los bloques de /d/f, encolados para los DataNodes
+    assert [item['name'] for item in results[2]['contents']] == ['e']
+    tree = metadata.get_namespace()
+    assert tree.lookup('/d') is None and tree.lookup('/e') is not None
+
+
+def test_read_only_batch(metadata, datanodes):
+    metadata.create_directory('/a')
+    metadata.initiate_file_put('/a/f', 10)
+    operations = [{'op': 'ls', 'path': '/a'}, {'op': 'get', 'path': '/a/f'}, {'op': 'get', 'path': '/a/none'}]
+    assert metadata.is_read_only_batch(operations)
+    results, _, _ = metadata.execute_batch(operations)
+    assert [r['success'] for r in results] == [True, True, False]
+    assert results[1]['data']['total_size'] == 10
+
+
+def test_batch_size_limit(metadata, monkeypatch):
+    monkeypatch.setattr(metadata.config, 'BATCH_MAX_OPERATIONS', 2)
+    results, message, _ = metadata.execute_batch([{'op': 'ls', 'path': '/'}] * 3)
+    assert results is None and "máximo" in message
@@ -0,0 +1,52 @@
+# namenode/test_block_report.py
+"""Reconciliación de reportes completos de bloques frente a escrituras todavía en vuelo."""
+from common import config
+
+
+def _locations(metadata, node_id):
+    with metadata.get_pool().connection() as conn:
+        rows = conn.execute("SELECT block_id FROM block_locations WHERE datanode_id = ?", (node_id,)).fetchall()
+    return {row['block_id'] for row in rows}
+
+
+def _primary(info):
+    return info['block_assignments'][0]
+
+
+def test_full_report_keeps_locations_of_recent_writes(metadata, datanodes, monkeypatch):
+    monkeypatch.setattr(config, 'WRITE_IN_FLIGHT_GRACE_SEC', 3600)
+    monkeypatch.setattr(config, 'SMALL_FILE_THRESHOLD_BYTES', 128 * 1024)
+    info, _ = metadata.initiate_file_put('/f', 10) # Registro empaquetado en un contenedor recién abierto
+    info2, _ = metadata.initiate_file_put('/g', config.BLOCK_SIZE_BYTES + 1)
+    for datanode_id, node_id in datanodes.items():
+        before = _locations(metadata, node_id)
+        ok, _, orphans = metadata.process_full_block_report(datanode_id, []) # Aún no recibió nada
+        assert ok and orphans == []
+        assert _locations(metadata, node_id) == before
+    assert any(_primary(info)['block_id'] in _locations(metadata, n) for n in datanodes.values())
+    assert any(_primary(info2)['block_id'] in _locations(metadata, n) for n in datanodes.values())
+
+
+def test_full_report_drops_missing_blocks_after_grace(metadata, datanodes, monkeypatch):
+    metadata.initiate_file_put('/g', 2 * config.BLOCK_SIZE_BYTES)
+    monkeypatch.setattr(config, 'WRITE_IN_FLIGHT_GRACE_SEC', -60) # La escritura ya no cuenta como reciente
+    for datanode_id, node_id in datanodes.items():
+        held = _locations(metadata, node_id)
+        kept = sorted(held)[:1]
+        ok, _, orphans = metadata.process_full_block_report(datanode_id, kept + ['99999_0'])
+        assert ok and orphans == ['99999_0'] # Sin metadatos: el DataNode debe borrarlo
+        assert _locations(metadata, node_id) == set(kept)
+
+
+def test_under_replicated_blocks_drop_their_secondary_location(metadata, datanodes):
+    info, _ = metadata.initiate_file_put('/g', 2 * config.BLOCK_SIZE_BYTES)
+    first, second = info['block_assignments']
+    removed, _ = metadata.report_under_replicated_blocks(info['file_id'], [first['block_id'], '99999_0'])
+    assert removed == 1 # El bloque ajeno se ignora
+    with metadata.get_pool().connection() as conn:
+        rows = conn.execute("SELECT block_id, is_primary FROM block_locations").fetchall()
+    locations = {}
+    for row in rows:
+        locations.setdefault(row['block_id'], []).append(bool(row['is_primary']))
+    assert locations[first['block_id']] == [True] # Solo el primario: la re-replicación lo recoge
+    assert sorted(locations[second['block_id']]) == [False, True]
@@ -0,0 +1,169 @@
+# namenode/test_containers.py
+"""Archivos pequeños empaquetados en contenedores: offsets, lecturas, borrado y ciclo de compactación."""
+import json
+import threading
+
+import pytest
+
+from common import config
+from common.container_format import RECORD_HEADER, is_container, record_length
+
+FILE_SIZE = 100
+RECORD = record_length(FILE_SIZE)
+
+
+@pytest.fixture
+def packing(metadata, datanodes, monkeypatch):
+    monkeypatch.setattr(config, 'SMALL_FILE_THRESHOLD_BYTES', 128 * 1024) # Modo de archivos pequeños activado
+    monkeypatch.setattr(config, 'CONTAINER_MAX_OPEN', 1) # Todos los registros van al mismo contenedor
+    monkeypatch.setattr(config, 'WRITE_IN_FLIGHT_GRACE_SEC', -60) # Ninguna escritura queda en vuelo
+    return metadata
+
+
+def _put_small(metadata, path, size=FILE_SIZE):
+    info, message = metadata.initiate_file_put(path, size)
+    assert info, message
+    (assignment,) = info['block_assignments']
+    return info['file_id'], assignment
+
+
+def _container(metadata, block_id):
+    with metadata.get_pool().connection() as conn:
+        return conn.execute("""
+            SELECT c.live_bytes, c.sealed, b.size FROM containers c JOIN blocks b ON b.block_id = c.block_id
+            WHERE c.block_id = ?""", (block_id,)).fetchone()
+
+
+def _holders(metadata, block_id):
+    with metadata.get_pool().connection() as conn:
+        rows = conn.execute("""
+            SELECT dn.datanode_id FROM block_locations bl JOIN datanodes dn ON dn.id = bl.datanode_id
+            WHERE bl.block_id = ?""", (block_id,)).fetchall()
+    return [row['datanode_id'] for row in rows]
+
+
+def _addresses(assignment):
+    return [a for a in (assignment['primary_datanode_grpc'], assignment['secondary_datanode_grpc']) if a]
+
+
+def test_packing_is_off_by_default(metadata, datanodes):
+    info, _ = metadata.initiate_file_put('/f', FILE_SIZE)
+    (assignment,) = info['block_assignments']
+    assert not is_container(assignment['block_id']) and 'container_offset' not in assignment
+
+
+def test_small_files_are_packed_at_consecutive_offsets(packing):
+    assignments = [_put_small(packing, f"/f{i}")[1] for i in range(4)]
+    container_id = assignments[0]['block_id']
+    assert is_container(container_id)
+    assert {a['block_id'] for a in assignments} == {container_id}
+    assert [a['container_offset'] for a in assignments] == [i * RECORD for i in range(4)]
+    assert RECORD == RECORD_HEADER.size + FILE_SIZE
+    row = _container(packing, container_id)
+    assert row['size'] == row['live_bytes'] == 4 * RECORD and not row['sealed']
+    assert len(_holders(packing, container_id)) == config.REPLICATION_FACTOR
+
+
+def test_large_and_empty_files_are_not_packed(packing):
+    info, _ = packing.initiate_file_put('/big', config.SMALL_FILE_THRESHOLD_BYTES + 1)
+    assert not any(is_container(a['block_id']) for a in info['block_assignments'])
+    info, _ = packing.initiate_file_put('/empty', 0)
+    assert info['block_assignments'] == []
+
+
+def test_read_info_points_into_the_container(packing):
+    _put_small(packing, '/a')
+    file_id, assignment = _put_small(packing, '/b', 50)
+    info, _ = packing.get_file_info_for_read('/b')
+    (block,) = info['blocks']
+    assert block['block_id'] == assignment['block_id']
+    assert block['container_offset'] == RECORD and block['size'] == 50 and block['file_id'] == file_id
+    assert sorted(block['datanode_grpc_addresses']) == sorted(_addresses(assignment))
+
+
+def test_deleting_a_packed_file_releases_its_record_only(packing):
+    _, assignment = _put_small(packing, '/a')
+    _put_small(packing, '/b')
+    container_id = assignment['block_id']
+    success, _, block_ids = packing.remove_object('/a')
+    assert success and block_ids == [] # El contenedor es compartido: no se borra ningún bloque
+    row = _container(packing, container_id)
+    assert row['live_bytes'] == RECORD and row['size'] == 2 * RECORD
+    with packing.get_pool().connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM pending_deletions").fetchone()[0] == 0
+    assert packing.get_file_info_for_read('/b')[0]['blocks'][0]['container_offset'] == RECORD
+
+
+def test_full_compaction_cycle(packing):
+    ids = {}
+    for name in 'abcd':
+        ids[name], assignment = _put_small(packing, f"/{name}")
+    old_id = assignment['block_id']
+    packing.remove_object('/a')
+    packing.remove_object('/c')
+
+    summary, _ = packing.compact_containers() # Mitad muerta: se sella y se planifica
+    assert summary['containers_sealed'] == 1 and summary['compactions_planned'] == 1
+    with packing.get_pool().connection() as conn:
+        compaction = conn.execute("SELECT new_block_id, layout FROM container_compactions WHERE old_block_id = ?", (old_id,)).fetchone()
+    new_id = compaction['new_block_id']
+    assert json.loads(compaction['layout']) == [[RECORD, RECORD], [3 * RECORD, RECORD]] # /b y /d
+
+    # Cada réplica recibe la tarea en su heartbeat; mientras no reporte el contenedor nuevo, no se cierra
+    holders = _holders(packing, old_id)
+    for datanode_id in holders:
+        _, _, tasks = packing.datanode_heartbeat(datanode_id)
+        assert tasks['compaction_tasks'] == [{"container_id": old_id, "new_container_id": new_id, "records": json.loads(compaction['layout'])}]
+    assert packing.compact_containers()[0]['compactions_finished'] == 0
+    assert packing.get_file_info_for_read('/d')[0]['blocks'][0]['block_id'] == old_id
+
+    for datanode_id in holders:
+        packing.datanode_heartbeat(datanode_id, block_report={'added': [new_id]})
+    assert packing.compact_containers()[0]['compactions_finished'] == 1
+
+    for name, offset in (('b', 0), ('d', RECORD)):
+        (block,) = packing.get_file_info_for_read(f"/{name}")[0]['blocks']
+        assert (block['block_id'], block['container_offset'], block['file_id']) == (new_id, offset, ids[name])
+    assert _container(packing, old_id) is None
+    row = _container(packing, new_id)
+    assert row['live_bytes'] == row['size'] == 2 * RECORD and row['sealed']
+    with packing.get_pool().connection() as conn:
+        queued = {row['block_id'] for row in conn.execute("SELECT block_id FROM pending_deletions")}
+    assert queued == {old_id} # El viejo se borra físicamente vía heartbeats
+
+
+def test_empty_container_is_deleted(packing):
+    _, assignment = _put_small(packing, '/a')
+    packing.remove_object('/a')
+    summary, _ = packing.compact_containers()
+    assert summary['containers_sealed'] == 1 and summary['empty_containers_deleted'] == 1
+    assert _container(packing, assignment['block_id']) is None
+
+
+def test_containers_with_writes_in_flight_are_left_alone(packing, monkeypatch):
+    monkeypatch.setattr(config, 'WRITE_IN_FLIGHT_GRACE_SEC', 3600)
+    _, assignment = _put_small(packing, '/a')
+    _put_small(packing, '/b')
+    packing.remove_object('/a')
+    summary, _ = packing.compact_containers()
+    assert summary['containers_sealed'] == 0 and summary['compactions_planned'] == 0
+    assert not _container(packing, assignment['block_id'])['sealed'] # Sigue aceptando registros
+
+
+def test_concurrent_read_only_heartbeats_hand_out_a_compaction_once(packing):
+    for name in 'ab':
+        _, assignment = _put_small(packing, f"/{name}")
+    packing.remove_object('/a')
+    assert packing.compact_containers()[0]['compactions_planned'] == 1
+    holder = _holders(packing, assignment['block_id'])[0]
+    barrier, handed_out = threading.Barrier(8), []
+    def heartbeat():
+        barrier.wait()
+        result = packing.datanode_heartbeat(holder, read_only=True)
+        handed_out.extend(result[2]['compaction_tasks'])
+    threads = [threading.Thread(target=heartbeat) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(handed_out) == 1
@@ -0,0 +1,38 @@
+# namenode/test_liveness.py
+"""La tabla de vida en memoria solo refleja registros de DataNodes ya confirmados en SQLite."""
+import pytest
+
+
+class _Abort(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def loaded_liveness(metadata):
+    metadata.expire_datanodes() # Como al arrancar el servidor: la tabla se carga fuera de cualquier lote
+
+
+def test_rolled_back_registration_is_not_live(metadata):
+    with pytest.raises(_Abort):
+        with metadata.get_pool().transaction():
+            node, _ = metadata.register_datanode('dn9', '127.0.0.1:50099', 'http://127.0.0.1:5099')
+            assert node is not None
+            raise _Abort()
+    assert metadata.get_liveness().get('dn9') is None
+    assert metadata.get_active_datanodes() == []
+
+
+def test_registration_is_published_on_commit(metadata):
+    with metadata.get_pool().transaction():
+        node, _ = metadata.register_datanode('dn9', '127.0.0.1:50099', 'http://127.0.0.1:5099')
+        assert metadata.get_liveness().get('dn9') is None # Aún sin confirmar
+    state = metadata.get_liveness().get('dn9')
+    assert state.id == node['id'] and state.active
+    assert [dn['datanode_id'] for dn in metadata.get_active_datanodes()] == ['dn9']
+
+
+def test_heartbeat_registers_a_new_node_inside_a_batch(metadata):
+    with metadata.get_pool().transaction():
+        success, _, tasks = metadata.datanode_heartbeat('dn9', grpc_address='127.0.0.1:50099', flask_address='http://127.0.0.1:5099')
+        assert success and tasks['full_block_report_required']
+    assert metadata.get_liveness().get('dn9').active
@@ -0,0 +1,126 @@
+# namenode/test_namespace_tree.py
+"""El árbol en memoria debe coincidir siempre con fs_objects: tras cada mutación, rollback o recarga."""
+import threading
+
+import pytest
+
+from namespace_tree import NamespaceTree, SYSTEM_PARENT_ID
+
+
+class _Abort(Exception):
+    pass
+
+
+def _db_paths(metadata):
+    """Rutas de todos los objetos del espacio de nombres según SQLite."""
+    with metadata.get_pool().connection() as conn:
+        rows = conn.execute("SELECT id, parent_id, name FROM fs_objects").fetchall()
+    by_id = {row['id']: row for row in rows}
+    paths = {}
+    for row in rows:
+        parts, node = [], row
+        while node['parent_id'] is not None:
+            if node['parent_id'] == SYSTEM_PARENT_ID:
+                parts = None # Fuera del árbol (dueño de los contenedores)
+                break
+            parts.append(node['name'])
+            node = by_id[node['parent_id']]
+        if parts is not None:
+            paths['/' + '/'.join(reversed(parts))] = row['id']
+    return paths
+
+
+def _tree_paths(tree):
+    paths = {}
+    stack = [('/', tree.root)]
+    while stack:
+        path, node = stack.pop()
+        paths[path] = node.id
+        if node.is_directory:
+            for name in tree.list_children(node):
+                child = tree.child(node, name['name'])
+                stack.append((path.rstrip('/') + '/' + name['name'], child))
+    return paths
+
+
+def _assert_consistent(metadata):
+    assert _tree_paths(metadata.get_namespace()) == _db_paths(metadata)
+
+
+def test_mkdir_lookup_and_list(metadata):
+    obj, _ = metadata.create_directory('/a')
+    metadata.create_directory('/a/b')
+    tree = metadata.get_namespace()
+    assert tree.lookup('/a') is obj
+    assert tree.lookup('/a/b')['is_directory']
+    assert tree.lookup('/a/c') is None
+    items, _ = metadata.list_directory('/a')
+    assert [item['name'] for item in items] == ['b']
+    assert metadata.create_directory('/a')[0] is None # Ya existe
+    assert metadata.create_directory('/x/y')[0] is None # Padre inexistente
+    _assert_consistent(metadata)
+
+
+def test_rolled_back_mkdir_rm_and_put_restore_tree(metadata, datanodes):
+    metadata.create_directory('/keep')
+    metadata.initiate_file_put('/keep/f', 10)
+    pool = metadata.get_pool()
+    with pytest.raises(_Abort):
+        with pool.transaction():
+            assert metadata.create_directory('/new')[0] is not None
+            assert metadata.remove_object('/keep', recursive=True)[0]
+            assert metadata.initiate_file_put('/g', 2000)[0] is not None
+            tree = metadata.get_namespace()
+            assert tree.lookup('/new') and tree.lookup('/g') and tree.lookup('/keep') is None
+            raise _Abort()
+    tree = metadata.get_namespace()
+    assert tree.lookup('/new') is None and tree.lookup('/g') is None
+    assert tree.lookup('/keep/f') is not None
+    _assert_consistent(metadata)
+
+
+def test_rolled_back_rm_then_mkdir_of_same_name(metadata):
+    original, _ = metadata.create_directory('/a')
+    with pytest.raises(_Abort):
+        with metadata.get_pool().transaction():
+            metadata.remove_object('/a')
+            replacement, _ = metadata.create_directory('/a')
+            assert metadata.get_namespace().lookup('/a') is replacement
+            raise _Abort()
+    assert metadata.get_namespace().lookup('/a') is original
+    _assert_consistent(metadata)
+
+
+def test_uncommitted_changes_are_invisible_to_other_threads(metadata):
+    metadata.create_directory('/old')
+    tree = metadata.get_namespace()
+    staged, seen = threading.Event(), {}
+    def reader():
+        staged.wait()
+        seen['new'] = tree.lookup('/new')
+        seen['old'] = tree.lookup('/old')
+        seen['listing'] = sorted(item['name'] for item in tree.list_children(tree.root))
+    thread = threading.Thread(target=reader)
+    thread.start()
+    with metadata.get_pool().transaction():
+        metadata.create_directory('/new')
+        metadata.remove_object('/old')
+        staged.set()
+        thread.join()
+    assert seen['new'] is None and seen['old'] is not None and seen['listing'] == ['old']
+    assert tree.lookup('/new') is not None and tree.lookup('/old') is None
+
+
+def test_load_rebuilds_the_same_tree(metadata, datanodes, monkeypatch):
+    monkeypatch.setattr(metadata.config, 'SMALL_FILE_THRESHOLD_BYTES', 128 * 1024)
+    metadata.create_directory('/a')
+    metadata.create_directory('/a/b')
+    metadata.create_directory('/c')
+    metadata.initiate_file_put('/a/b/f', 3000)
+    metadata.initiate_file_put('/a/small', 10) # Empaquetado: su contenedor queda fuera del árbol
+    metadata.remove_object('/c')
+    with metadata.get_pool().connection() as conn:
+        reloaded = NamespaceTree.load(conn)
+    assert _tree_paths(reloaded) == _tree_paths(metadata.get_namespace())
+    assert reloaded.lookup('/a/b/f')['size'] == 3000
+    _assert_consistent(metadata)